@@ -0,0 +1,144 @@
+# asyncio API
+from __future__ import absolute_import
+import asyncio
+import functools
+import logging
+import os
+
+from . import client
+from .bless_aws import BlessAWS
+
+
+async def run(func, *args, executor=None, **kwargs):
+    """ Run func(*args, **kwargs) on executor
+    Args:
+        executor (concurrent.futures.Executor): None for the loop's default executor
+    Returns: what func returns
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def run_until_complete(coro):
+    """ Run coro on a new event loop, and close it. Like asyncio.run, which needs python 3.7.
+    Returns: what coro returns
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def bless(region, hostname, bless_config, username=None, identity_file=None, aws=None, bless_cache=None,
+                nocache=False, refresh_margin=0, executor=None):
+    """ Get a certificate from the BLESS Lambda in region, unless the current one is fresh
+    Args:
+        region (str): the AWS region
+        hostname (str): the host being connected to
+        bless_config (BlessConfig): Loaded BlessConfig
+        username (str): the bastion user, looked up from IAM if None
+        identity_file (str): the identity file, ~/.ssh/blessid if None
+        aws (BlessAWS): AWS clients to reuse, if any
+        bless_cache (BlessCache): bless cache to reuse, if any
+        nocache (bool): get a new cert even if the current one is fresh
+        refresh_margin (int): also renew a cert that expires within this many seconds
+        executor (concurrent.futures.Executor): where the blocking calls run
+    Returns (dict): the username the certificate is for
+    Raises: LambdaInvocationException if the Lambda didn't return a cert, Exception if the
+        AWS session isn't working
+    """
+    aws = aws or BlessAWS()
+    bless_cache = bless_cache or client.get_bless_cache(nocache, bless_config)
+    bless_lambda_config = bless_config.get_lambda_config()
+    user_ip = client.get_user_ip(bless_config, bless_cache)
+    identity_file = identity_file or os.path.expanduser('~/.ssh/blessid')
+    cert_file = identity_file + '-cert.pub'
+    cert_mtime = client.get_mtime(cert_file)
+
+    async def get_username():
+        return username or await run(client.get_username, aws, bless_cache, executor=executor)
+
+    with bless_cache.coalesce():
+        if nocache is not True and not client.is_cert_expired(cert_file, bless_lambda_config, refresh_margin):
+            my_ip, username = await asyncio.gather(
+                run(user_ip.getIP, executor=executor), get_username())
+            ip_list = client.get_cached_ip_list(region, hostname, my_ip, bless_config, bless_cache)
+            if ip_list is not None and await run(
+                    client.check_fresh_cert, cert_file, bless_lambda_config, bless_cache, user_ip, ip_list,
+                    refresh_margin, executor=executor):
+                logging.debug("Already have fresh cert")
+                return {"username": username}
+
+        client_config = bless_config.get_client_config()
+        if not client_config['use_env_creds']:
+            raise Exception('AWS session not working. Check blessclient.cfg and verify the aws session?')
+        kmsauth_config = client.get_kmsauth_config(region, bless_config)
+        creds = client.get_env_creds(client_config)
+
+        async def get_ip_list():
+            my_ip = await run(user_ip.getIP, executor=executor)
+            ip, ip_list = await run(
+                client.get_ip_list, region, hostname, my_ip, creds, aws, bless_config, bless_cache, executor=executor)
+            return my_ip, ip, ip_list
+
+        async def get_user_creds():
+            name = await get_username()
+            # The role is assumed after get_username, which caches the user's arn for it
+            kmsauth_token, role_creds = await asyncio.gather(
+                run(client.env_creds_task(client.get_kmsauth_token), None, kmsauth_config, name, bless_cache,
+                    client.get_native_creds(None, bless_config), executor=executor),
+                run(client.env_creds_task(client.get_blessrole_credentials), aws, creds, bless_config, bless_cache,
+                    executor=executor))
+            return name, kmsauth_token, role_creds
+
+        (my_ip, ip, ip_list), (username, kmsauth_token, role_creds) = await asyncio.gather(
+            get_ip_list(), get_user_creds())
+
+        if role_creds is None or kmsauth_token is None:
+            raise Exception('AWS session not working. Check blessclient.cfg and verify the aws session?')
+
+        if nocache is not True and await run(
+                client.check_fresh_cert, cert_file, bless_lambda_config, bless_cache, user_ip, ip_list,
+                refresh_margin, executor=executor):
+            logging.debug("Already have fresh cert")
+            return {"username": username}
+
+        await run(
+            client.issue_cert_once, bless_config, bless_cache, role_creds, kmsauth_token, kmsauth_config, region,
+            username, identity_file, my_ip, ip, ip_list, hostname, nocache, cert_mtime, user_ip, refresh_margin,
+            executor=executor)
+    return {"username": username}
+
+
+async def vault_bless(nocache, bless_config, config_filename=None, executor=None):
+    """ client.vault_bless() on executor. Vault asks for the user's credentials on the
+    terminal when it has no cached token.
+    """
+    await run(client.vault_bless, nocache, bless_config, config_filename, executor=executor)
+
+
+async def get_cert(start_region, hostname, bless_config, username=None, identity_file=None, aws=None,
+                   bless_cache=None, nocache=False, refresh_margin=0, config_filename=None, executor=None):
+    """ Get a certificate from the configured ca_backend, trying the alternate regions
+    when the Lambda in start_region fails
+    Args:
+        start_region (str): the AWS region code to try first
+        config_filename (str): the config file bless_config was loaded from, None for the default
+        See bless() for the rest
+    Returns (dict): output of bless() ({} for hashicorp-vault), or None if no region could sign the key
+    """
+    if bless_config.get('BLESS_CONFIG')['ca_backend'].lower() == 'hashicorp-vault':
+        await vault_bless(nocache, bless_config, config_filename, executor)
+        return {}
+    aws = aws or BlessAWS()
+    for region in client.get_regions(start_region, bless_config):
+        try:
+            return await bless(region, hostname, bless_config, username, identity_file, aws, bless_cache,
+                               nocache, refresh_margin, executor)
+        except Exception as e:
+            if not client.is_region_error(e):
+                raise
+            logging.info(
+                'Lambda execution error: {}. Trying again in the alternate region.'.format(str(e)))
+    return None
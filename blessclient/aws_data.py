@@ -0,0 +1,186 @@
+# Trimmed botocore data for the AWS services blessclient calls
+from __future__ import absolute_import
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+
+# Services used by blessclient: sts/iam/lambda directly, kms through kmsauth and s3
+# for download_config_from_s3
+SERVICES = ('iam', 'kms', 'lambda', 's3', 'sts')
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'botocore_data')
+MANIFEST_FILE = 'blessclient-manifest.json'
+SKIPPED_PREFIXES = ('examples-',)
+
+_default_session_ready = False
+# Creating clients from one boto3 session isn't thread safe
+_client_lock = threading.Lock()
+
+
+def get_bundle_dir():
+    """ Returns (str): the data directory, BLESS_BOTOCORE_DATA or the packaged one """
+    return os.getenv('BLESS_BOTOCORE_DATA', BUNDLE_DIR)
+
+
+def is_bundle_usable(data_dir):
+    """ Check data_dir was built for the installed botocore
+    Args:
+        data_dir (str): the trimmed data directory
+    Returns (bool):
+    """
+    import botocore
+
+    try:
+        with open(os.path.join(data_dir, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    if manifest.get('botocore_version') != botocore.__version__:
+        logging.debug('Ignoring botocore data in {}, built for botocore {}'.format(
+            data_dir, manifest.get('botocore_version')))
+        return False
+    return True
+
+
+def create_botocore_session(data_dir=None):
+    """ Create a botocore session that loads its data from data_dir only,
+    or a regular session if data_dir isn't usable
+    Args:
+        data_dir (str): the trimmed data directory, defaults to get_bundle_dir()
+    """
+    import botocore.session
+    from botocore.loaders import Loader
+
+    data_dir = data_dir or get_bundle_dir()
+    session = botocore.session.get_session()
+    if is_bundle_usable(data_dir):
+        logging.debug('Using trimmed botocore data from {}'.format(data_dir))
+        session.register_component(
+            'data_loader',
+            Loader(extra_search_paths=[data_dir], include_default_search_paths=False))
+    return session
+
+
+def setup_default_session():
+    """ Make boto3's default session use the trimmed data, once per process """
+    global _default_session_ready
+    if _default_session_ready:
+        return
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session(botocore_session=create_botocore_session())
+    _default_session_ready = True
+
+
+def reset_default_session():
+    """ Drop boto3's default session, so the next client resolves credentials again """
+    global _default_session_ready
+    if 'boto3' in sys.modules:
+        sys.modules['boto3'].DEFAULT_SESSION = None
+    _default_session_ready = False
+
+
+def boto3_client(*args, **kwargs):
+    """ boto3.client, from a default session using the trimmed data """
+    import boto3
+
+    with _client_lock:
+        setup_default_session()
+        return boto3.client(*args, **kwargs)
+
+
+def _load_json(path):
+    """ Load path + '.json' or path + '.json.gz', whichever botocore shipped """
+    if os.path.isfile(path + '.json'):
+        with open(path + '.json', 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    with gzip.open(path + '.json.gz', 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+def _strip_documentation(data):
+    if isinstance(data, dict):
+        return dict(
+            (key, _strip_documentation(value)) for key, value in data.items()
+            if not (key == 'documentation' and not isinstance(value, dict)))
+    if isinstance(data, list):
+        return [_strip_documentation(value) for value in data]
+    return data
+
+
+def _data_files(directory):
+    """ Names (without .json/.json.gz) of the data files in directory """
+    names = set()
+    for filename in os.listdir(directory):
+        for ext in ('.json', '.json.gz'):
+            if filename.endswith(ext) and os.path.isfile(os.path.join(directory, filename)):
+                names.add(filename[:-len(ext)])
+    return sorted(names)
+
+
+def _dump_json(data, path):
+    with open(path + '.json', 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def build_bundle(dest, services=SERVICES):
+    """ Build the trimmed data directory from the installed botocore
+    Args:
+        dest (str): directory to build, replaced if it exists
+        services (tuple): botocore service names to include
+    """
+    import botocore
+
+    source = os.path.join(os.path.dirname(botocore.__file__), 'data')
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.makedirs(dest)
+
+    for name in _data_files(source):
+        data = _load_json(os.path.join(source, name))
+        if name == 'endpoints':
+            for partition in data['partitions']:
+                partition['services'] = dict(
+                    (service, endpoints) for service, endpoints in partition['services'].items()
+                    if service in services)
+        _dump_json(data, os.path.join(dest, name))
+
+    for service in services:
+        for api_version in os.listdir(os.path.join(source, service)):
+            version_source = os.path.join(source, service, api_version)
+            version_dest = os.path.join(dest, service, api_version)
+            os.makedirs(version_dest)
+            for name in _data_files(version_source):
+                if name.startswith(SKIPPED_PREFIXES):
+                    continue
+                data = _load_json(os.path.join(version_source, name))
+                if name == 'service-2':
+                    data = _strip_documentation(data)
+                _dump_json(data, os.path.join(version_dest, name))
+
+    with open(os.path.join(dest, MANIFEST_FILE), 'w') as f:
+        json.dump({'botocore_version': botocore.__version__, 'services': list(services)}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Build the trimmed botocore data used by blessclient.')
+    )
+    parser.add_argument(
+        '--dest',
+        help=(
+            'Directory to build, defaults to the botocore_data directory in the blessclient package'),
+        default=BUNDLE_DIR
+    )
+    args = parser.parse_args()
+    build_bundle(args.dest)
+    sys.stderr.write('Built botocore data for {} in {}\n'.format(', '.join(SERVICES), args.dest))
+
+
+if __name__ == '__main__':
+    main()
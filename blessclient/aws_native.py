@@ -0,0 +1,201 @@
+# STS AssumeRole and KMS Encrypt as SigV4 signed https requests
+from __future__ import absolute_import
+import base64
+import datetime
+import json
+import logging
+import os
+import sys
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import urlencode
+from six.moves import configparser
+from . import aws_sigv4
+from .lambda_invocation_exception import LambdaInvocationException
+
+# botocore's default connect and read timeouts
+TIMEOUT = (60, 60)
+STS_NAMESPACE = '{https://sts.amazonaws.com/doc/2011-06-15/}'
+# Same token format as kmsauth.KMSTokenGenerator (token version 2)
+KMSAUTH_TIME_FORMAT = '%Y%m%dT%H%M%SZ'
+KMSAUTH_TOKEN_SKEW = 3
+# Profile settings that need boto3 to turn into credentials
+UNSUPPORTED_PROFILE_KEYS = ('role_arn', 'credential_process', 'credential_source', 'sso_start_url', 'sso_session')
+
+
+def _read_profile(filename, section):
+    config = configparser.RawConfigParser()
+    try:
+        config.read(filename)
+    except configparser.Error:
+        return None
+    if not config.has_section(section):
+        return None
+    return dict(config.items(section))
+
+
+def _get_profile():
+    """ Returns (tuple): the profile name, and its settings in the AWS config file """
+    profile = os.getenv('AWS_PROFILE', os.getenv('AWS_DEFAULT_PROFILE', 'default'))
+    config_file = os.path.expanduser(os.getenv('AWS_CONFIG_FILE', '~/.aws/config'))
+    section = profile if profile == 'default' else 'profile {}'.format(profile)
+    return profile, _read_profile(config_file, section) or {}
+
+
+def resolve_credentials(creds=None):
+    """ Find the credentials boto3 would use, when that can be done without boto3
+    Args:
+        creds (dict): explicit credentials, returned as they are
+    Returns (dict): AccessKeyId, SecretAccessKey and SessionToken, or None if boto3
+        should resolve the credentials
+    """
+    if creds is not None:
+        return creds
+    if os.getenv('AWS_ACCESS_KEY_ID') and os.getenv('AWS_SECRET_ACCESS_KEY'):
+        return {
+            'AccessKeyId': os.getenv('AWS_ACCESS_KEY_ID'),
+            'SecretAccessKey': os.getenv('AWS_SECRET_ACCESS_KEY'),
+            'SessionToken': os.getenv('AWS_SESSION_TOKEN'),
+        }
+
+    profile, profile_config = _get_profile()
+    if any(key in profile_config for key in UNSUPPORTED_PROFILE_KEYS):
+        logging.debug('Profile {} needs boto3 to resolve its credentials'.format(profile))
+        return None
+
+    credentials_file = os.path.expanduser(os.getenv('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials'))
+    for settings in (_read_profile(credentials_file, profile), profile_config):
+        if settings and settings.get('aws_access_key_id') and settings.get('aws_secret_access_key'):
+            return {
+                'AccessKeyId': settings['aws_access_key_id'],
+                'SecretAccessKey': settings['aws_secret_access_key'],
+                'SessionToken': settings.get('aws_session_token'),
+            }
+    return None
+
+
+def get_sts_region():
+    """ Returns (str): region of the STS endpoint to call. Like botocore, the region from
+        the environment, then the profile's region, then us-east-1 (the global endpoint).
+    """
+    region = os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION')
+    if region:
+        return region
+    return _get_profile()[1].get('region') or 'us-east-1'
+
+
+def _post(service, region, creds, body, headers):
+    """ POST a signed request to the service endpoint
+    Returns (requests.Response): the response, if the status is 200
+    """
+    import requests
+
+    url = aws_sigv4.get_endpoint(service, region) + '/'
+    headers = aws_sigv4.sign_request('POST', url, region, service, creds, headers=headers, body=body)
+    try:
+        response = requests.post(url, data=body, headers=headers, timeout=TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        raise LambdaInvocationException('Error connecting to {}: {}'.format(service, e))
+    if response.status_code != 200:
+        error_type = _get_error_type(response)
+        if error_type in ('InvalidSignatureException', 'SignatureDoesNotMatch'):
+            sys.stderr.write(
+                'Your authentication signature was rejected by AWS; try checking your system '
+                'date & timezone settings are correct\n')
+        raise LambdaInvocationException('Error calling {}. {} {}'.format(service, response.status_code, error_type))
+    return response
+
+
+def _get_error_type(response):
+    error_type = response.headers.get('x-amzn-ErrorType', '')
+    if not error_type:
+        try:
+            error_type = json.loads(response.content.decode('UTF-8')).get('__type', '')
+        except (ValueError, AttributeError):
+            try:
+                error_type = ElementTree.fromstring(response.content).findtext('.//{}Code'.format(STS_NAMESPACE), '')
+            except ElementTree.ParseError:
+                pass
+    return error_type.split(':')[0].split('#')[-1]
+
+
+def assume_role(creds, role_arn, session_name, duration):
+    """ Call STS AssumeRole
+    Args:
+        creds (dict): credentials to call STS with
+        role_arn (str): role to assume
+        session_name (str): RoleSessionName
+        duration (int): DurationSeconds
+    Returns (dict): Credentials, in the same form boto3 returns them
+    """
+    body = urlencode({
+        'Action': 'AssumeRole',
+        'Version': '2011-06-15',
+        'RoleArn': role_arn,
+        'RoleSessionName': session_name,
+        'DurationSeconds': duration,
+    }).encode('UTF-8')
+    response = _post(
+        'sts',
+        get_sts_region(),
+        creds,
+        body,
+        {'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8'})
+    try:
+        credentials = ElementTree.fromstring(response.content).find(
+            '{0}AssumeRoleResult/{0}Credentials'.format(STS_NAMESPACE))
+        role_creds = dict(
+            (key, credentials.findtext(STS_NAMESPACE + key))
+            for key in ('AccessKeyId', 'SecretAccessKey', 'SessionToken', 'Expiration'))
+        role_creds['Expiration'] = datetime.datetime.strptime(
+            role_creds['Expiration'][:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+    except (ElementTree.ParseError, AttributeError, TypeError, ValueError):
+        raise LambdaInvocationException('Invalid message format in STS response')
+    return role_creds
+
+
+def kms_encrypt(creds, region, key_id, plaintext, encryption_context):
+    """ Call KMS Encrypt
+    Args:
+        creds (dict): credentials to call KMS with
+        region (str): the AWS region code (e.g., 'us-east-1')
+        key_id (str): KMS key id, arn or alias
+        plaintext (bytes): data to encrypt
+        encryption_context (dict): EncryptionContext
+    Returns (str): the base64 encoded CiphertextBlob
+    """
+    body = json.dumps({
+        'KeyId': key_id,
+        'Plaintext': base64.b64encode(plaintext).decode('US-ASCII'),
+        'EncryptionContext': encryption_context,
+    }).encode('UTF-8')
+    response = _post(
+        'kms',
+        region,
+        creds,
+        body,
+        {'Content-Type': 'application/x-amz-json-1.1', 'X-Amz-Target': 'TrentService.Encrypt'})
+    try:
+        return json.loads(response.content.decode('UTF-8'))['CiphertextBlob']
+    except (ValueError, KeyError, TypeError):
+        raise LambdaInvocationException('Invalid message format in KMS response')
+
+
+def generate_kmsauth_token(creds, kmskey, context, region, token_lifetime):
+    """ Create a version 2 kmsauth token, like kmsauth.KMSTokenGenerator.get_token
+    Args:
+        creds (dict): credentials to call KMS with
+        kmskey (str): the kmsauth KMS key
+        context (dict): kmsauth context, with from, to and user_type
+        region (str): the AWS region code (e.g., 'us-east-1')
+        token_lifetime (int): token lifetime in minutes
+    Returns (str): kmsauth token
+    """
+    for key in ('from', 'to', 'user_type'):
+        if key not in context:
+            raise LambdaInvocationException('{} missing from kmsauth context.'.format(key))
+    now = datetime.datetime.utcnow()
+    payload = json.dumps({
+        'not_before': (now - datetime.timedelta(minutes=KMSAUTH_TOKEN_SKEW)).strftime(KMSAUTH_TIME_FORMAT),
+        'not_after': (now + datetime.timedelta(minutes=token_lifetime - KMSAUTH_TOKEN_SKEW)).strftime(KMSAUTH_TIME_FORMAT),
+    })
+    return kms_encrypt(creds, region, kmskey, payload.encode('UTF-8'), context)
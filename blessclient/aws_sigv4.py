@@ -0,0 +1,95 @@
+# AWS Signature Version 4 signing, using only the stdlib
+from __future__ import absolute_import
+import datetime
+import hashlib
+import hmac
+import os
+from urllib.parse import quote, urlparse, parse_qsl
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+AMZ_DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def get_endpoint(service, region):
+    """ The https endpoint of an AWS service in a region
+    Honours AWS_ENDPOINT_URL_<SERVICE> and AWS_ENDPOINT_URL, like botocore does.
+    Args:
+        service (str): endpoint prefix of the service (e.g., 'lambda')
+        region (str): the AWS region code (e.g., 'us-east-1')
+    Returns (str): endpoint url, without a trailing /
+    """
+    override = os.getenv('AWS_ENDPOINT_URL_{}'.format(service.upper().replace('-', '_')), os.getenv('AWS_ENDPOINT_URL'))
+    if override:
+        return override.rstrip('/')
+    suffix = 'amazonaws.com.cn' if region.startswith('cn-') else 'amazonaws.com'
+    return 'https://{}.{}.{}'.format(service, region, suffix)
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('UTF-8'), hashlib.sha256).digest()
+
+
+def get_signing_key(secret_key, datestamp, region, service):
+    key = _hmac(('AWS4' + secret_key).encode('UTF-8'), datestamp)
+    key = _hmac(key, region)
+    key = _hmac(key, service)
+    return _hmac(key, 'aws4_request')
+
+
+def _canonical_query(query):
+    params = sorted(
+        (quote(key, safe='-_.~'), quote(value, safe='-_.~'))
+        for key, value in parse_qsl(query, keep_blank_values=True))
+    return '&'.join('{}={}'.format(key, value) for key, value in params)
+
+
+def sign_request(method, url, region, service, creds, headers=None, body=b'', now=None):
+    """ Sign a request with SigV4
+    Args:
+        method (str): http method
+        url (str): full url, with the path already quoted and any query string
+        region (str): the AWS region code (e.g., 'us-east-1')
+        service (str): signing name of the service (e.g., 'lambda')
+        creds (dict): AccessKeyId, SecretAccessKey and optionally SessionToken
+        headers (dict): headers to send, these are all signed
+        body (bytes): request body
+        now (datetime): signing time, defaults to utcnow
+    Returns (dict): headers to send, including Authorization
+    """
+    now = now or datetime.datetime.utcnow()
+    amz_date = now.strftime(AMZ_DATE_FORMAT)
+    datestamp = now.strftime('%Y%m%d')
+    parsed = urlparse(url)
+
+    headers = dict(headers or {})
+    headers['Host'] = parsed.netloc
+    headers['X-Amz-Date'] = amz_date
+    if creds.get('SessionToken'):
+        headers['X-Amz-Security-Token'] = creds['SessionToken']
+
+    canonical_headers = sorted((name.lower(), ' '.join(str(value).split())) for name, value in headers.items())
+    signed_headers = ';'.join(name for name, _ in canonical_headers)
+    canonical_request = '\n'.join([
+        method.upper(),
+        quote(parsed.path or '/', safe='/~'),
+        _canonical_query(parsed.query),
+        ''.join('{}:{}\n'.format(name, value) for name, value in canonical_headers),
+        signed_headers,
+        hashlib.sha256(body).hexdigest(),
+    ])
+
+    scope = '{}/{}/{}/aws4_request'.format(datestamp, region, service)
+    string_to_sign = '\n'.join([
+        ALGORITHM,
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode('UTF-8')).hexdigest(),
+    ])
+    signature = hmac.new(
+        get_signing_key(creds['SecretAccessKey'], datestamp, region, service),
+        string_to_sign.encode('UTF-8'),
+        hashlib.sha256).hexdigest()
+
+    headers['Authorization'] = '{} Credential={}/{}, SignedHeaders={}, Signature={}'.format(
+        ALGORITHM, creds['AccessKeyId'], scope, signed_headers, signature)
+    return headers
@@ -1,8 +1,7 @@
 from __future__ import absolute_import
-import boto3
 import logging
 from itertools import count
-from botocore.exceptions import DataNotFoundError
+from .aws_data import boto3_client
 from .lambda_invocation_exception import LambdaInvocationException
 from random import randint
 from time import sleep
@@ -36,9 +35,11 @@ class BlessAWS(object):
 
     def iam_client(self):
         if not self.iam:
+            from botocore.exceptions import DataNotFoundError
+
             for attempt in count():
                 try:
-                    self.iam = boto3.client('iam')
+                    self.iam = boto3_client('iam')
                     break
                 except DataNotFoundError:
                     logging.exception('DataNotFoundError when trying to get the iam client.')
@@ -53,5 +54,5 @@ class BlessAWS(object):
 
     def sts_client(self):
         if not self.sts:
-            self.sts = boto3.client('sts')
+            self.sts = boto3_client('sts')
         return self.sts
@@ -1,7 +1,78 @@
 from __future__ import absolute_import
+import contextlib
 import json
 import logging
 import os
+import tempfile
+import threading
+import time
+
+# The expiry times of the entries set with a ttl, in the cache file next to the entries
+EXPIRES_KEY = '__expires__'
+
+
+def write_atomic(path, text, mode=0o600):
+    """ Write text to path. The file is written next to path and renamed over it, so
+    readers see either the old or the new file, never a partly written one.
+    Args:
+        mode (int): the file's permissions
+    """
+    directory, filename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.{}.'.format(filename), dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tmp_path, mode)
+        os.rename(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json(path, data):
+    """ Write data to path as JSON, atomically and only readable by the user """
+    write_atomic(path, json.dumps(data))
+
+
+@contextlib.contextmanager
+def locked_dir(directory):
+    """ Hold an exclusive flock on directory while the block runs, for writers that
+    read, merge and replace a file in it
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows), the writes are still atomic
+        yield
+        return
+
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the directory releases the lock
+        os.close(fd)
+
+
+def compact(cache, expires):
+    """ Remove the expired entries
+    Args:
+        cache (dict): the entries
+        expires (dict): key -> time.time() the entry expires at
+    Returns (tuple): the live entries, and their expiry times
+    """
+    now = time.time()
+    expires = dict((key, expiry) for key, expiry in expires.items() if key in cache)
+    for key, expiry in list(expires.items()):
+        # An entry with an expiry that isn't a time (a corrupted cache) is dropped too
+        if isinstance(expiry, bool) or not isinstance(expiry, (int, float)) or expiry <= now:
+            del cache[key]
+            del expires[key]
+    return cache, expires
 
 
 class BlessCache(object):
@@ -14,44 +85,131 @@ class BlessCache(object):
         self.filename = filename
         self.mode = cachemode
         self.cache = None
+        # key -> time.time() the entry expires at, for the entries set with a ttl
+        self.expires = {}
         self.dirty = False
+        # The keys set since the last save, with their expiry, merged into what is
+        # on disk when saving
+        self.updates = {}
+        self.coalescing = 0
+        # bless() updates the cache from several threads
+        self.lock = threading.RLock()
 
     def get(self, key):
         if self.mode != self.CACHEMODE_ENABLED:
             logging.debug("Cache get disabled")
             return None
         value = None
-        if self.cache is None:
-            self.loadCache()
-        if key in self.cache.keys():
-            value = self.cache[key]
+        with self.lock:
+            if self.cache is None:
+                self.loadCache()
+            if key in self.cache.keys() and not self.expired(key):
+                value = self.cache[key]
         return value
 
-    def set(self, key, value):
-        if self.cache is None:
-            self.loadCache()
-        self.dirty = True
-        self.cache[key] = value
+    def ttl(self, key):
+        """ Returns (float): the seconds until key expires, or None if it isn't cached
+            or was set without a ttl
+        """
+        if self.get(key) is None:
+            return None
+        with self.lock:
+            if key not in self.expires:
+                return None
+            return self.expires[key] - time.time()
+
+    def set(self, key, value, ttl=None):
+        """ Cache value for key
+        Args:
+            ttl (float): seconds until the entry expires, None to keep it until it is set again
+        """
+        expires = None if ttl is None else time.time() + ttl
+        with self.lock:
+            if self.cache is None:
+                self.loadCache()
+            self.dirty = True
+            self.cache[key] = value
+            if expires is None:
+                self.expires.pop(key, None)
+            else:
+                self.expires[key] = expires
+            self.updates[key] = (value, expires)
+
+    def expired(self, key):
+        return key in self.expires and self.expires[key] <= time.time()
 
     def save(self):
-        if self.dirty and self.mode != self.CACHEMODE_DISABLED:
-            self.saveCache()
+        """ Write the changes to disk, or when inside coalesce(), when it ends """
+        with self.lock:
+            if not self.coalescing:
+                self.flush()
+
+    def flush(self):
+        """ Write the changes to disk now """
+        with self.lock:
+            if self.dirty and self.mode != self.CACHEMODE_DISABLED:
+                self.saveCache()
+
+    @contextlib.contextmanager
+    def coalesce(self):
+        """ Write the changes saved while the block runs once, when it ends """
+        with self.lock:
+            self.coalescing += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.coalescing -= 1
+                if not self.coalescing:
+                    self.flush()
 
     def loadCache(self):
-        self.cache = {}
+        self.cache, self.expires = self.readCache()
+        logging.debug("Cache loaded: {}".format(self.cache))
+
+    def readCache(self):
+        """ Returns (tuple): the entries in the cache file and their expiry times, without
+            the expired entries
+        """
+        cache = {}
         cache_file_path = os.path.join(self.filepath, self.filename)
         if os.path.isfile(cache_file_path):
-            with open(cache_file_path, 'r') as cache:
+            with open(cache_file_path, 'r') as f:
                 try:
-                    self.cache = json.load(cache)
+                    cache = json.load(f)
                 except Exception:
                     logging.error("Corrupted cache, using empty cache")
-        logging.debug("Cache loaded: {}".format(self.cache))
+        if not isinstance(cache, dict):
+            logging.error("Corrupted cache, using empty cache")
+            cache = {}
+        expires = cache.pop(EXPIRES_KEY, None)
+        if not isinstance(expires, dict):
+            expires = {}
+        return compact(cache, expires)
 
     def saveCache(self):
         if not os.path.exists(self.filepath):
             os.makedirs(self.filepath)
         cache_file_path = os.path.join(self.filepath, self.filename)
-        with open(cache_file_path, 'w') as cache:
-            json.dump(self.cache, cache)
-            logging.debug("Cache saved")
+        # Other blessclients may have saved since we loaded the cache: keep their
+        # changes, and apply ours on top. With --nocache (recache) too, which only
+        # skips reading the cache and overwrites the keys this run sets.
+        with locked_dir(self.filepath):
+            cache, expires = self.readCache()
+            for key, (value, expiry) in self.updates.items():
+                cache[key] = value
+                if expiry is None:
+                    expires.pop(key, None)
+                else:
+                    expires[key] = expiry
+            # Drop what expired since it was set, so the file only holds live entries
+            cache, expires = compact(cache, expires)
+            data = dict(cache)
+            if expires:
+                data[EXPIRES_KEY] = expires
+            write_json(cache_file_path, data)
+        self.cache = cache
+        self.expires = expires
+        self.updates = {}
+        self.dirty = False
+        logging.debug("Cache saved")
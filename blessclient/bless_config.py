@@ -1,6 +1,9 @@
 from __future__ import absolute_import
+import re
 from six.moves.configparser import SafeConfigParser
 
+from . import config_snapshot
+
 
 class BlessConfig(object):
 
@@ -11,10 +14,17 @@ class BlessConfig(object):
         'remote_user': '',
         'ca_backend': 'bless',
         'use_env_creds': 'true',
+        'aws_transport': 'boto3',
+        'ip_lookup': 'sequential',
+        'ip_timeout': '2',
+        'lambda_hedge_percentile': '0',
     }
 
     def __init__(self):
         self.blessconfig = None
+        self.domain_regex = None
+        self.aws_regions = None
+        self.region_aliases = None
 
     def _get_region_kms_config(self, region, config):
         section = 'REGION_{}'.format(region)
@@ -53,6 +63,10 @@ class BlessConfig(object):
                 'usebless_role_session_length': int(config.get('CLIENT', 'usebless_role_session_length')),
                 'update_sshagent': config.getboolean('CLIENT', 'update_sshagent'),
                 'use_env_creds': config.getboolean('CLIENT', 'use_env_creds'),
+                'aws_transport': config.get('CLIENT', 'aws_transport').lower(),
+                'ip_lookup': config.get('CLIENT', 'ip_lookup').lower(),
+                'ip_timeout': config.getfloat('CLIENT', 'ip_timeout'),
+                'lambda_hedge_percentile': config.getint('CLIENT', 'lambda_hedge_percentile'),
             },
             'BLESS_CONFIG': {
                 'ca_backend': config.get('MAIN', 'ca_backend'),
@@ -98,6 +112,21 @@ class BlessConfig(object):
 
         return blessconfig
 
+    def load_config_file(self, config_filename):
+        """ Load config_filename, from its snapshot if the file hasn't changed since it was parsed
+        Args:
+            config_filename (str): path to blessclient.cfg
+        Raises FileNotFoundError if config_filename doesn't exist.
+        """
+        snapshot = config_snapshot.load_snapshot(config_filename)
+        if snapshot is None:
+            with open(config_filename, 'r') as f:
+                config = self.parse_config_file(f)
+            snapshot = config_snapshot.save_snapshot(config_filename, config)
+        self.set_config(snapshot['config'])
+        self.aws_regions = tuple(snapshot['aws_regions'])
+        self.region_aliases = tuple(snapshot['region_aliases'])
+
     def get(self, section):
         if section in self.blessconfig:
             return self.blessconfig[section]
@@ -106,6 +135,9 @@ class BlessConfig(object):
 
     def set_config(self, config):
         self.blessconfig = config
+        self.domain_regex = None
+        self.aws_regions = None
+        self.region_aliases = None
 
     def get_config(self):
         return self.blessconfig
@@ -116,6 +148,24 @@ class BlessConfig(object):
                 return alias
         raise ValueError('Unexpected region: {}'.format(aws_region))
 
+    def get_aws_regions(self):
+        """ Returns (tuple): the sorted AWS regions of all region aliases """
+        if self.aws_regions is None:
+            self.aws_regions = tuple(sorted(self.blessconfig['REGION_ALIAS'].values()))
+        return self.aws_regions
+
+    def get_region_aliases(self):
+        """ Returns (tuple): the sorted region aliases """
+        if self.region_aliases is None:
+            self.region_aliases = tuple(sorted(self.blessconfig['REGION_ALIAS']))
+        return self.region_aliases
+
+    def get_domain_regex(self):
+        """ Returns: domain_regex from the client config, compiled """
+        if self.domain_regex is None:
+            self.domain_regex = re.compile(self.blessconfig['CLIENT_CONFIG']['domain_regex'])
+        return self.domain_regex
+
     def get_client_config(self):
         return self.blessconfig['CLIENT_CONFIG']
 
@@ -1,11 +1,7 @@
 from __future__ import absolute_import
-import boto3
 import json
+from .aws_data import boto3_client
 from .lambda_invocation_exception import LambdaInvocationException
-from botocore.client import Config
-from botocore.vendored.requests.exceptions import (ReadTimeout,
-                                                   ConnectTimeout,
-                                                   SSLError)
 
 
 class BlessLambda(object):
@@ -17,6 +13,11 @@ class BlessLambda(object):
         self.region = region
 
     def getCert(self, payload):
+        from botocore.client import Config
+        from botocore.vendored.requests.exceptions import (ReadTimeout,
+                                                           ConnectTimeout,
+                                                           SSLError)
+
         payload['kmsauth_token'] = self.kmsauth_token
         payload_json = json.dumps(payload)
         lambdabotoconfig = Config(
@@ -24,7 +25,7 @@ class BlessLambda(object):
             read_timeout=self.config['timeoutconfig']['read']
         )
         try:
-            mfa_lambda_client = boto3.client(
+            mfa_lambda_client = boto3_client(
                 'lambda',
                 region_name=self.region,
                 aws_access_key_id=self.creds['AccessKeyId'],
@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+import json
+import sys
+from urllib.parse import quote
+from . import aws_sigv4
+from .bless_lambda import BlessLambda
+from .lambda_invocation_exception import LambdaInvocationException
+
+
+class BlessLambdaHTTP(BlessLambda):
+    """ BlessLambda that calls the Lambda Invoke API with a SigV4 signed https request,
+    instead of creating a boto3 Lambda client. Selected with aws_transport: native.
+    """
+
+    def getCert(self, payload):
+        import requests
+
+        payload['kmsauth_token'] = self.kmsauth_token
+        body = json.dumps(payload).encode('UTF-8')
+        url = '{}/2015-03-31/functions/{}/invocations?Qualifier={}'.format(
+            aws_sigv4.get_endpoint('lambda', self.region),
+            quote(self.config['functionname'], safe=''),
+            quote(self.config['functionversion'], safe=''))
+        headers = aws_sigv4.sign_request(
+            'POST',
+            url,
+            self.region,
+            'lambda',
+            self.creds,
+            headers={
+                'X-Amz-Invocation-Type': 'RequestResponse',
+                'X-Amz-Log-Type': 'Tail',
+            },
+            body=body)
+        try:
+            response = requests.post(
+                url,
+                data=body,
+                headers=headers,
+                timeout=(self.config['timeoutconfig']['connect'], self.config['timeoutconfig']['read']))
+        except requests.exceptions.ConnectTimeout:
+            raise LambdaInvocationException('Timeout connecting to Lambda')
+        except requests.exceptions.ReadTimeout:
+            raise LambdaInvocationException('Timeout reading cert from Lambda')
+        except requests.exceptions.SSLError:
+            raise LambdaInvocationException('SSL error connecting to Lambda')
+        except requests.exceptions.ConnectionError:
+            raise LambdaInvocationException('Error connecting to Lambda')
+
+        if response.status_code != 200:
+            error_type = response.headers.get('x-amzn-ErrorType', '').split(':')[0]
+            if error_type == 'InvalidSignatureException':
+                sys.stderr.write(
+                    'Your authentication signature was rejected by AWS; try checking your system '
+                    'date & timezone settings are correct\n')
+            raise LambdaInvocationException('Error creating cert. {} {}'.format(response.status_code, error_type))
+        try:
+            payload = json.loads(response.content.decode('UTF-8'))
+        except ValueError:
+            raise LambdaInvocationException('Invalid message format in Lambda response')
+        if not isinstance(payload, dict) or 'certificate' not in payload:
+            raise LambdaInvocationException('No certificate in response.')
+        return payload['certificate']
@@ -0,0 +1,344 @@
+# blessd: a per-user agent that keeps blessclient's state warm between runs
+from __future__ import absolute_import
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+SOCKET_NAME = 'blessd.sock'
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 300
+IDLE_TIMEOUT = 3600
+REFRESH_MARGIN = 300
+# Environment the client passes on, since bless() reads it. ssh-add puts the cert
+# in the client's agent (SSH_AUTH_SOCK), not blessd's.
+ENV_PREFIXES = ('AWS_', 'BLESS', 'MFA_ROLE', 'SSH_AUTH_SOCK')
+
+
+def get_socket_path():
+    """ Returns (str): BLESSD_SOCKET, or blessd.sock in ~/.bless """
+    return os.getenv('BLESSD_SOCKET', os.path.join(os.path.expanduser('~'), '.bless', SOCKET_NAME))
+
+
+def get_request_env():
+    """ Returns (dict): the environment variables blessd should run the request with """
+    return dict((key, value) for key, value in os.environ.items() if key.startswith(ENV_PREFIXES))
+
+
+def request(message, socket_path=None):
+    """ Send a request to blessd
+    Args:
+        message (dict): the request
+        socket_path (str): blessd's socket, defaults to get_socket_path()
+    Returns (dict): the response, or None if blessd isn't running (or BLESS_NODAEMON is set)
+    """
+    if os.getenv('BLESS_NODAEMON', '') != '':
+        return None
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(socket_path)
+        sock.settimeout(REQUEST_TIMEOUT)
+        sock.sendall(json.dumps(message).encode('UTF-8') + b'\n')
+        with sock.makefile('rb') as f:
+            response = f.readline()
+    except (IOError, OSError) as e:
+        logging.debug('blessd not available at {}: {}'.format(socket_path, e))
+        return None
+    finally:
+        sock.close()
+    if not response:
+        return None
+    return json.loads(response.decode('UTF-8'))
+
+
+def request_cert(start_region, nocache, showgui, hostname, config_filename, username, identity_file):
+    """ Ask blessd for a certificate, see client.get_cert()
+    Returns (dict): {'result': output of client.get_cert(), 'error': message or None},
+        or None if blessd isn't running
+    """
+    return request({
+        'command': 'cert',
+        'start_region': start_region,
+        'nocache': nocache,
+        'showgui': showgui,
+        'hostname': hostname,
+        'config': config_filename,
+        'username': username,
+        'identity_file': identity_file,
+        'env': get_request_env(),
+    })
+
+
+def _stat_key(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class BlessDaemon(object):
+    """ The warm state, and the request handling. Requests (and renewals) run one
+    at a time, since each one runs with the client's environment.
+    """
+
+    def __init__(self, refresh_margin=None):
+        """
+        Args:
+            refresh_margin (int): renew the certs handed out this many seconds before
+                they expire, or None to only issue certs when asked
+        """
+        from .refresh import RefreshScheduler
+
+        self.lock = threading.Lock()
+        self.configs = {}
+        self.caches = {}
+        self.aws = None
+        self.aws_env = None
+        self.last_request = time.time()
+        self.scheduler = None
+        if refresh_margin is not None:
+            self.scheduler = RefreshScheduler(self, refresh_margin)
+
+    def get_config(self, config_filename):
+        """ The BlessConfig for config_filename, reloaded when the file changes """
+        from . import config_snapshot
+        from .bless_config import BlessConfig
+
+        key = config_snapshot.get_snapshot_key(config_filename)
+        if config_filename not in self.configs or self.configs[config_filename][0] != key:
+            bless_config = BlessConfig()
+            bless_config.load_config_file(config_filename)
+            self.configs[config_filename] = (key, bless_config)
+            self.caches.pop(config_filename, None)
+        return self.configs[config_filename][1]
+
+    def get_cache(self, config_filename, bless_config):
+        """ The BlessCache for bless_config, reloaded when something else has written it """
+        from .client import get_bless_cache
+
+        if config_filename not in self.caches:
+            self.caches[config_filename] = get_bless_cache(False, bless_config)
+        bless_cache = self.caches[config_filename]
+        if getattr(bless_cache, 'stat_key', None) != _stat_key(self._cache_file(bless_cache)):
+            bless_cache.cache = None
+        return bless_cache
+
+    def _cache_file(self, bless_cache):
+        return os.path.join(bless_cache.filepath, bless_cache.filename)
+
+    def get_aws(self, env):
+        """ The BlessAWS to use, new whenever the AWS environment changes """
+        from . import aws_data
+        from .bless_aws import BlessAWS
+
+        aws_env = dict((key, value) for key, value in env.items() if key.startswith('AWS_'))
+        if self.aws is None or aws_env != self.aws_env:
+            aws_data.reset_default_session()
+            self.aws = BlessAWS()
+            self.aws_env = aws_env
+        return self.aws
+
+    @contextlib.contextmanager
+    def request_env(self, env):
+        """ Run with the client's environment variables """
+        saved = get_request_env()
+        for key in saved:
+            del os.environ[key]
+        os.environ.update(env)
+        try:
+            yield
+        finally:
+            for key in get_request_env():
+                del os.environ[key]
+            os.environ.update(saved)
+
+    def handle(self, message):
+        """ Handle a request
+        Returns (dict): the response
+        """
+        with self.lock:
+            self.last_request = time.time()
+            if message.get('command') == 'ping':
+                return {'result': 'pong', 'error': None}
+            if message.get('command') != 'cert':
+                return {'result': None, 'error': 'Unknown command {}'.format(message.get('command'))}
+            try:
+                return self.handle_cert(message)
+            except SystemExit:
+                return {'result': None, 'error': 'Could not sign SSH public key.'}
+            except Exception as e:
+                logging.exception('Error handling request')
+                return {'result': None, 'error': str(e)}
+
+    def handle_cert(self, message):
+        with self.request_env(message.get('env', {})):
+            result = self._get_cert(message)
+        if result is None:
+            return {'result': None, 'error': 'Could not sign SSH public key.'}
+        if self.scheduler is not None:
+            self.scheduler.track(message)
+        return {'result': result, 'error': None}
+
+    def refresh(self, message, refresh_margin):
+        """ Renew the cert from an earlier cert request, if it is no longer fresh. The
+        role credentials and the kmsauth tokens for every region are renewed too, so
+        failing over to another region doesn't have to wait for STS and KMS.
+        Args:
+            message (dict): the blessd cert request
+            refresh_margin (int): renew the cert this many seconds before it expires
+        Returns (bool): True if the cert is fresh or was renewed
+        """
+        from .client import check_fresh_cert, get_user_ip, prewarm
+
+        with self.lock, self.request_env(message.get('env', {})):
+            bless_config = self.get_config(message['config'])
+            lambda_config = bless_config.get_lambda_config()
+            # A margin over half the cert's lifetime would renew it on every check
+            refresh_margin = min(refresh_margin, lambda_config['certlifetime'] // 2)
+            bless_cache = self.get_cache(message['config'], bless_config)
+            try:
+                prewarm(bless_config, self.get_aws(message.get('env', {})), bless_cache, refresh_margin)
+            except Exception as e:
+                logging.info('Could not prewarm the role credentials and kmsauth tokens: {}'.format(e))
+            bless_cache.stat_key = _stat_key(self._cache_file(bless_cache))
+            user_ip = get_user_ip(bless_config, bless_cache)
+            cert_file = message['identity_file'] + '-cert.pub'
+            if check_fresh_cert(cert_file, lambda_config, bless_cache, user_ip, refresh_margin=refresh_margin):
+                return True
+            logging.info('Renewing {}'.format(cert_file))
+            try:
+                return self._get_cert(message, refresh_margin) is not None
+            except SystemExit:
+                return False
+
+    def _get_cert(self, message, refresh_margin=0):
+        """ Run client.get_cert for a cert request, with the warm state """
+        from .client import get_cert
+
+        bless_config = self.get_config(message['config'])
+        bless_cache = None
+        if not message['nocache']:
+            bless_cache = self.get_cache(message['config'], bless_config)
+        try:
+            return get_cert(
+                message['start_region'],
+                message['nocache'],
+                message['showgui'],
+                message['hostname'],
+                bless_config,
+                username=message['username'],
+                identity_file=message['identity_file'],
+                aws=self.get_aws(message.get('env', {})),
+                bless_cache=bless_cache,
+                refresh_margin=refresh_margin)
+        finally:
+            if bless_cache is not None:
+                bless_cache.stat_key = _stat_key(self._cache_file(bless_cache))
+
+
+def serve(socket_path, idle_timeout=IDLE_TIMEOUT, refresh_margin=None):
+    """ Serve requests on socket_path until blessd has been idle for idle_timeout seconds
+    Args:
+        refresh_margin (int): see BlessDaemon
+    """
+    from socketserver import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+
+    daemon = BlessDaemon(refresh_margin)
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            try:
+                message = json.loads(line.decode('UTF-8'))
+            except ValueError:
+                return
+            self.wfile.write(json.dumps(daemon.handle(message)).encode('UTF-8') + b'\n')
+
+    class Server(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+    socket_dir = os.path.dirname(socket_path)
+    if not os.path.exists(socket_dir):
+        os.makedirs(socket_dir, 0o700)
+    if os.path.exists(socket_path):
+        if request({'command': 'ping'}, socket_path) is not None:
+            raise RuntimeError('blessd is already running on {}'.format(socket_path))
+        os.unlink(socket_path)
+
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+    server.timeout = min(1, idle_timeout)
+    logging.info('blessd listening on {}'.format(socket_path))
+    if daemon.scheduler is not None:
+        scheduler_thread = threading.Thread(target=daemon.scheduler.run)
+        scheduler_thread.daemon = True
+        scheduler_thread.start()
+    try:
+        while time.time() - daemon.last_request < idle_timeout:
+            server.handle_request()
+    finally:
+        if daemon.scheduler is not None:
+            daemon.scheduler.stop()
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Keep blessclient\'s config, cache and AWS clients warm for blessclient and bssh.')
+    )
+    parser.add_argument(
+        '--socket',
+        help=(
+            'Unix socket to listen on, defaults to ~/.bless/blessd.sock (or BLESSD_SOCKET)'),
+        default=None
+    )
+    parser.add_argument(
+        '--idle-timeout',
+        help=(
+            'Exit after this many seconds without a request'),
+        type=int,
+        default=IDLE_TIMEOUT
+    )
+    parser.add_argument(
+        '--refresh-margin',
+        help=(
+            'Renew certs in the background this many seconds before they expire, or when your IP changes'),
+        type=int,
+        default=REFRESH_MARGIN
+    )
+    parser.add_argument(
+        '--no-refresh',
+        help=(
+            'Only get certs when blessclient or bssh asks for one'),
+        action='store_true'
+    )
+    args = parser.parse_args()
+
+    from .client import setup_logging
+
+    setup_logging()
+    try:
+        serve(args.socket or get_socket_path(), args.idle_timeout, None if args.no_refresh else args.refresh_margin)
+    except RuntimeError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,51 @@
 #!/usr/local/bin/python
 from __future__ import absolute_import
-import boto3
-from botocore.exceptions import (ClientError,
-                                 ConnectionError,
-                                 EndpointConnectionError)
-
-import kmsauth
 import os
 import sys
-import psutil
 import datetime
 import time
 import re
 import argparse
+import calendar
 import copy
 import subprocess
 import json
-import hvac
 import getpass
 import socket
-from Cryptodome.PublicKey import RSA
 
 import six
 
 from . import awsmfautils
+from .aws_data import boto3_client, setup_default_session
 from .bless_aws import BlessAWS
-from .bless_cache import BlessCache
+from .bless_cache import BlessCache, write_atomic, write_json
 from .user_ip import UserIP
 from .bless_lambda import BlessLambda
+from .bless_lambda_http import BlessLambdaHTTP
+from . import aws_native
+from . import hedge
+from . import single_flight
+from . import blessd
+from . import proxy
+from .identity import get_identity_file
 from .housekeeper_lambda import HousekeeperLambda
 from .bless_config import BlessConfig
 from .vault_ca import VaultCA
 from .lambda_invocation_exception import LambdaInvocationException
+from .task_graph import TaskGraph
 
 import logging
 
-try:
-    from . import tokengui
-except ImportError:
-    tokengui = None
-
+# Heavy dependencies (boto3, botocore, kmsauth, hvac, psutil, Cryptodome, requests
+# and tkinter) are imported inside the functions that use them. blessclient runs
+# on every ssh connection, and most runs only find that the current cert is still
+# fresh, so they should not pay for importing the AWS and Vault SDKs.
 
 DATETIME_STRING_FORMAT = '%Y%m%dT%H%M%SZ'
+# Housekeeper lookups run at once when getting a cert for many hosts
+FLEET_LOOKUPS = 10
+# Certs signed at once in batch mode
+BATCH_PARALLEL = 4
 
 
 def update_client(bless_cache, bless_config):
@@ -103,7 +107,7 @@ def is_valid_ipv6_address(address):
 
 def get_region_from_code(region_code, bless_config):
     if region_code is None:
-        region_code = tuple(sorted(bless_config.get('REGION_ALIAS')))[0]
+        region_code = bless_config.get_region_aliases()[0]
     alias_code = region_code.upper()
     aliases = bless_config.get('REGION_ALIAS')
     if alias_code in aliases:
@@ -122,7 +126,7 @@ def get_regions(region, bless_config):
         List of regions
     """
     regions = []
-    aws_regions = tuple(sorted(bless_config.get('REGION_ALIAS').values()))
+    aws_regions = bless_config.get_aws_regions()
     try:
         ndx = aws_regions.index(region)
     except ValueError:
@@ -160,33 +164,72 @@ def get_housekeeper_config(region, bless_config):
         return None
 
 
-def get_housekeeperrole_credentials(iam_client, creds, housekeeper_config, blessconfig, bless_cache):
-    """
+def get_sts_client(creds):
+    """ Return a boto3 sts client for the given credentials
     Args:
-        iam_client: boto3 iam client
-        creds: User credentials with rights to assume the use-bless role, or None for boto to
-            use its default search
-        blessconfig: BlessConfig object
-        bless_cache: BlessCache object
+        creds: User credentials, or None for boto to use its default search
     """
-    role_creds = uncache_creds(bless_cache.get('housekeeperrole_creds'))
-    if role_creds and role_creds['Expiration'] > time.gmtime():
-        return role_creds
-
     if creds is not None:
-        mfa_sts_client = boto3.client(
+        return boto3_client(
             'sts',
             aws_access_key_id=creds['AccessKeyId'],
             aws_secret_access_key=creds['SecretAccessKey'],
             aws_session_token=creds['SessionToken']
         )
-    else:
-        mfa_sts_client = boto3.client('sts')
+    return boto3_client('sts')
+
+
+def get_native_creds(creds, blessconfig):
+    """ Credentials to call AWS with when aws_transport is native
+    Args:
+        creds: User credentials, or None for the default search
+        blessconfig: BlessConfig object
+    Returns: credentials dict, or None to use boto3
+    """
+    if blessconfig.get_client_config().get('aws_transport') != 'native':
+        return None
+    native_creds = aws_native.resolve_credentials(creds)
+    if native_creds is None:
+        logging.debug('No credentials for the native aws_transport, using boto3')
+    return native_creds
+
+
+def assume_role(creds, role_arn, blessconfig):
+    """ Assume role_arn, with the configured aws_transport
+    Args:
+        creds: User credentials, or None for the default search
+        role_arn (str): role to assume
+        blessconfig: BlessConfig object
+    Returns: role Credentials, as returned by boto3
+    """
+    duration = blessconfig.get_client_config()['usebless_role_session_length']
+    native_creds = get_native_creds(creds, blessconfig)
+    if native_creds is not None:
+        return aws_native.assume_role(native_creds, role_arn, 'mfaassume', duration)
+    return get_sts_client(creds).assume_role(
+        RoleArn=role_arn,
+        RoleSessionName='mfaassume',
+        DurationSeconds=duration,
+    )['Credentials']
+
+
+def get_housekeeperrole_credentials(aws, creds, housekeeper_config, blessconfig, bless_cache):
+    """
+    Args:
+        aws: BlessAWS object, for the iam client
+        creds: User credentials with rights to assume the use-bless role, or None for boto to
+            use its default search
+        blessconfig: BlessConfig object
+        bless_cache: BlessCache object
+    """
+    role_creds = get_cached_role_creds(bless_cache, 'housekeeperrole_creds')
+    if role_creds:
+        return role_creds
 
     if 'AWS_USER' in os.environ:
         user_arn = os.environ['AWS_USER']
     else:
-        user = iam_client.get_user()['User']
+        user = aws.iam_client().get_user()['User']
         user_arn = user['Arn']
 
     role_arn = awsmfautils.get_role_arn(
@@ -197,46 +240,34 @@ def get_housekeeperrole_credentials(iam_client, creds, housekeeper_config, bless
 
     logging.debug("Role Arn: {}".format(role_arn))
 
-    role_creds = mfa_sts_client.assume_role(
-        RoleArn=role_arn,
-        RoleSessionName='mfaassume',
-        DurationSeconds=blessconfig.get_client_config()['usebless_role_session_length'],
-    )['Credentials']
+    role_creds = assume_role(creds, role_arn, blessconfig)
 
     logging.debug("Role Credentials: {}".format(role_creds))
-    bless_cache.set('housekeeperrole_creds', make_cachable_creds(role_creds))
+    bless_cache.set('housekeeperrole_creds', make_cachable_creds(role_creds), get_creds_ttl(role_creds))
     bless_cache.save()
 
     return role_creds
 
 
-def get_blessrole_credentials(iam_client, creds, blessconfig, bless_cache):
+def get_blessrole_credentials(aws, creds, blessconfig, bless_cache, min_lifetime=0):
     """
     Args:
-        iam_client: boto3 iam client
+        aws: BlessAWS object, for the iam client
         creds: User credentials with rights to assume the use-bless role, or None for boto to
             use its default search
         blessconfig: BlessConfig object
         bless_cache: BlessCache object
+        min_lifetime (int): assume the role again if the cached credentials expire within this many seconds
     """
-    role_creds = uncache_creds(bless_cache.get('blessrole_creds'))
-    if role_creds and role_creds['Expiration'] > time.gmtime():
+    role_creds = get_cached_role_creds(bless_cache, 'blessrole_creds', min_lifetime)
+    if role_creds:
         return role_creds
 
     lambda_config = blessconfig.get_lambda_config()
-    if creds is not None:
-        mfa_sts_client = boto3.client(
-            'sts',
-            aws_access_key_id=creds['AccessKeyId'],
-            aws_secret_access_key=creds['SecretAccessKey'],
-            aws_session_token=creds['SessionToken']
-        )
-    else:
-        mfa_sts_client = boto3.client('sts')
 
     user_arn = bless_cache.get('userarn')
     if not user_arn:
-        user = iam_client.get_user()['User']
+        user = aws.iam_client().get_user()['User']
         user_arn = user['Arn']
         bless_cache.set('username', user['UserName'])
         bless_cache.set('userarn', user_arn)
@@ -250,46 +281,31 @@ def get_blessrole_credentials(iam_client, creds, blessconfig, bless_cache):
 
     logging.debug("Role Arn: {}".format(role_arn))
 
-    role_creds = mfa_sts_client.assume_role(
-        RoleArn=role_arn,
-        RoleSessionName='mfaassume',
-        DurationSeconds=blessconfig.get_client_config()['usebless_role_session_length'],
-    )['Credentials']
+    role_creds = assume_role(creds, role_arn, blessconfig)
 
     logging.debug("Role Credentials: {}".format(role_creds))
-    bless_cache.set('blessrole_creds', make_cachable_creds(role_creds))
+    bless_cache.set('blessrole_creds', make_cachable_creds(role_creds), get_creds_ttl(role_creds))
     bless_cache.save()
 
     return role_creds
 
 
-def get_idfile_from_cmdline(cmdline, default):
-    identity_file = default
-
-    if ('BLESS_IDENTITYFILE' in os.environ) and (
-            os.environ['BLESS_IDENTITYFILE'] != ''):
-        return os.environ['BLESS_IDENTITYFILE']
-
-    try:
-        iflag = cmdline.index('-i')
-        identity_file = cmdline[iflag + 1]
-    except ValueError:
-        pass
-
-    if (identity_file[-4:] == '.pub'):
-        # someone set their public key as their identity
-        identity_file = identity_file[0:-4]
-
-    return identity_file
-
-
 def get_mfa_token_cli():
     sys.stderr.write('Enter your AWS MFA code: ')
     mfa_pin = six.moves.input()
     return mfa_pin
 
 
+def get_tokengui():
+    try:
+        from . import tokengui
+    except ImportError:
+        tokengui = None
+    return tokengui
+
+
 def get_mfa_token_gui(message):
+    tokengui = get_tokengui()
     sys.stderr.write(
         "Enter your AWS MFA token in the gui dialog. Alternatively, run mfa.sh first.\n")
     tig = tokengui.TokenInputGUI()
@@ -304,7 +320,7 @@ def get_mfa_token(showgui, message):
     mfa_token = None
     if not showgui:
         mfa_token = get_mfa_token_cli()
-    elif tokengui:
+    elif get_tokengui():
         mfa_token = get_mfa_token_gui(message)
     else:
         raise RuntimeError(
@@ -316,46 +332,50 @@ def get_mfa_token(showgui, message):
 
 def clear_kmsauth_token_cache(config, cache):
     cache_key = 'kmsauth-{}'.format(config['awsregion'])
-    kmsauth_cache = {
-        'token': None,
-        'Expiration': '20160101T000000Z'
-    }
-    cache.set(cache_key, kmsauth_cache)
+    # Expires now, and is dropped from the file when it is saved
+    cache.set(cache_key, None, 0)
     cache.save()
 
 
-def get_kmsauth_token(creds, config, username, cache):
+def get_kmsauth_token(creds, config, username, cache, native_creds=None, min_lifetime=0):
+    """ Get a kmsauth token for config['awsregion'], from the cache if possible
+    Args:
+        creds: User credentials, or None for the default search
+        config (dict): kmsauth config
+        username (str): the kmsauth 'from' context
+        cache (BlessCache): the bless cache
+        native_creds (dict): credentials to call KMS with directly, or None to use kmsauth
+        min_lifetime (int): get a new token if the cached one expires within this many seconds
+    Returns (str): kmsauth token
+    """
     cache_key = 'kmsauth-{}'.format(config['awsregion'])
-    kmsauth_cache = cache.get(cache_key)
-    if kmsauth_cache:
-        expiration = time.strptime(
-            kmsauth_cache['Expiration'], '%Y%m%dT%H%M%SZ')
-        if expiration > time.gmtime() and kmsauth_cache['token'] is not None:
-            logging.debug(
-                'Using cached kmsauth token, good until {}'.format(kmsauth_cache['Expiration']))
-            return kmsauth_cache['token']
+    remaining = cache.ttl(cache_key)
+    if (remaining or 0) > min_lifetime:
+        logging.debug('Using cached kmsauth token, good for {:.0f} more seconds'.format(remaining))
+        return cache.get(cache_key)
 
     config['context'].update({'from': username})
-    try:
-        token = kmsauth.KMSTokenGenerator(
-            config['kmskey'],
-            config['context'],
-            config['awsregion'],
-            aws_creds=creds,
-            token_lifetime=60
-        ).get_token().decode('US-ASCII')
-    except kmsauth.ServiceConnectionError:
-        logging.debug("Network failure for kmsauth")
-        raise LambdaInvocationException('Connection error getting kmsauth token.')
+    if native_creds is not None:
+        token = aws_native.generate_kmsauth_token(
+            native_creds, config['kmskey'], config['context'], config['awsregion'], 60)
+    else:
+        import kmsauth
+
+        try:
+            token = kmsauth.KMSTokenGenerator(
+                config['kmskey'],
+                config['context'],
+                config['awsregion'],
+                aws_creds=creds,
+                token_lifetime=60
+            ).get_token().decode('US-ASCII')
+        except kmsauth.ServiceConnectionError:
+            logging.debug("Network failure for kmsauth")
+            raise LambdaInvocationException('Connection error getting kmsauth token.')
     # We have to manually calculate expiration the same way kmsauth does
-    lifetime = 60 - (kmsauth.TOKEN_SKEW * 2)
+    lifetime = 60 - (aws_native.KMSAUTH_TOKEN_SKEW * 2)
     if lifetime > 0:
-        expiration = datetime.datetime.utcnow() + datetime.timedelta(minutes=lifetime)
-        kmsauth_cache = {
-            'token': token,
-            'Expiration': expiration.strftime('%Y%m%dT%H%M%SZ')
-        }
-        cache.set(cache_key, kmsauth_cache)
+        cache.set(cache_key, token, lifetime * 60)
         cache.save()
     return token
 
@@ -370,13 +390,36 @@ def setup_logging():
         logging.basicConfig(level=logging.CRITICAL)
 
 
-def get_bless_cache(nocache, bless_config):
+def get_bless_cache_file(bless_config):
+    """ Returns (str): path to the bless cache """
     client_config = bless_config.get_client_config()
-    cachedir = os.path.join(
-        os.path.expanduser('~'),
-        client_config['cache_dir'])
+    return os.path.join(os.path.expanduser('~'), client_config['cache_dir'], client_config['cache_file'])
+
+
+def get_bless_cache(nocache, bless_config):
+    cachedir, cachefile = os.path.split(get_bless_cache_file(bless_config))
     cachemode = BlessCache.CACHEMODE_RECACHE if nocache else BlessCache.CACHEMODE_ENABLED
-    return BlessCache(cachedir, client_config['cache_file'], cachemode)
+    return BlessCache(cachedir, cachefile, cachemode)
+
+
+def get_mtime(filename):
+    """ Returns (float): the modification time of filename, or None if it doesn't exist """
+    try:
+        return os.path.getmtime(filename)
+    except OSError:
+        return None
+
+
+def get_user_ip(bless_config, bless_cache):
+    """ The UserIP for the configured ip_urls, or BLESSFIXEDIP """
+    client_config = bless_config.get_client_config()
+    return UserIP(
+        bless_cache=bless_cache,
+        maxcachetime=bless_config.get_lambda_config()['ipcachelifetime'],
+        ip_urls=client_config['ip_urls'],
+        fixed_ip=os.getenv('BLESSFIXEDIP', False),
+        lookup=client_config.get('ip_lookup', UserIP.LOOKUP_SEQUENTIAL),
+        timeout=client_config.get('ip_timeout', UserIP.TIMEOUT))
 
 
 def make_cachable_creds(token_data):
@@ -386,6 +429,25 @@ def make_cachable_creds(token_data):
     return _token_data
 
 
+def get_cached_role_creds(bless_cache, key, min_lifetime=0):
+    """ Role credentials from the cache, with the Expiration as a datetime like the ones from STS
+    Args:
+        min_lifetime (int): None if the credentials expire within this many seconds
+    Returns (dict): the credentials, or None
+    """
+    if (bless_cache.ttl(key) or 0) <= min_lifetime:
+        return None
+    role_creds = dict(bless_cache.get(key))
+    role_creds['Expiration'] = datetime.datetime.strptime(
+        role_creds['Expiration'], '%Y%m%dT%H%M%SZ').replace(tzinfo=datetime.timezone.utc)
+    return role_creds
+
+
+def get_creds_ttl(token_data):
+    """ Returns (float): the seconds until assumed role credentials expire """
+    return calendar.timegm(token_data['Expiration'].utctimetuple()) - time.time()
+
+
 def uncache_creds(cached_data):
     if cached_data and 'Expiration' in cached_data.keys():
         _cached_data = copy.deepcopy(cached_data)
@@ -415,8 +477,13 @@ def load_cached_creds(bless_config):
 
     cached_data = {}
     with open(cache_file_path, 'r') as cache:
-        cached_data = uncache_creds(json.load(cache))
-        if cached_data['Expiration'] < time.gmtime():
+        try:
+            cached_data = uncache_creds(json.load(cache))
+            expired = cached_data['Expiration'] < time.gmtime()
+        except (ValueError, KeyError, TypeError):
+            logging.error("Corrupted credentials cache, ignoring it")
+            return {}
+        if expired:
             cached_data = {}
     return cached_data
 
@@ -438,8 +505,7 @@ def save_cached_creds(token_data, bless_config):
 
     cache_file_path = os.path.join(cachedir, client_config['mfa_cache_file'])
     _token_data = make_cachable_creds(token_data)
-    with open(cache_file_path, 'w') as cache:
-        json.dump(_token_data, cache)
+    write_json(cache_file_path, _token_data)
 
 
 def ssh_agent_remove_bless(identity_file):
@@ -472,7 +538,23 @@ def ssh_agent_add_bless(identity_file):
             "Couldn't add identity to ssh-agent")
 
 
+def write_cert(identity_file, cert, update_sshagent=True):
+    """ Replace identity_file's certificate. The file is renamed into place, so ssh never
+    reads a partly written certificate.
+    Args:
+        cert (str): the new certificate
+        update_sshagent (bool): load the identity into the running ssh-agent
+    """
+    # Remove RSA identity from ssh-agent (if it exists)
+    ssh_agent_remove_bless(identity_file)
+    write_atomic(identity_file + '-cert.pub', cert, 0o644)
+    if update_sshagent:
+        ssh_agent_add_bless(identity_file)
+
+
 def generate_ssh_key(identity_file, public_key_file):
+    from Cryptodome.PublicKey import RSA
+
     ssh_folder = os.path.dirname(identity_file)
     if not os.path.exists(ssh_folder):
         sys.stderr.write("Creating folder {}\n".format(ssh_folder))
@@ -504,6 +586,8 @@ def get_username(aws, bless_cache):
         if 'AWS_USER' in os.environ:
             username = os.environ['AWS_USER'].split('/')[1]
     if not username:
+        from botocore.exceptions import ClientError
+
         try:
             user = aws.iam_client().get_user()['User']
         except ClientError:
@@ -513,7 +597,7 @@ def get_username(aws, bless_cache):
             except ClientError as e:
                 if e.response.get('Error', {}).get('Code') == 'SignatureDoesNotMatch':
                     sys.stderr.write(
-                        "Your authentication signature was rejected by AWS; try checking your system " +
+                        "Your authentication signature was rejected by AWS; try checking your system "
                         "date & timezone settings are correct\n")
                     raise
 
@@ -529,10 +613,27 @@ def get_username(aws, bless_cache):
     return username
 
 
-def check_fresh_cert(cert_file, blessconfig, bless_cache, userIP, ip_list=None):
+def is_cert_expired(cert_file, blessconfig, refresh_margin=0):
+    """ Check if the cert is missing or too old to use, whatever the user's IP
+    Args:
+        refresh_margin (int): seconds before expiry that the cert stops counting as fresh
+    Returns (bool):
+    """
+    if not os.path.isfile(cert_file):
+        return True
+    certlife = time.time() - os.path.getmtime(cert_file)
+    return certlife >= float(blessconfig['certlifetime'] - 15 - refresh_margin)
+
+
+def check_fresh_cert(cert_file, blessconfig, bless_cache, userIP, ip_list=None, refresh_margin=0):
+    """ Check the cert can still be used
+    Args:
+        refresh_margin (int): seconds before expiry that the cert stops counting as fresh
+    Returns (bool):
+    """
     if os.path.isfile(cert_file):
         certlife = time.time() - os.path.getmtime(cert_file)
-        if certlife < float(blessconfig['certlifetime'] - 15):
+        if certlife < float(blessconfig['certlifetime'] - 15 - refresh_margin):
             if (certlife < float(blessconfig['ipcachelifetime'])
                 or bless_cache.get('certip') == userIP.getIP()
             ):
@@ -541,6 +642,94 @@ def check_fresh_cert(cert_file, blessconfig, bless_cache, userIP, ip_list=None):
     return False
 
 
+def get_bless_lambda(bless_config, role_creds, kmsauth_token, region):
+    """ Create the BlessLambda for the configured aws_transport
+    Args:
+        bless_config (BlessConfig): Loaded BlessConfig
+        role_creds (dict): credentials of the use-bless role
+        kmsauth_token (str): kmsauth token for region
+        region (str): the AWS region code (e.g., 'us-east-1')
+    Returns: BlessLambda (boto3) or BlessLambdaHTTP (native)
+    """
+    if bless_config.get_client_config().get('aws_transport') == 'native':
+        return BlessLambdaHTTP(bless_config.get_lambda_config(), role_creds, kmsauth_token, region)
+    return BlessLambda(bless_config.get_lambda_config(), role_creds, kmsauth_token, region)
+
+
+def is_valid_cert(cert):
+    return isinstance(cert, six.string_types) and cert[:29] == 'ssh-rsa-cert-v01@openssh.com '
+
+
+def invoke_bless_lambda(bless_config, bless_cache, role_creds, kmsauth_token, region, username, payload):
+    """ Get a cert from the BLESS Lambda in region. With lambda_hedge_percentile set, the
+    Lambdas in the next regions are asked too, one by one, when region takes longer than usual.
+    Args:
+        bless_config (BlessConfig): Loaded BlessConfig
+        bless_cache (BlessCache): where the Lambda latencies are kept
+        role_creds (dict): credentials of the use-bless role
+        kmsauth_token (str): kmsauth token for region
+        region (str): the AWS region to ask first
+        username (str): the kmsauth 'from' context, for the other regions' tokens
+        payload (dict): the signing request
+    Returns (str): the Lambda's answer, a cert if all went well
+    """
+    def invoke(region, kmsauth_token):
+        start = time.time()
+        cert = get_bless_lambda(bless_config, role_creds, kmsauth_token, region).getCert(dict(payload))
+        if is_valid_cert(cert):
+            hedge.record_latency(bless_cache, region, time.time() - start)
+        return cert
+
+    percentile = bless_config.get_client_config().get('lambda_hedge_percentile', 0)
+    regions = get_regions(region, bless_config)
+    if not percentile or len(regions) < 2:
+        return invoke(region, kmsauth_token)
+
+    def invoke_region(region):
+        def call():
+            token = get_kmsauth_token(
+                None, get_kmsauth_config(region, bless_config), username, bless_cache,
+                native_creds=get_native_creds(None, bless_config))
+            return invoke(region, token)
+        return call
+
+    calls = [lambda: invoke(region, kmsauth_token)] + [invoke_region(r) for r in regions[1:]]
+    index, cert = hedge.first_valid(
+        calls, hedge.get_hedge_delay(bless_cache, region, percentile), is_valid_cert)
+    if index > 0:
+        logging.info('Got the cert from the hedged request to {}'.format(regions[index]))
+    return cert
+
+
+def get_default_ip_list(my_ip, bless_config):
+    """ The ip list used when the housekeeper can't tell us the private ip of the host
+    Args:
+        my_ip (str): the user's public ip
+        bless_config (BlessConfig): Loaded BlessConfig
+    Returns (str): comma separated list of ips
+    """
+    if 'bastion_ips' in bless_config.get_aws_config():
+        return "{},{}".format(my_ip, bless_config.get_aws_config()['bastion_ips'])
+    return '{}'.format(my_ip)
+
+
+def get_cached_ip_list(region, hostname, my_ip, bless_config, bless_cache):
+    """ Get the ip list for hostname without calling AWS
+    Args:
+        region (str): the AWS region code (e.g., 'us-east-1')
+        hostname (str): host we are connecting to
+        my_ip (str): the user's public ip
+        bless_config (BlessConfig): Loaded BlessConfig
+        bless_cache (BlessCache): BlessCache object
+    Returns (str): comma separated list of ips, or None if the housekeeper must be asked
+    """
+    if get_housekeeper_config(region, bless_config) is None:
+        return get_default_ip_list(my_ip, bless_config)
+    if hostname is not None and bless_cache.get('remote_host') == hostname:
+        return bless_cache.get('bastion_ips')
+    return None
+
+
 def load_config(bless_config, config_filename=None, force_download_config=False, s3_bucket=None):
     """
     Returns (boolean):
@@ -552,16 +741,14 @@ def load_config(bless_config, config_filename=None, force_download_config=False,
     if config_filename is None:
         config_filename = get_default_config_filename()
     try:
-        with open(config_filename, 'r') as f:
-            bless_config.set_config(bless_config.parse_config_file(f))
+        bless_config.load_config_file(config_filename)
     except FileNotFoundError as e:
         if config_filename is None:
             if download_config_from_s3():
                 home_dir = os.path.expanduser("~")
                 config_filename = os.path.normpath(os.path.join(home_dir, '.aws', 'blessclient.cfg'))
                 try:
-                    with open(config_filename, 'r') as f:
-                        bless_config.set_config(bless_config.parse_config_file(f))
+                    bless_config.load_config_file(config_filename)
                 except FileNotFoundError:
                     pass
         if bless_config.get_config() is None:
@@ -588,6 +775,9 @@ def download_config_from_s3(s3_bucket=None, file_location=None):
             home_dir = os.path.expanduser("~")
             file_location = os.path.normpath(os.path.join(home_dir, '.aws', 'blessclient.cfg'))
 
+        import boto3
+
+        setup_default_session()
         s3 = boto3.resource('s3')
         s3.meta.client.download_file(s3_bucket, 'blessclient/blessclient.cfg', file_location)
         sys.stderr.write('Downloaded blessclient.cfg from {} to {}\n'.format(s3_bucket, file_location))
@@ -640,17 +830,112 @@ def get_cached_auth_token(bless_cache):
     :param bless_cache: Bless cache object
     :return: Vault auth token or None if no valid token cached
     """
-    vault_creds = bless_cache.get('vault_creds')
-    if vault_creds is None or vault_creds['expiration'] is None:
+    if not bless_cache.ttl('vault_creds'):
         return None
-    else:
-        expiration = vault_creds['expiration']
-        if datetime.datetime.utcnow() < datetime.datetime.strptime(expiration, '%Y%m%dT%H%M%SZ'):
-            logging.debug(
-                'Using cached vault token, good until {}'.format(expiration))
-            return vault_creds['token']
-        else:
-            return None
+    vault_creds = bless_cache.get('vault_creds')
+    logging.debug(
+        'Using cached vault token, good until {}'.format(vault_creds['expiration']))
+    return vault_creds['token']
+
+
+def make_vault_creds(auth, username, current_time, vault_creds=None):
+    """
+    Returns the vault_creds cache entry for a Vault login or token renewal
+    :param auth: 'auth' data from Vault's response
+    :param username: Linux username the token is for
+    :param current_time: UTC time the request was sent
+    :param vault_creds: The cache entry that was renewed, or None after a login
+    :return: dict with the token, its expiration and whether it can be renewed
+    """
+    expiration = current_time + datetime.timedelta(seconds=auth['lease_duration'])
+    vault_creds = dict(
+        vault_creds or {'lease_duration': auth['lease_duration'], 'max_expiration': None},
+        token=auth['client_token'],
+        expiration=expiration.strftime('%Y%m%dT%H%M%SZ'),
+        username=username,
+        renewable=auth.get('renewable', False))
+    if auth['lease_duration'] < vault_creds['lease_duration']:
+        # Vault capped the renewal at the token's max TTL, it can't be extended further
+        vault_creds['max_expiration'] = vault_creds['expiration']
+    return vault_creds
+
+
+def get_vault_creds_ttl(auth, current_time):
+    """
+    Returns the seconds until a Vault token expires, for caching it
+    :param auth: 'auth' data from Vault's response
+    :param current_time: UTC time the request was sent
+    """
+    return auth['lease_duration'] - (datetime.datetime.utcnow() - current_time).total_seconds()
+
+
+def vault_token_renewal_due(bless_cache, min_lifetime=None):
+    """
+    Returns True if the cached Vault token should be renewed, and can be
+    :param bless_cache: Bless cache object
+    :param min_lifetime: Renew the token when fewer seconds are left, defaults to half its lease
+    """
+    remaining = bless_cache.ttl('vault_creds')
+    if not remaining:
+        return False
+    vault_creds = bless_cache.get('vault_creds')
+    if not vault_creds.get('renewable', False):
+        return False
+    if min_lifetime is None:
+        min_lifetime = vault_creds['lease_duration'] // 2
+    if remaining > min_lifetime:
+        return False
+    return vault_creds['max_expiration'] is None or vault_creds['max_expiration'] > vault_creds['expiration']
+
+
+def renew_auth_token(client, bless_cache, min_lifetime=None):
+    """
+    Renews the cached Vault token (renew-self) if it is due, see vault_token_renewal_due
+    :param client: HashiCorp Vault client
+    :param bless_cache: Bless cache object
+    :param min_lifetime: Renew the token when fewer seconds are left, defaults to half its lease
+    :return: True if the token was renewed
+    """
+    if not vault_token_renewal_due(bless_cache, min_lifetime):
+        return False
+    vault_creds = bless_cache.get('vault_creds')
+    client.token = vault_creds['token']
+    current_time = datetime.datetime.utcnow()
+    try:
+        response = client.auth.token.renew_self()
+    except Exception as e:
+        logging.info('Could not renew the vault token: {}'.format(e))
+        return False
+    vault_creds = make_vault_creds(response['auth'], vault_creds['username'], current_time, vault_creds)
+    logging.debug('Renewed vault token, good until {}'.format(vault_creds['expiration']))
+    bless_cache.set('vault_creds', vault_creds, get_vault_creds_ttl(response['auth'], current_time))
+    bless_cache.save()
+    return True
+
+
+def renew_vault_token(bless_config):
+    """
+    Renews the cached Vault token if it is due
+    :param bless_config: Loaded BlessConfig
+    :return: True if the token was renewed
+    """
+    import hvac
+
+    bless_cache = get_bless_cache(False, bless_config)
+    client = hvac.Client(url=bless_config.get('VAULT_CONFIG')['vault_addr'])
+    return renew_auth_token(client, bless_cache)
+
+
+def start_vault_token_renewal(config_filename=None):
+    """
+    Renews the cached Vault token in the background, so a fresh cert doesn't have to wait for it
+    :param config_filename: Config file for blessclient, None for the default
+    """
+    command = [sys.executable, '-m', 'blessclient.client', '--renew_vault_token']
+    if config_filename is not None:
+        command += ['--config', config_filename]
+    with open(os.devnull, 'w') as devnull:
+        subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True)
 
 
 def get_credentials():
@@ -660,45 +945,132 @@ def get_credentials():
     return username, password
 
 
-def get_env_creds(aws, client_config, kmsauth_config, username, bless_cache, bless_config):
-    role_creds = None
-    if client_config['use_env_creds']:
-        env_vars = {
-            'AWS_SECRET_ACCESS_KEY': 'SecretAccessKey',
-            'AWS_ACCESS_KEY_ID': 'AccessKeyId',
-            'AWS_EXPIRATION_S': 'Expiration',
-            'AWS_SESSION_TOKEN': 'SessionToken'
-        }
-        if all(x in os.environ for x in env_vars):
-            creds = {}
-            for env_var in env_vars.keys():
-                creds[env_vars[env_var]] = os.environ[env_var]
-                if env_var == 'AWS_EXPIRATION_S':
-                    expiration = datetime.datetime.fromtimestamp(int(os.environ[env_var]))
-                    creds[env_vars[env_var]] = expiration.strftime(DATETIME_STRING_FORMAT)
-            if expiration < datetime.datetime.now():
-                creds = None
+def get_env_creds(client_config):
+    """ Credentials from the AWS_* environment variables, when use_env_creds is set
+    Args:
+        client_config (dict): the CLIENT_CONFIG
+    Returns (dict): the credentials, or None for boto to use its default search
+    """
+    env_vars = {
+        'AWS_SECRET_ACCESS_KEY': 'SecretAccessKey',
+        'AWS_ACCESS_KEY_ID': 'AccessKeyId',
+        'AWS_EXPIRATION_S': 'Expiration',
+        'AWS_SESSION_TOKEN': 'SessionToken'
+    }
+    if not client_config['use_env_creds'] or not all(x in os.environ for x in env_vars):
+        return None
+    expiration = datetime.datetime.fromtimestamp(int(os.environ['AWS_EXPIRATION_S']))
+    if expiration < datetime.datetime.now():
+        return None
+    creds = {}
+    for env_var in env_vars.keys():
+        creds[env_vars[env_var]] = os.environ[env_var]
+    creds['Expiration'] = expiration.strftime(DATETIME_STRING_FORMAT)
+    return creds
+
+
+def env_creds_task(func):
+    """ Wrap a TaskGraph task that uses the env's creds, so that it returns None when it fails
+    (bless() then reports that the AWS session isn't working)
+    """
+    def task(*args):
         try:
-            # Try doing this with our env's creds
-            kmsauth_token = get_kmsauth_token(
-                None,
-                kmsauth_config,
-                username,
-                cache=bless_cache
-            )
-            logging.debug(
-                "Got kmsauth token by env creds: {}".format(kmsauth_token))
-            role_creds = get_blessrole_credentials(
-                aws.iam_client(), creds, bless_config, bless_cache)
-            logging.debug("Env creds used to assume role use-bless")
+            return func(*args)
         except Exception as e:
             logging.debug('Failed to use env creds: {}'.format(e))
-            pass
+            return None
+    return task
+
+
+def get_ip_list(region, hostname, my_ip, creds, aws, bless_config, bless_cache):
+    """ Get the ip list for the cert, from the housekeeper when one is configured for region
+    Args:
+        hostname (str): the host being connected to, a list of hosts for a cert that
+            works for all of them, or None for the default ip list
+        my_ip (str): the user's public IP
+        creds: User credentials to assume the housekeeper role with, or None for the default search
+    Returns (tuple): the remote ip (or None) and the ip list
+    """
+    housekeeper_config = get_housekeeper_config(region, bless_config)
+    if housekeeper_config is None or hostname is None:
+        return None, get_default_ip_list(my_ip, bless_config)
+    if isinstance(hostname, list):
+        return None, get_fleet_ip_list(region, hostname, my_ip, creds, aws, bless_config, bless_cache)
+
+    ip = None
+    ip_list = None
+    role_creds_hk = get_housekeeperrole_credentials(aws, creds, housekeeper_config, bless_config, bless_cache)
+    housekeeper = HousekeeperLambda(housekeeper_config, role_creds_hk, region)
+    if is_valid_ipv4_address(hostname):
+        ip = hostname
+    else:
+        bastion_list = housekeeper.getPrivateIpFromPublicName(hostname)
+        if bastion_list is not None:
+            bastion_list = ','.join(bastion_list)
+            ip_list = "{},{}".format(my_ip, bastion_list)
+        else:
+            ip = socket.gethostbyname(hostname)
+    if ip is not None and ip_list is None:
+        if bless_cache.get('remote_ip') == ip:
+            ip_list = bless_cache.get('bastion_ips')
+        else:
+            private_ip = housekeeper.getPrivateIpFromPublic(ip)
+            if private_ip is not None:
+                ip_list = "{},{}".format(my_ip, private_ip)
+            else:
+                ip_list = get_default_ip_list(my_ip, bless_config)
+    elif ip_list is None:
+        ip_list = get_default_ip_list(my_ip, bless_config)
+    return ip, ip_list
 
-    if role_creds is None:
-        return [None, None, None]
 
-    return [creds, role_creds, kmsauth_token]
+def get_fleet_ip_list(region, hostnames, my_ip, creds, aws, bless_config, bless_cache):
+    """ The union of the ip lists of hostnames, looked up in parallel
+    Args:
+        hostnames (list): the hosts being connected to
+        See get_ip_list() for the rest
+    Returns (str): comma separated list of ips, my_ip first
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def lookup(hostname):
+        return get_ip_list(region, hostname, my_ip, creds, aws, bless_config, bless_cache)[1]
+
+    # Assume the housekeeper role once, rather than in every lookup
+    get_housekeeperrole_credentials(aws, creds, get_housekeeper_config(region, bless_config), bless_config, bless_cache)
+    ips = []
+    with ThreadPoolExecutor(max_workers=max(1, min(len(hostnames), FLEET_LOOKUPS))) as executor:
+        for ip_list in executor.map(lookup, hostnames):
+            ips.extend(ip for ip in ip_list.split(',') if ip not in ips)
+    return ','.join(ips)
+
+
+def prewarm(bless_config, aws=None, bless_cache=None, min_lifetime=0):
+    """ Fill the bless cache with use-bless role credentials and a kmsauth token for every
+    region in REGION_ALIAS, so failing over to another region only costs the Lambda call
+    Args:
+        bless_config (BlessConfig): Loaded BlessConfig
+        aws (BlessAWS): AWS clients to reuse, if any
+        bless_cache (BlessCache): bless cache to reuse, if any
+        min_lifetime (int): renew the role credentials and tokens that expire within this many seconds
+    Returns (list): the regions that have a kmsauth token
+    """
+    aws = aws or BlessAWS()
+    bless_cache = bless_cache or get_bless_cache(False, bless_config)
+    username = get_username(aws, bless_cache)
+    # The use-bless role credentials come from STS, so one set serves all regions
+    get_blessrole_credentials(aws, None, bless_config, bless_cache, min_lifetime)
+    native_creds = get_native_creds(None, bless_config)
+    regions = []
+    for region in bless_config.get_aws_regions():
+        try:
+            get_kmsauth_token(
+                None, get_kmsauth_config(region, bless_config), username, bless_cache, native_creds, min_lifetime)
+        except Exception as e:
+            logging.info('Could not get a kmsauth token for {}: {}'.format(region, e))
+            continue
+        regions.append(region)
+    return regions
 
 
 def auth_okta(client, auth_mount, bless_cache):
@@ -712,7 +1084,8 @@ def auth_okta(client, auth_mount, bless_cache):
 
     vault_auth_token = get_cached_auth_token(bless_cache)
     if vault_auth_token is not None:
-        client.token = vault_auth_token
+        renew_auth_token(client, bless_cache)
+        client.token = bless_cache.get('vault_creds')['token']
         username = get_linux_username(bless_cache.get('vault_creds')['username'])
         return client, get_linux_username(username)
     else:
@@ -724,44 +1097,27 @@ def auth_okta(client, auth_mount, bless_cache):
         auth_url = '/v1/auth/{0}/login/{1}'.format(auth_mount, username)
         response = client.auth(auth_url, json=auth_params)
 
-        token = response['auth']['client_token']
-        expiration = current_time + datetime.timedelta(seconds=response['auth']['lease_duration'])
         username = get_linux_username(response['auth']['metadata']['username'])
-        vault_credentials_cache = {
-            "token": token,
-            "expiration": expiration.strftime('%Y%m%dT%H%M%SZ'),
-            "username": username
-        }
-        bless_cache.set('vault_creds', vault_credentials_cache)
+        vault_credentials_cache = make_vault_creds(response['auth'], username, current_time)
+        bless_cache.set('vault_creds', vault_credentials_cache, get_vault_creds_ttl(response['auth'], current_time))
         bless_cache.save()
         return client, get_linux_username(username)
 
 
-def vault_bless(nocache, bless_config):
+def vault_bless(nocache, bless_config, config_filename=None):
 
     vault_addr = bless_config.get('VAULT_CONFIG')['vault_addr']
     auth_mount = bless_config.get('VAULT_CONFIG')['auth_mount']
     bless_cache = get_bless_cache(nocache, bless_config)
     bless_lambda_config = bless_config.get_lambda_config()
 
-    user_ip = UserIP(
-        bless_cache=bless_cache,
-        maxcachetime=bless_lambda_config['ipcachelifetime'],
-        ip_urls=bless_config.get_client_config()['ip_urls'],
-        fixed_ip=os.getenv('BLESSFIXEDIP', False))
+    user_ip = get_user_ip(bless_config, bless_cache)
 
     # Print feedback?
     show_feedback = get_stderr_feedback()
 
-    # Create client to connect to HashiCorp Vault
-    client = hvac.Client(url=vault_addr)
-
     # Identify the SSH key to be used
-    clistring = psutil.Process(os.getppid()).cmdline()
-    identity_file = get_idfile_from_cmdline(
-        clistring,
-        os.getenv('HOME', os.getcwd()) + '/.ssh/blessid'
-    )
+    identity_file = get_identity_file(os.getenv('HOME', os.getcwd()) + '/.ssh/blessid')
     # Define the certificate to be created
     cert_file = identity_file + '-cert.pub'
 
@@ -771,7 +1127,14 @@ def vault_bless(nocache, bless_config):
     if nocache is not True:
         if check_fresh_cert(cert_file, bless_lambda_config, bless_cache, user_ip):
             logging.debug("Already have fresh cert")
-            sys.exit(0)
+            if vault_token_renewal_due(bless_cache):
+                start_vault_token_renewal(config_filename)
+            return
+
+    import hvac
+
+    # Create client to connect to HashiCorp Vault
+    client = hvac.Client(url=vault_addr)
 
     # Print feedback information
     if show_feedback:
@@ -781,44 +1144,71 @@ def vault_bless(nocache, bless_config):
         )
 
     # Identify and load the public key to be signed
-    public_key_file = identity_file + '.pub'
-    with open(public_key_file, 'r') as f:
+    public_key = read_public_key(identity_file)
+
+    # Authenticate user with HashiCorp Vault
+    client, linux_username = auth_okta(client, auth_mount, bless_cache)
+
+    client, linux_username, cert = get_vault_cert(client, auth_mount, bless_config, linux_username, public_key)
+    check_vault_cert(cert, nocache)
+
+    # Remove old certificate, replacing with new certificate
+    write_cert(identity_file, cert)
+
+    # bless_cache.set('certip', my_ip)
+    # bless_cache.save()
+
+    logging.debug("Successfully issued cert!")
+    if show_feedback:
+        sys.stderr.write("Finished getting certificate.\n")
+
+
+def read_public_key(identity_file):
+    """ Returns (str): the public key of identity_file
+    Raises: Exception if it isn't an ssh-rsa key
+    """
+    with open(identity_file + '.pub', 'r') as f:
         public_key = f.read()
 
     # Only sign public keys in correct format.
     if public_key[:8] != 'ssh-rsa ':
         raise Exception(
             'Refusing to bless {}. Probably not an identity file.'.format(identity_file))
+    return public_key
 
-    # Authenticate user with HashiCorp Vault
-    client, linux_username = auth_okta(client, auth_mount, bless_cache)
 
-    payload = {
-        'valid_principals': linux_username,
-        'public_key': public_key,
-        'ttl': bless_config.get('BLESS_CONFIG')['certlifetime'],
-        'ssh_backend_mount': bless_config.get('VAULT_CONFIG')['ssh_backend_mount'],
-        'ssh_backend_role': bless_config.get('VAULT_CONFIG')['ssh_backend_role']
-    }
+def get_vault_cert(client, auth_mount, bless_config, linux_username, public_key):
+    """ Get a cert for public_key from Vault, logging in again if Vault refuses the cached token
+    Returns (tuple): the Vault client, the linux username and what Vault returned
+    """
+    import hvac
 
-    vault_ca = VaultCA(client)
     try:
-        cert = vault_ca.getCert(payload)
+        return client, linux_username, VaultCA(client).getCert(
+            get_vault_payload(bless_config, linux_username, public_key))
     except hvac.exceptions.Forbidden:
         bless_cache = get_bless_cache(True, bless_config)
         client, linux_username = auth_okta(client, auth_mount, bless_cache)
+        return client, linux_username, VaultCA(client).getCert(
+            get_vault_payload(bless_config, linux_username, public_key))
 
-        payload = {
-            'valid_principals': linux_username,
-            'public_key': public_key,
-            'ttl': bless_config.get('BLESS_CONFIG')['certlifetime'],
-            'ssh_backend_mount': bless_config.get('VAULT_CONFIG')['ssh_backend_mount'],
-            'ssh_backend_role': bless_config.get('VAULT_CONFIG')['ssh_backend_role']
-        }
 
-        vault_ca = VaultCA(client)
-        cert = vault_ca.getCert(payload)
+def get_vault_payload(bless_config, linux_username, public_key):
+    """ Returns (dict): the VaultCA.getCert() payload for public_key """
+    return {
+        'valid_principals': linux_username,
+        'public_key': public_key,
+        'ttl': bless_config.get('BLESS_CONFIG')['certlifetime'],
+        'ssh_backend_mount': bless_config.get('VAULT_CONFIG')['ssh_backend_mount'],
+        'ssh_backend_role': bless_config.get('VAULT_CONFIG')['ssh_backend_role']
+    }
+
 
+def check_vault_cert(cert, nocache):
+    """ Raise an exception if Vault didn't return a cert
+    Args:
+        cert (str): what Vault returned
+    """
     logging.debug("Got back cert: {}".format(cert))
 
     # Error handling
@@ -848,120 +1238,17 @@ def vault_bless(nocache, bless_config):
         raise LambdaInvocationException(
             'BLESS client did not recieve a valid cert. Instead got: {}'.format(cert))
 
-    # Remove old certificate, replacing with new certificate
-    ssh_agent_remove_bless(identity_file)
-    with open(cert_file, 'w') as cert_file:
-        cert_file.write(cert)
-    ssh_agent_add_bless(identity_file)
-
-    # bless_cache.set('certip', my_ip)
-    # bless_cache.save()
-
-    logging.debug("Successfully issued cert!")
-    if show_feedback:
-        sys.stderr.write("Finished getting certificate.\n")
-
 
-def bless(region, nocache, showgui, hostname, bless_config, username=None):
-    # Setup loggging
-    setup_logging()
+def issue_cert(bless_config, bless_cache, role_creds, kmsauth_token, kmsauth_config, region, username, identity_file,
+               my_ip, ip_list, nocache):
+    """ Get a cert for the identity file's public key from the BLESS Lambda, write it next to
+    the identity file and load it into the ssh-agent
+    Args:
+        kmsauth_config (dict): kmsauth config for region, to purge a rejected token
+        See bless() for the rest
+    """
     show_feedback = get_stderr_feedback()
-    logging.debug("Starting...")
-
-    if os.getenv('MFA_ROLE', '') != '':
-        awsmfautils.unset_token()
-
-    aws = BlessAWS()
-    bless_cache = get_bless_cache(nocache, bless_config)
-    update_client(bless_cache, bless_config)
-    bless_lambda_config = bless_config.get_lambda_config()
-
-    userIP = UserIP(
-        bless_cache=bless_cache,
-        maxcachetime=bless_lambda_config['ipcachelifetime'],
-        ip_urls=bless_config.get_client_config()['ip_urls'],
-        fixed_ip=os.getenv('BLESSFIXEDIP', False))
-    my_ip = userIP.getIP()
-
-    if username is None:
-        username = get_username(aws, bless_cache)
-
-    clistring = psutil.Process(os.getppid()).cmdline()
-    identity_file = get_idfile_from_cmdline(
-        clistring,
-        os.path.expanduser('~/.ssh/blessid'),
-    )
-    cert_file = identity_file + '-cert.pub'
-
-    logging.debug("Using identity file: {}".format(identity_file))
-
-    role_creds = None
-    kmsauth_config = get_kmsauth_config(region, bless_config)
-    client_config = bless_config.get_client_config()
-    creds, role_creds, kmsauth_token = get_env_creds(aws, client_config, kmsauth_config, username, bless_cache, bless_config)
-
-    if role_creds is None:
-        sys.stderr.write('AWS session not working. Check blessclient.cfg and verify the aws session?\n')
-        sys.exit(1)
-
-    ip_list = None
-    ip = None
-    if get_housekeeper_config(region, bless_config) is None:
-        ip = None
-        if 'bastion_ips' in bless_config.get_aws_config():
-            ip_list = "{},{}".format(my_ip, bless_config.get_aws_config()['bastion_ips'])
-        else:
-            ip_list = '{}'.format(my_ip)
-    else:
-        try:
-            role_creds_hk = get_housekeeperrole_credentials(
-                aws.iam_client(), creds, get_housekeeper_config(region, bless_config), bless_config, bless_cache)
-            housekeeper = HousekeeperLambda(get_housekeeper_config(region, bless_config), role_creds_hk, region)
-            if is_valid_ipv4_address(hostname):
-                ip = hostname
-            else:
-                bastion_list = housekeeper.getPrivateIpFromPublicName(hostname)
-                if bastion_list is not None:
-                    bastion_list = ','.join(bastion_list)
-                    ip_list = "{},{}".format(my_ip, bastion_list)
-                else:
-                    ip = socket.gethostbyname(hostname)
-            if ip is not None and ip_list is None:
-                if bless_cache.get('remote_ip') == ip:
-                    ip_list = bless_cache.get('bastion_ips')
-                else:
-                    private_ip = housekeeper.getPrivateIpFromPublic(ip)
-                    if private_ip is not None:
-                        ip_list = "{},{}".format(my_ip, private_ip)
-                    else:
-                        if 'bastion_ips' in bless_config.get_aws_config():
-                            ip_list = "{},{}".format(my_ip, bless_config.get_aws_config()['bastion_ips'])
-                        else:
-                            ip_list = '{}'.format(my_ip)
-            elif ip_list is None:
-                if 'bastion_ips' in bless_config.get_aws_config():
-                    ip_list = "{},{}".format(my_ip, bless_config.get_aws_config()['bastion_ips'])
-                else:
-                    ip_list = '{}'.format(my_ip)
-        except Exception as e:
-            if 'bastion_ips' in bless_config.get_aws_config():
-                ip_list = "{},{}".format(my_ip, bless_config.get_aws_config()['bastion_ips'])
-            else:
-                ip_list = '{}'.format(my_ip)
-            raise e
-
-    if nocache is not True:
-        if check_fresh_cert(cert_file, bless_lambda_config, bless_cache, userIP, ip_list):
-            logging.debug("Already have fresh cert")
-            return {"username": username}
 
-    bless_cache.set('bastion_ips', ip_list)
-    bless_cache.set('remote_ip', ip)
-    bless_cache.save()
-
-    bless_lambda = BlessLambda(bless_lambda_config, role_creds, kmsauth_token, region)
-
-    # Do bless
     if show_feedback:
         sys.stderr.write(
             "Requesting certificate for your public key"
@@ -989,7 +1276,7 @@ def bless(region, nocache, showgui, hostname, bless_config, username=None):
         'command': '*',
         'public_key_to_sign': public_key,
     }
-    cert = bless_lambda.getCert(payload)
+    cert = invoke_bless_lambda(bless_config, bless_cache, role_creds, kmsauth_token, region, username, payload)
 
     logging.debug("Got back cert: {}".format(cert))
 
@@ -1019,15 +1306,10 @@ def bless(region, nocache, showgui, hostname, bless_config, username=None):
         raise LambdaInvocationException(
             'BLESS client did not recieve a valid cert. Instead got: {}'.format(cert))
 
-    # Remove RSA identity from ssh-agent (if it exists)
-    ssh_agent_remove_bless(identity_file)
-    with open(cert_file, 'w') as cert_file:
-        cert_file.write(cert)
-
     # Check if we can skip adding identity into the running ssh-agent
-    if bless_config.get_client_config()['update_sshagent'] is True:
-        ssh_agent_add_bless(identity_file)
-    else:
+    update_sshagent = bless_config.get_client_config()['update_sshagent'] is True
+    write_cert(identity_file, cert, update_sshagent)
+    if not update_sshagent:
         logging.info(
             "Skipping loading identity into the running ssh-agent "
             'because this was disabled in the blessclient config.')
@@ -1035,11 +1317,411 @@ def bless(region, nocache, showgui, hostname, bless_config, username=None):
     bless_cache.set('certip', my_ip)
     bless_cache.save()
 
-    logging.debug("Successfully issued cert!")
-    if show_feedback:
-        sys.stderr.write("Finished getting certificate.\n")
 
-    return {"username": username}
+def issue_cert_once(bless_config, bless_cache, role_creds, kmsauth_token, kmsauth_config, region, username,
+                    identity_file, my_ip, ip, ip_list, hostname, nocache, cert_mtime, user_ip, refresh_margin=0):
+    """ issue_cert(), by only one blessclient at a time for this key and ip list. If another
+    one got a fresh cert while this one was waiting, that cert is used.
+    Args:
+        ip (str): the remote host's IP
+        hostname (str): the remote host
+        cert_mtime (float): modification time of the cert when it was found not to be fresh
+        user_ip (UserIP): the user's public IP
+        See issue_cert() for the rest
+    Returns (bool): True if this blessclient got the cert
+    """
+    bless_lambda_config = bless_config.get_lambda_config()
+    cert_file = identity_file + '-cert.pub'
+    with single_flight.lock(os.path.dirname(get_bless_cache_file(bless_config)), identity_file + ip_list):
+        if get_mtime(cert_file) != cert_mtime and check_fresh_cert(
+                cert_file, bless_lambda_config, get_bless_cache(False, bless_config), user_ip, ip_list, refresh_margin):
+            logging.debug("Another blessclient just got a fresh cert")
+            return False
+
+        bless_cache.set('bastion_ips', ip_list)
+        bless_cache.set('remote_ip', ip)
+        bless_cache.set('remote_host', hostname)
+        bless_cache.save()
+
+        issue_cert(bless_config, bless_cache, role_creds, kmsauth_token, kmsauth_config, region, username,
+                   identity_file, my_ip, ip_list, nocache)
+        # The blessclients waiting for the lock check the new cert against the cache
+        bless_cache.flush()
+    return True
+
+
+def get_cert_inputs(region, hostname, my_ip, username, user_ip, creds, aws, bless_config, bless_cache):
+    """ Get what the BLESS Lambda needs for a cert. The public IP, the kmsauth token, the
+    use-bless role and the housekeeper lookup don't depend on each other, so they are
+    fetched in parallel.
+    Args:
+        my_ip (str): the user's public IP, or None to look it up
+        username (str): the bastion user, or None to look it up
+        user_ip (UserIP): the user's public IP
+        creds: User credentials from the env, or None for the default search
+        See get_ip_list() for the rest
+    Returns (dict): my_ip, username, kmsauth_token and role_creds (None if the env's creds
+        don't work), and ip_list: the remote ip and the ip list
+    """
+    kmsauth_config = get_kmsauth_config(region, bless_config)
+    graph = TaskGraph()
+    graph.add('my_ip', lambda: my_ip or user_ip.getIP())
+    graph.add('username', lambda: username or get_username(aws, bless_cache))
+    graph.add('kmsauth_token', env_creds_task(lambda username: get_kmsauth_token(
+        None, kmsauth_config, username, cache=bless_cache, native_creds=get_native_creds(None, bless_config))),
+        ['username'])
+    # The role is assumed after get_username, which caches the user's arn for it
+    graph.add('role_creds', env_creds_task(
+        lambda username: get_blessrole_credentials(aws, creds, bless_config, bless_cache)), ['username'])
+    graph.add('ip_list', lambda my_ip: get_ip_list(
+        region, hostname, my_ip, creds, aws, bless_config, bless_cache), ['my_ip'])
+    return graph.run()
+
+
+def bless(region, nocache, showgui, hostname, bless_config, username=None, identity_file=None, aws=None,
+          bless_cache=None, refresh_margin=0):
+    """ Get a certificate from the BLESS Lambda in region, unless the current one is fresh
+    Args:
+        identity_file (str): the identity file, found from the parent's command line if None
+        aws (BlessAWS): AWS clients to reuse, if any
+        bless_cache (BlessCache): bless cache to reuse, if any
+        refresh_margin (int): also renew a cert that expires within this many seconds
+    Returns (dict): the username the certificate is for
+    """
+    # Setup loggging
+    setup_logging()
+    show_feedback = get_stderr_feedback()
+    logging.debug("Starting...")
+
+    if os.getenv('MFA_ROLE', '') != '':
+        awsmfautils.unset_token()
+
+    aws = aws or BlessAWS()
+    bless_cache = bless_cache or get_bless_cache(nocache, bless_config)
+    # bless() saves the cache many times, only write it once
+    with bless_cache.coalesce():
+        update_client(bless_cache, bless_config)
+        bless_lambda_config = bless_config.get_lambda_config()
+
+        userIP = get_user_ip(bless_config, bless_cache)
+
+        identity_file = identity_file or get_identity_file(os.path.expanduser('~/.ssh/blessid'))
+        cert_file = identity_file + '-cert.pub'
+        cert_mtime = get_mtime(cert_file)
+
+        logging.debug("Using identity file: {}".format(identity_file))
+
+        # Check the cert before touching AWS, when the ip list is known without a lookup.
+        # A cert that is too old doesn't need the IP to tell.
+        my_ip = None
+        if nocache is not True and not is_cert_expired(cert_file, bless_lambda_config, refresh_margin):
+            my_ip = userIP.getIP()
+            username = username or get_username(aws, bless_cache)
+            ip_list = get_cached_ip_list(region, hostname, my_ip, bless_config, bless_cache)
+            if ip_list is not None and check_fresh_cert(
+                    cert_file, bless_lambda_config, bless_cache, userIP, ip_list, refresh_margin):
+                logging.debug("Already have fresh cert")
+                return {"username": username}
+
+        client_config = bless_config.get_client_config()
+        if not client_config['use_env_creds']:
+            sys.stderr.write('AWS session not working. Check blessclient.cfg and verify the aws session?\n')
+            sys.exit(1)
+        kmsauth_config = get_kmsauth_config(region, bless_config)
+        creds = get_env_creds(client_config)
+
+        results = get_cert_inputs(region, hostname, my_ip, username, userIP, creds, aws, bless_config, bless_cache)
+        my_ip = results['my_ip']
+        username = results['username']
+        kmsauth_token = results['kmsauth_token']
+        role_creds = results['role_creds']
+        ip, ip_list = results['ip_list']
+
+        if role_creds is None or kmsauth_token is None:
+            sys.stderr.write('AWS session not working. Check blessclient.cfg and verify the aws session?\n')
+            sys.exit(1)
+        logging.debug("Env creds used to assume role use-bless")
+
+        if nocache is not True:
+            if check_fresh_cert(cert_file, bless_lambda_config, bless_cache, userIP, ip_list, refresh_margin):
+                logging.debug("Already have fresh cert")
+                return {"username": username}
+
+        if not issue_cert_once(bless_config, bless_cache, role_creds, kmsauth_token, kmsauth_config, region, username,
+                               identity_file, my_ip, ip, ip_list, hostname, nocache, cert_mtime, userIP, refresh_margin):
+            return {"username": username}
+
+        logging.debug("Successfully issued cert!")
+        if show_feedback:
+            sys.stderr.write("Finished getting certificate.\n")
+
+        return {"username": username}
+
+
+def get_cert(start_region, nocache, showgui, hostname, bless_config, username=None, identity_file=None, aws=None,
+             bless_cache=None, refresh_margin=0, config_filename=None):
+    """ Get a certificate from the configured ca_backend, trying the alternate regions
+    when the Lambda in start_region fails
+    Args:
+        start_region (str): the AWS region code to try first
+        config_filename (str): the config file bless_config was loaded from, None for the default
+        See bless() for the rest
+    Returns (dict): output of bless() ({} for hashicorp-vault), or None if no region could sign the key
+    """
+    ca_backend = bless_config.get('BLESS_CONFIG')['ca_backend'].lower()
+    for region in get_regions(start_region, bless_config):
+        try:
+            if ca_backend == 'hashicorp-vault':
+                vault_bless(nocache, bless_config, config_filename)
+                return {}
+            return bless(
+                region, nocache, showgui, hostname, bless_config, username, identity_file, aws, bless_cache, refresh_margin)
+        except Exception as e:
+            if not is_region_error(e):
+                raise
+            logging.info(
+                'Lambda execution error: {}. Trying again in the alternate region.'.format(str(e)))
+    return None
+
+
+def is_region_error(e):
+    """ Returns (bool): True if e is an error from one region, so the alternate region is worth trying """
+    if isinstance(e, LambdaInvocationException):
+        return True
+    # botocore is only imported if something has failed, keeping it off the fresh cert path
+    from botocore.exceptions import (ClientError,
+                                     ConnectionError,
+                                     EndpointConnectionError)
+    if isinstance(e, ClientError):
+        if e.response.get('Error', {}).get('Code') == 'InvalidSignatureException':
+            sys.stderr.write(
+                'Your authentication signature was rejected by AWS; try checking your system ' +
+                'date & timezone settings are correct\n')
+        return True
+    return isinstance(e, (ConnectionError, EndpointConnectionError))
+
+
+def get_batch_identity_file(filename):
+    """ Returns (str): the identity file for an identity file or its public key """
+    return filename[:-len('.pub')] if filename.endswith('.pub') else filename
+
+
+def run_batch(identity_files, sign, parallel=BATCH_PARALLEL):
+    """ Call sign for every identity file, parallel of them at a time
+    Returns (dict): the exception for every identity file sign failed for
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    errors = {}
+    if not identity_files:
+        return errors
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(identity_files)))) as executor:
+        futures = [(identity_file, executor.submit(sign, identity_file)) for identity_file in identity_files]
+        for identity_file, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logging.debug('Could not get a cert for {}'.format(identity_file), exc_info=True)
+                errors[identity_file] = e
+    return errors
+
+
+def bless_batch(region, nocache, hostname, bless_config, identity_files, username=None, aws=None, bless_cache=None,
+                parallel=BATCH_PARALLEL):
+    """ Get certificates for several keys from the BLESS Lambda in region, with one set of
+    role credentials and one kmsauth token. Keys that have a fresh cert are skipped.
+    Args:
+        hostname (str): the host the certs are for, or None for the default ip list
+        identity_files (list): the identity files, or their public keys
+        parallel (int): Lambda calls to make at once
+        See bless() for the rest
+    Returns (dict): the username the certificates are for, and the errors: the exception
+        for every identity file that didn't get a cert
+    """
+    setup_logging()
+    aws = aws or BlessAWS()
+    bless_cache = bless_cache or get_bless_cache(nocache, bless_config)
+    identity_files = [get_batch_identity_file(filename) for filename in identity_files]
+    with bless_cache.coalesce():
+        bless_lambda_config = bless_config.get_lambda_config()
+        userIP = get_user_ip(bless_config, bless_cache)
+
+        client_config = bless_config.get_client_config()
+        if not client_config['use_env_creds']:
+            sys.stderr.write('AWS session not working. Check blessclient.cfg and verify the aws session?\n')
+            sys.exit(1)
+        kmsauth_config = get_kmsauth_config(region, bless_config)
+        creds = get_env_creds(client_config)
+        results = get_cert_inputs(region, hostname, None, username, userIP, creds, aws, bless_config, bless_cache)
+        my_ip = results['my_ip']
+        username = results['username']
+        ip, ip_list = results['ip_list']
+        if results['role_creds'] is None or results['kmsauth_token'] is None:
+            sys.stderr.write('AWS session not working. Check blessclient.cfg and verify the aws session?\n')
+            sys.exit(1)
+
+        def sign(identity_file):
+            cert_file = identity_file + '-cert.pub'
+            if nocache is not True and check_fresh_cert(cert_file, bless_lambda_config, bless_cache, userIP, ip_list):
+                logging.debug("Already have fresh cert for {}".format(identity_file))
+                return
+            issue_cert_once(bless_config, bless_cache, results['role_creds'], results['kmsauth_token'], kmsauth_config,
+                            region, username, identity_file, my_ip, ip, ip_list, hostname, nocache, get_mtime(cert_file),
+                            userIP)
+
+        errors = run_batch(identity_files, sign, parallel)
+    return {'username': username, 'errors': errors}
+
+
+def vault_bless_batch(nocache, bless_config, identity_files, parallel=BATCH_PARALLEL):
+    """ Get certificates for several keys from Vault, logging in once. Keys that have a fresh
+    cert are skipped.
+    Args:
+        identity_files (list): the identity files, or their public keys
+        parallel (int): Vault requests to make at once
+    Returns (dict): the errors: the exception for every identity file that didn't get a cert
+    """
+    setup_logging()
+    bless_cache = get_bless_cache(nocache, bless_config)
+    bless_lambda_config = bless_config.get_lambda_config()
+    user_ip = get_user_ip(bless_config, bless_cache)
+    identity_files = [get_batch_identity_file(filename) for filename in identity_files]
+    if nocache is not True:
+        identity_files = [
+            identity_file for identity_file in identity_files
+            if not check_fresh_cert(identity_file + '-cert.pub', bless_lambda_config, bless_cache, user_ip)]
+    if not identity_files:
+        return {'errors': {}}
+
+    import hvac
+
+    errors = {}
+    public_keys = {}
+    for identity_file in identity_files:
+        try:
+            public_keys[identity_file] = read_public_key(identity_file)
+        except Exception as e:
+            errors[identity_file] = e
+    if not public_keys:
+        return {'errors': errors}
+    auth_mount = bless_config.get('VAULT_CONFIG')['auth_mount']
+    client = hvac.Client(url=bless_config.get('VAULT_CONFIG')['vault_addr'])
+    client, linux_username = auth_okta(client, auth_mount, bless_cache)
+
+    # The first key is signed on its own, logging in again if Vault refuses the cached token
+    signable = [identity_file for identity_file in identity_files if identity_file in public_keys]
+    first = signable[0]
+    client, linux_username, cert = get_vault_cert(client, auth_mount, bless_config, linux_username, public_keys[first])
+
+    def sign(identity_file):
+        if identity_file == first:
+            signed = cert
+        else:
+            signed = VaultCA(client).getCert(get_vault_payload(bless_config, linux_username, public_keys[identity_file]))
+        check_vault_cert(signed, nocache)
+        write_cert(identity_file, signed)
+
+    errors.update(run_batch(signable, sign, parallel))
+    return {'errors': errors}
+
+
+def get_cert_batch(start_region, nocache, hostname, bless_config, identity_files, username=None,
+                   parallel=BATCH_PARALLEL):
+    """ Get certificates for several keys from the configured ca_backend. Keys the Lambda in
+    start_region fails for are tried again in the alternate regions.
+    Args:
+        See bless_batch()
+    Returns (dict): output of the last bless_batch() (or vault_bless_batch())
+    """
+    if bless_config.get('BLESS_CONFIG')['ca_backend'].lower() == 'hashicorp-vault':
+        return vault_bless_batch(nocache, bless_config, identity_files, parallel)
+    aws = BlessAWS()
+    result = {'errors': {}}
+    errors = {}
+    for region in get_regions(start_region, bless_config):
+        result = bless_batch(region, nocache, hostname, bless_config, identity_files, username, aws, parallel=parallel)
+        identity_files = []
+        for identity_file, error in result['errors'].items():
+            if is_region_error(error):
+                logging.info('Lambda execution error for {}: {}. Trying again in the alternate region.'.format(
+                    identity_file, error))
+                identity_files.append(identity_file)
+            else:
+                errors[identity_file] = error
+        if not identity_files:
+            break
+    result['errors'].update(errors)
+    return result
+
+
+def request_cert(start_region, nocache, showgui, hostname, bless_config, config_filename=None, username=None):
+    """ Get a certificate through blessd when it is running, or in this process when it isn't
+    Args:
+        config_filename (str): the config file bless_config was loaded from, None for the default
+        See get_cert() for the rest
+    Returns (dict): output of get_cert()
+    """
+    if bless_config.get('BLESS_CONFIG')['ca_backend'].lower() == 'bless':
+        # blessd runs in its own process, so the identity file has to be found here
+        identity_file = get_identity_file(os.path.expanduser('~/.ssh/blessid'))
+        response = blessd.request_cert(
+            start_region, nocache, showgui, hostname, config_filename or get_default_config_filename(),
+            username, identity_file)
+        if response is not None:
+            if response['error']:
+                sys.stderr.write('blessd: {}\n'.format(response['error']))
+            return response['result']
+    return get_cert(start_region, nocache, showgui, hostname, bless_config, username, config_filename=config_filename)
+
+
+def main_batch(args, bless_config):
+    """ blessclient --batch
+    Returns (int): the exit status, 0 if every identity file has a fresh cert
+    """
+    if 'AWS_PROFILE' not in os.environ:
+        sys.stderr.write('AWS session not found. Try running get_session first?\n')
+        return 1
+    start_region = get_region_from_code(args.region, bless_config)
+    hostname = args.host[0] if args.host else None
+    result = get_cert_batch(start_region, args.nocache, hostname, bless_config, args.batch, parallel=args.parallel)
+    for identity_file, error in sorted(result['errors'].items()):
+        sys.stderr.write('Could not sign {}: {}\n'.format(identity_file, error))
+    return 1 if result['errors'] else 0
+
+
+def main_proxy(args, bless_config, connection, stdio):
+    """ blessclient --proxy: get a certificate for the host while connecting to it, then
+    relay ssh's connection. ssh is still connected when there's no certificate, it may
+    have other ways to log in.
+    Args:
+        connection (proxy.Connection): the connection being made
+        stdio (tuple): the file descriptors of ssh's connection, from proxy.take_stdio()
+    Returns (int): the exit status
+    """
+    hostname = args.host[0]
+    ca_backend = bless_config.get('BLESS_CONFIG')['ca_backend']
+    if 'AWS_PROFILE' not in os.environ:
+        sys.stderr.write('AWS session not found. Try running get_session first?\n')
+    elif ca_backend.lower() not in ('hashicorp-vault', 'bless'):
+        sys.stderr.write('{0} is an invalid CA backend\n'.format(ca_backend))
+    elif bless_config.get_domain_regex().match(hostname) or hostname == 'BLESS':
+        start_region = get_region_from_code(args.region, bless_config)
+        try:
+            # stdin is ssh's connection, so an MFA code can only be asked for with the gui
+            result = request_cert(start_region, args.nocache, True, hostname, bless_config, args.config)
+        except (Exception, SystemExit) as e:
+            logging.debug('Could not get a certificate: {}'.format(e), exc_info=True)
+            result = None
+        if result is None:
+            sys.stderr.write('Could not sign SSH public key.\n')
+
+    try:
+        sock = connection.wait()
+    except (IOError, OSError) as e:
+        sys.stderr.write('Could not connect to {}: {}\n'.format(args.proxy, e))
+        return 1
+    proxy.relay(sock, *stdio)
+    return 0
 
 
 def main():
@@ -1069,22 +1751,89 @@ def main():
         help=(
             'Config file for blessclient, defaults to blessclient.cfg')
     )
+    parser.add_argument(
+        '--nocache',
+        help=(
+            'Request a new certificate even if the current one is still fresh'),
+        action='store_true'
+    )
     parser.add_argument(
         '--download_config',
         help=(
             'Download blessclient.cfg from S3 bucket. Will overwrite if file already exist'),
         action='store_true'
     )
+    parser.add_argument(
+        '--prewarm',
+        help=(
+            'Get role credentials and kmsauth tokens for all regions, so failing over to another region is fast'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--renew_vault_token',
+        help=(
+            'Renew the cached Vault token if it expires soon (hashicorp-vault backend)'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--batch',
+        help=(
+            'Get a certificate for this identity file (or public key) too, with the same role credentials '
+            'and kmsauth token. Can be repeated. The host is optional'),
+        action='append',
+        default=[]
+    )
+    parser.add_argument(
+        '--parallel',
+        help=(
+            'With --batch, the number of certificates to get at once. Default {}'.format(BATCH_PARALLEL)),
+        type=int,
+        default=BATCH_PARALLEL
+    )
+    parser.add_argument(
+        '--proxy',
+        help=(
+            'Run as ssh\'s ProxyCommand: connect to HOST:PORT while getting the certificate, then relay '
+            'the connection, e.g. ProxyCommand blessclient --proxy %%h:%%p %%h'),
+        metavar='HOST:PORT',
+        default=None
+    )
     args = parser.parse_args()
+    if args.proxy and len(args.host) == 0:
+        parser.error('--proxy needs the host to get a certificate for')
+    if args.proxy and args.batch:
+        parser.error('--proxy and --batch are mutually exclusive')
     bless_config = BlessConfig()
 
-    if len(args.host) == 0 and args.download_config is False:
+    connection = stdio = None
+    if args.proxy:
+        # Connect while the certificate is being fetched
+        connection = proxy.Connection(args.proxy)
+        stdio = proxy.take_stdio()
+
+    if len(args.host) == 0 and not (args.download_config or args.prewarm or args.renew_vault_token or args.batch):
         sys.stderr.write('blessclient: error: the following arguments are required: host\n')
         sys.exit(1)
 
     if load_config(bless_config, args.config, args.download_config) is False:
         sys.exit(1)
 
+    if args.renew_vault_token:
+        setup_logging()
+        renew_vault_token(bless_config)
+
+    if args.prewarm:
+        setup_logging()
+        if not prewarm(bless_config):
+            sys.stderr.write('Could not get a kmsauth token for any region.\n')
+            sys.exit(1)
+
+    if args.batch:
+        sys.exit(main_batch(args, bless_config))
+
+    if args.proxy:
+        sys.exit(main_proxy(args, bless_config, connection, stdio))
+
     if len(args.host) < 1:
         sys.exit(0)
 
@@ -1092,32 +1841,12 @@ def main():
     if 'AWS_PROFILE' not in os.environ:
         sys.stderr.write('AWS session not found. Try running get_session first?\n')
         sys.exit(1)
-    if re.match(bless_config.get_client_config()['domain_regex'], args.host[0]) or args.host[0] == 'BLESS':
+    if bless_config.get_domain_regex().match(args.host[0]) or args.host[0] == 'BLESS':
+        if ca_backend.lower() not in ('hashicorp-vault', 'bless'):
+            sys.stderr.write('{0} is an invalid CA backend'.format(ca_backend))
+            sys.exit(1)
         start_region = get_region_from_code(args.region, bless_config)
-        success = False
-        for region in get_regions(start_region, bless_config):
-            try:
-                if ca_backend.lower() == 'hashicorp-vault':
-                    vault_bless(args.nocache, bless_config)
-                    success = True
-                elif ca_backend.lower() == 'bless':
-                    bless(region, True, args.gui, args.host[0], bless_config)
-                    success = True
-                else:
-                    sys.stderr.write('{0} is an invalid CA backend'.format(ca_backend))
-                    sys.exit(1)
-                break
-            except ClientError as e:
-                if e.response.get('Error', {}).get('Code') == 'InvalidSignatureException':
-                    sys.stderr.write(
-                        'Your authentication signature was rejected by AWS; try checking your system ' +
-                        'date & timezone settings are correct\n')
-                logging.info(
-                    'Lambda execution error: {}. Trying again in the alternate region.'.format(str(e)))
-            except (LambdaInvocationException, ConnectionError, EndpointConnectionError) as e:
-                logging.info(
-                    'Lambda execution error: {}. Trying again in the alternate region.'.format(str(e)))
-        if success:
+        if request_cert(start_region, args.nocache, args.gui, args.host[0], bless_config, args.config) is not None:
             sys.exit(0)
         else:
             sys.stderr.write('Could not sign SSH public key.\n')
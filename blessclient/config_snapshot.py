@@ -0,0 +1,103 @@
+# Snapshots of parsed blessclient.cfg files
+from __future__ import absolute_import
+import copy
+import json
+import logging
+import os
+import tempfile
+
+SNAPSHOT_FILE = os.path.join('.bless', 'config_snapshot.json')
+PARSER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bless_config.py')
+
+# Snapshots already loaded by this process, keyed on the real path of the config file
+_snapshots = {}
+
+
+def get_snapshot_path():
+    return os.path.join(os.path.expanduser('~'), SNAPSHOT_FILE)
+
+
+def _stat_key(filename):
+    stat = os.stat(filename)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def get_snapshot_key(config_filename):
+    """ Key that changes whenever the config file or its parser changes
+    Args:
+        config_filename (str): path to blessclient.cfg
+    Returns (dict): the key. Raises an OSError if the file doesn't exist.
+    """
+    key = {
+        'path': os.path.realpath(config_filename),
+        'file': _stat_key(config_filename),
+    }
+    try:
+        key['parser'] = _stat_key(PARSER_FILE)
+    except OSError:
+        key['parser'] = None
+    return key
+
+
+def _read_snapshots(snapshot_path):
+    try:
+        with open(snapshot_path, 'r') as f:
+            snapshots = json.load(f)
+        if isinstance(snapshots, dict):
+            return snapshots
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def load_snapshot(config_filename, snapshot_path=None):
+    """ Get the parsed config for config_filename, if it hasn't changed since it was stored
+    Args:
+        config_filename (str): path to blessclient.cfg
+        snapshot_path (str): snapshot file, defaults to ~/.bless/config_snapshot.json
+    Returns:
+        A snapshot dict with 'config', 'aws_regions' and 'region_aliases', or None
+    """
+    key = get_snapshot_key(config_filename)
+    snapshot = _snapshots.get(key['path'])
+    if snapshot is None or snapshot['key'] != key:
+        snapshot = _read_snapshots(snapshot_path or get_snapshot_path()).get(key['path'])
+        if snapshot is None or snapshot.get('key') != key:
+            return None
+        _snapshots[key['path']] = snapshot
+    logging.debug('Using config snapshot for {}'.format(key['path']))
+    # Callers may change their config (e.g. set_lambda_config), so never hand out the cached dict
+    return copy.deepcopy(snapshot)
+
+
+def save_snapshot(config_filename, config, snapshot_path=None):
+    """ Store the parsed config for config_filename
+    Args:
+        config_filename (str): path to blessclient.cfg
+        config (dict): output of BlessConfig.parse_config_file
+        snapshot_path (str): snapshot file, defaults to ~/.bless/config_snapshot.json
+    Returns (dict): the stored snapshot
+    """
+    key = get_snapshot_key(config_filename)
+    snapshot = {
+        'key': key,
+        'config': config,
+        'aws_regions': sorted(config['REGION_ALIAS'].values()),
+        'region_aliases': sorted(config['REGION_ALIAS']),
+    }
+    _snapshots[key['path']] = copy.deepcopy(snapshot)
+
+    snapshot_path = snapshot_path or get_snapshot_path()
+    try:
+        snapshots = _read_snapshots(snapshot_path)
+        snapshots[key['path']] = snapshot
+        snapshot_dir = os.path.dirname(snapshot_path)
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, prefix='.config_snapshot')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshots, f)
+        os.rename(tmp_path, snapshot_path)
+    except (IOError, OSError) as e:
+        logging.debug('Could not save config snapshot: {}'.format(e))
+    return snapshot
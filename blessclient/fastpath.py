@@ -0,0 +1,237 @@
+#!/usr/local/bin/python
+# Stdlib-only check for a usable certificate
+from __future__ import absolute_import
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from configparser import ConfigParser
+
+from . import config_snapshot, identity
+from .bless_cache import EXPIRES_KEY
+
+
+def get_default_config_filename():
+    """ Same lookup as client.get_default_config_filename """
+    home_config = os.path.normpath(os.path.join(os.path.expanduser("~"), '.aws', 'blessclient.cfg'))
+    etc_config = "/etc/blessclient/blessclient.cfg"
+    if os.path.isfile(home_config):
+        return home_config
+    if os.path.isfile(etc_config):
+        return etc_config
+    return home_config
+
+
+def get_snapshot_fastpath_config(config):
+    """ The values load_fastpath_config reads, from a config snapshot
+    Args:
+        config (dict): parsed config, as returned by BlessConfig.parse_config_file
+    """
+    return {
+        'domain_regex': config['CLIENT_CONFIG']['domain_regex'],
+        'cache_dir': config['CLIENT_CONFIG']['cache_dir'],
+        'cache_file': config['CLIENT_CONFIG']['cache_file'],
+        'certlifetime': config['BLESS_CONFIG']['certlifetime'],
+        'ipcachelifetime': config['BLESS_CONFIG']['ipcachelifetime'],
+        'bastion_ips': config['AWS_CONFIG'].get('bastion_ips'),
+        'ca_backend': config['BLESS_CONFIG']['ca_backend'],
+        'housekeeper': any(section.startswith('HOUSEKEEPER_CONFIG_') for section in config),
+    }
+
+
+def load_fastpath_config(config_filename):
+    """ Read the few values needed to decide if the cert is fresh
+    Args:
+        config_filename (str): path to blessclient.cfg
+    Returns:
+        dict of config values, or None if the file can't be read
+    """
+    try:
+        snapshot = config_snapshot.load_snapshot(config_filename)
+        if snapshot is not None:
+            return get_snapshot_fastpath_config(snapshot['config'])
+    except Exception:
+        return None
+
+    config = ConfigParser()
+    try:
+        with open(config_filename, 'r') as f:
+            config.read_file(f)
+        return {
+            'domain_regex': config.get('CLIENT', 'domain_regex'),
+            'cache_dir': config.get('CLIENT', 'cache_dir'),
+            'cache_file': config.get('CLIENT', 'cache_file'),
+            'certlifetime': config.getint('LAMBDA', 'certlifetime'),
+            'ipcachelifetime': config.getint('LAMBDA', 'ipcachelifetime'),
+            'bastion_ips': config.get('MAIN', 'bastion_ips') if config.has_option('MAIN', 'bastion_ips') else None,
+            'ca_backend': config.get('MAIN', 'ca_backend') if config.has_option('MAIN', 'ca_backend') else 'bless',
+            'housekeeper': config.has_section('HOUSEKEEPER'),
+        }
+    except Exception:
+        return None
+
+
+def get_parent_cmdline():
+    """ The parent's command line from /proc, or None where that isn't available """
+    return identity.get_parent_cmdline(use_psutil=False)
+
+
+def get_identity_file(default):
+    """ Same rules as identity.get_identity_file, without psutil
+    Returns (str): path to the identity file, or None if it can't be worked out here
+    """
+    if os.getenv('BLESS_IDENTITYFILE', '') != '':
+        return os.environ['BLESS_IDENTITYFILE']
+    cmdline = get_parent_cmdline()
+    if cmdline is None:
+        return None
+    return identity.get_idfile_from_cmdline(cmdline, default)
+
+
+def load_cache(config):
+    cache_file_path = os.path.join(os.path.expanduser('~'), config['cache_dir'], config['cache_file'])
+    try:
+        with open(cache_file_path, 'r') as cache:
+            return json.load(cache)
+    except Exception:
+        return {}
+
+
+def get_cached_ip(config, cache):
+    """ The user's public ip, if it is known without asking the ip_urls """
+    fixed_ip = os.getenv('BLESSFIXEDIP', False)
+    if fixed_ip:
+        return fixed_ip
+    if (cache.get(EXPIRES_KEY) or {}).get('lastip', 0) > time.time():
+        return cache.get('lastip')
+    return None
+
+
+def get_cached_ip_list(hostname, my_ip, config, cache):
+    """ Same ip list as client.get_cached_ip_list, or None if it needs the housekeeper """
+    if config['housekeeper']:
+        if cache.get('remote_host') == hostname:
+            return cache.get('bastion_ips')
+        return None
+    if config['bastion_ips'] is not None:
+        return "{},{}".format(my_ip, config['bastion_ips'])
+    return '{}'.format(my_ip)
+
+
+def is_cert_fresh(hostname, cert_file, config, cache):
+    """ The decision client.check_fresh_cert makes, without a network call
+    Returns (bool): True if the cert can be used, False if blessclient needs to run
+    """
+    if not os.path.isfile(cert_file):
+        return False
+    certlife = time.time() - os.path.getmtime(cert_file)
+    if certlife >= float(config['certlifetime'] - 15):
+        return False
+    my_ip = get_cached_ip(config, cache)
+    if not (certlife < float(config['ipcachelifetime']) or (my_ip is not None and cache.get('certip') == my_ip)):
+        return False
+    if config['ca_backend'].lower() == 'hashicorp-vault':
+        return True
+    if my_ip is None:
+        return False
+    ip_list = get_cached_ip_list(hostname, my_ip, config, cache)
+    return ip_list is not None and ip_list == cache.get('bastion_ips')
+
+
+def vault_token_renewal_due(cache):
+    """ Same decision as client.vault_token_renewal_due, with the default min_lifetime """
+    vault_creds = cache.get('vault_creds')
+    expiry = (cache.get(EXPIRES_KEY) or {}).get('vault_creds')
+    if not isinstance(vault_creds, dict) or not isinstance(expiry, (int, float)) or not vault_creds.get('renewable'):
+        return False
+    remaining = expiry - time.time()
+    if remaining <= 0 or remaining > vault_creds['lease_duration'] // 2:
+        return False
+    return vault_creds['max_expiration'] is None or vault_creds['max_expiration'] > vault_creds['expiration']
+
+
+def start_vault_token_renewal(config_filename=None):
+    """ Same as client.start_vault_token_renewal """
+    command = [sys.executable, '-m', 'blessclient.client', '--renew_vault_token']
+    if config_filename is not None:
+        command += ['--config', config_filename]
+    with open(os.devnull, 'w') as devnull:
+        subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True)
+
+
+def update_due(cache):
+    """ Returns (bool): True if client.update_client would run the autoupdate """
+    try:
+        last_updated = datetime.datetime.strptime(cache.get('last_updated'), '%Y%m%dT%H%M%SZ')
+    except (TypeError, ValueError):
+        return False
+    return last_updated + datetime.timedelta(days=7) <= datetime.datetime.utcnow()
+
+
+def check(args):
+    """
+    Returns (int): 0 if the cert is fresh, 1 if the host doesn't need bless,
+        or None if the full client has to decide
+    """
+    if len(args.host) == 0 or args.download_config or args.nocache:
+        return None
+    config = load_fastpath_config(args.config or get_default_config_filename())
+    if config is None:
+        return None
+    hostname = args.host[0]
+    if not (re.match(config['domain_regex'], hostname) or hostname == 'BLESS'):
+        return 1
+    if 'AWS_PROFILE' not in os.environ:
+        return None
+    identity_file = get_identity_file(os.path.expanduser('~/.ssh/blessid'))
+    if identity_file is None:
+        return None
+    cache = load_cache(config)
+    if not is_cert_fresh(hostname, identity_file + '-cert.pub', config, cache):
+        return None
+    # What the full client does besides checking the cert
+    if config['ca_backend'].lower() == 'hashicorp-vault':
+        if vault_token_renewal_due(cache):
+            start_vault_token_renewal(args.config)
+    elif update_due(cache):
+        return None
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Check for a fresh BLESS\'ed ssh certificate, running blessclient only when needed.'),
+        add_help=False
+    )
+    # Mirrors the arguments of client.main, so they are handed over unchanged on a miss
+    parser.add_argument('host', nargs='*')
+    parser.add_argument('--region', default=None)
+    parser.add_argument('--gui', action='store_true')
+    parser.add_argument('--config', default=None)
+    parser.add_argument('--download_config', action='store_true')
+    parser.add_argument('--nocache', action='store_true')
+    parser.add_argument(
+        '--check-only',
+        help=(
+            'Exit 1 instead of running blessclient when no fresh certificate is found'),
+        action='store_true'
+    )
+    args, _ = parser.parse_known_args()
+
+    result = check(args)
+    if result is not None:
+        sys.exit(result)
+    if args.check_only:
+        sys.exit(1)
+
+    from .client import main as client_main
+    sys.argv = [arg for arg in sys.argv if arg != '--check-only']
+    client_main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Hedged requests
+from __future__ import absolute_import
+import logging
+import math
+import threading
+import time
+
+from six.moves import queue
+
+LATENCY_KEY = 'lambda_latency'
+# Latencies kept per region
+LATENCY_SAMPLES = 20
+# Until a region has this many latencies, hedge after DEFAULT_DELAY seconds
+MIN_SAMPLES = 5
+DEFAULT_DELAY = 2.0
+
+
+def get_hedge_delay(bless_cache, region, percentile):
+    """ How long to wait for region before hedging
+    Args:
+        bless_cache (BlessCache): where the latencies are kept
+        region (str): the AWS region
+        percentile (int): percentile of the region's recent latencies to wait for
+    Returns (float): seconds
+    """
+    latencies = sorted((bless_cache.get(LATENCY_KEY) or {}).get(region, []))
+    if len(latencies) < MIN_SAMPLES:
+        return DEFAULT_DELAY
+    index = int(math.ceil(percentile / 100.0 * len(latencies))) - 1
+    return latencies[min(max(index, 0), len(latencies) - 1)] / 1000.0
+
+
+def record_latency(bless_cache, region, elapsed):
+    """ Remember how long region took to answer
+    Args:
+        elapsed (float): seconds
+    """
+    with bless_cache.lock:
+        latencies = dict(bless_cache.get(LATENCY_KEY) or {})
+        latencies[region] = (latencies.get(region, []) + [round(elapsed * 1000, 1)])[-LATENCY_SAMPLES:]
+        bless_cache.set(LATENCY_KEY, latencies)
+
+
+def first_valid(calls, delay, is_valid):
+    """ Run calls[0], and start the next call every time delay seconds pass without a
+    valid result, or straight away when all calls started so far have failed
+    Args:
+        calls (list): functions to call, without arguments
+        delay (float): seconds to wait before starting the next call
+        is_valid (callable): True if a call's result can be used
+    Returns (tuple): the index of the call and its result, for the first valid result.
+        When no call returns a valid result, the outcome of calls[0]: its result, or its
+        exception is raised.
+    """
+    results = queue.Queue()
+    outcomes = {}
+
+    def run(index):
+        try:
+            results.put((index, calls[index](), None))
+        except Exception as e:
+            results.put((index, None, e))
+
+    started = 0
+    next_start = 0
+    while len(outcomes) < len(calls):
+        if started < len(calls) and (time.time() >= next_start or len(outcomes) == started):
+            if started > 0:
+                logging.debug('Hedging with request {}'.format(started))
+            thread = threading.Thread(target=run, args=(started,))
+            # The losing requests are abandoned, and must not keep blessclient from exiting
+            thread.daemon = True
+            thread.start()
+            started += 1
+            next_start = time.time() + delay
+        timeout = max(0, next_start - time.time()) if started < len(calls) else None
+        try:
+            index, result, error = results.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        outcomes[index] = (result, error)
+        if error is None and is_valid(result):
+            return index, result
+    result, error = outcomes[0]
+    if error is not None:
+        raise error
+    return 0, result
@@ -1,13 +1,12 @@
 from __future__ import absolute_import
-import boto3
 import json
-import requests
-from requests_aws_sign import AWSV4Sign
 
 
 class HousekeeperLambda(object):
 
     def __init__(self, config, creds, region):
+        import boto3
+
         self.credentials = boto3.Session(
             aws_access_key_id=creds['AccessKeyId'],
             aws_secret_access_key=creds['SecretAccessKey'],
@@ -18,12 +17,18 @@ class HousekeeperLambda(object):
         self.url = config['url']
 
     def getPrivateIpFromPublic(self, ip):
+        import requests
+        from requests_aws_sign import AWSV4Sign
+
         auth = AWSV4Sign(self.credentials, self.region, self.service)
         response = requests.get('{0}/1/get-private-ip-from-public?ip={1}'.format(self.url, ip), auth=auth)
         payload = json.loads(response.content.decode("utf-8"))
         return payload['private_ip']
 
     def getPrivateIpFromPublicName(self, name):
+        import requests
+        from requests_aws_sign import AWSV4Sign
+
         auth = AWSV4Sign(self.credentials, self.region, self.service)
         response = requests.get('{0}/1/get-private-ip-from-public?name={1}'.format(self.url, name), auth=auth)
         payload = json.loads(response.content.decode("utf-8"))
@@ -0,0 +1,86 @@
+# Find the identity file blessclient should get a certificate for
+from __future__ import absolute_import
+import logging
+import os
+
+_cmdlines = {}
+
+
+def read_proc_cmdline(pid):
+    """ Read a process' command line from /proc
+    Args:
+        pid (int): process id
+    Returns (list): the arguments, or None if /proc isn't available
+    """
+    try:
+        with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+            return f.read().decode('UTF-8', 'replace').split('\0')[:-1]
+    except (IOError, OSError):
+        return None
+
+
+def read_psutil_cmdline(pid):
+    """ Read a process' command line with psutil
+    Args:
+        pid (int): process id
+    Returns (list): the arguments, or None if psutil isn't installed or can't read them
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return psutil.Process(pid).cmdline()
+    except psutil.Error as e:
+        logging.debug('Could not read the command line of {}: {}'.format(pid, e))
+        return None
+
+
+def get_parent_cmdline(use_psutil=True):
+    """ The parent process' command line, cached per parent pid
+    Args:
+        use_psutil (bool): fall back to psutil when /proc can't be read
+    Returns (list): the arguments, or None if they can't be read
+    """
+    ppid = os.getppid()
+    if ppid in _cmdlines:
+        return _cmdlines[ppid]
+    cmdline = read_proc_cmdline(ppid)
+    if cmdline is None and use_psutil:
+        cmdline = read_psutil_cmdline(ppid)
+    if cmdline is not None:
+        _cmdlines[ppid] = cmdline
+    return cmdline
+
+
+def get_idfile_from_cmdline(cmdline, default):
+    """ The identity file given with -i in cmdline
+    Args:
+        cmdline (list): ssh command line
+        default (str): identity file to use if there's no -i
+    Returns (str): path to the identity file; BLESS_IDENTITYFILE when that is set
+    """
+    if os.getenv('BLESS_IDENTITYFILE', '') != '':
+        return os.environ['BLESS_IDENTITYFILE']
+
+    identity_file = default
+    if '-i' in cmdline and cmdline.index('-i') + 1 < len(cmdline):
+        identity_file = cmdline[cmdline.index('-i') + 1]
+
+    if identity_file[-4:] == '.pub':
+        # someone set their public key as their identity
+        identity_file = identity_file[0:-4]
+
+    return identity_file
+
+
+def get_identity_file(default):
+    """ Find the identity file, only inspecting the parent's command line when
+    BLESS_IDENTITYFILE is not set in the environment.
+    Args:
+        default (str): identity file to use if none is found
+    Returns (str): path to the identity file
+    """
+    if os.getenv('BLESS_IDENTITYFILE', '') != '':
+        return get_idfile_from_cmdline([], default)
+    return get_idfile_from_cmdline(get_parent_cmdline() or [], default)
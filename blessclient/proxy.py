@@ -0,0 +1,99 @@
+# ProxyCommand mode
+from __future__ import absolute_import
+import os
+import socket
+import threading
+
+CONNECT_TIMEOUT = 30
+BUFFER_SIZE = 65536
+
+
+def parse_address(address, port=22):
+    """ Split host[:port], or [ipv6]:port
+    Returns (tuple): the host and the port
+    """
+    if address.startswith('['):
+        host, _, rest = address[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else port
+    if address.count(':') == 1:
+        host, port = address.split(':')
+        return host, int(port)
+    return address, port
+
+
+class Connection(object):
+    """ A TCP connection, made on a thread """
+
+    def __init__(self, address, timeout=CONNECT_TIMEOUT):
+        """
+        Args:
+            address (str): host:port to connect to
+            timeout (float): seconds to wait for the connection
+        """
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.sock = None
+        self.error = None
+        self.thread = threading.Thread(target=self._connect)
+        # Nothing is left to do with the connection if blessclient exits first
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _connect(self):
+        try:
+            self.sock = socket.create_connection(self.address, self.timeout)
+            self.sock.settimeout(None)
+        except (IOError, OSError) as e:
+            self.error = e
+
+    def wait(self):
+        """ Returns (socket): the connected socket
+        Raises: the error if the connection failed
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.sock
+
+
+def take_stdio():
+    """ Keep stdin and stdout for the relay. Anything else in blessclient that prints
+    or prompts gets stderr and /dev/null instead of ssh's connection.
+    Returns (tuple): file descriptors for the original stdin and stdout
+    """
+    stdin_fd = os.dup(0)
+    stdout_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    return stdin_fd, stdout_fd
+
+
+def relay(sock, stdin_fd, stdout_fd):
+    """ Copy stdin to sock and sock to stdout, until the server closes the connection """
+    def upstream():
+        try:
+            while True:
+                data = os.read(stdin_fd, BUFFER_SIZE)
+                if not data:
+                    break
+                sock.sendall(data)
+            sock.shutdown(socket.SHUT_WR)
+        except (IOError, OSError):
+            pass
+
+    thread = threading.Thread(target=upstream)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            data = sock.recv(BUFFER_SIZE)
+            if not data:
+                break
+            while data:
+                data = data[os.write(stdout_fd, data):]
+    except (IOError, OSError):
+        pass
+    finally:
+        sock.close()
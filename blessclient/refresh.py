@@ -0,0 +1,81 @@
+# Refresh-ahead renewal for blessd
+from __future__ import absolute_import
+import logging
+import threading
+import time
+from .bless_aws import exponential_backoff_and_jitter_retry
+
+
+class RefreshScheduler(object):
+    CHECK_INTERVAL = 30
+    WAIT_TIME_CAP = 600
+    WAIT_TIME_BASE = 15
+    MAX_RETRIES = 8
+
+    def __init__(self, daemon, refresh_margin, interval=CHECK_INTERVAL):
+        """
+        Args:
+            daemon (BlessDaemon): renews the certs, see BlessDaemon.refresh
+            refresh_margin (int): renew certs this many seconds before they expire
+            interval (int): seconds between checks
+        """
+        self.daemon = daemon
+        self.refresh_margin = refresh_margin
+        self.interval = interval
+        self.targets = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.retry_policy = exponential_backoff_and_jitter_retry(
+            cap=RefreshScheduler.WAIT_TIME_CAP,
+            base=RefreshScheduler.WAIT_TIME_BASE,
+            max_attempts=RefreshScheduler.MAX_RETRIES
+        )
+
+    def track(self, message):
+        """ Keep the cert from a handled cert request fresh
+        Args:
+            message (dict): the blessd cert request
+        """
+        key = (message['config'], message['identity_file'])
+        with self.lock:
+            self.targets[key] = {
+                'message': dict(message, nocache=False),
+                'attempt': 0,
+                'next_check': time.time() + self.interval,
+            }
+
+    def run_due(self, now=None):
+        """ Check (and renew) the certs that are due """
+        now = now or time.time()
+        with self.lock:
+            due = [(key, target) for key, target in self.targets.items() if target['next_check'] <= now]
+        for key, target in due:
+            try:
+                renewed = self.daemon.refresh(target['message'], self.refresh_margin)
+            except Exception:
+                logging.exception('Error renewing the cert for {}'.format(key[1]))
+                renewed = False
+            with self.lock:
+                if self.targets.get(key) is not target:
+                    # A new request for this cert came in meanwhile
+                    continue
+                if renewed:
+                    target['attempt'] = 0
+                    target['next_check'] = now + self.interval
+                    continue
+                wait = self.retry_policy(target['attempt'])
+                if wait is None:
+                    logging.info('Not retrying the renewal of {}'.format(key[1]))
+                    del self.targets[key]
+                else:
+                    logging.info('Retrying the renewal of {} in {} seconds'.format(key[1], wait))
+                    target['attempt'] += 1
+                    target['next_check'] = now + wait
+
+    def run(self):
+        """ Check the certs until stop() is called """
+        while not self.stopped.wait(self.interval):
+            self.run_due()
+
+    def stop(self):
+        self.stopped.set()
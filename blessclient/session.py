@@ -0,0 +1,74 @@
+# In-process library API
+from __future__ import absolute_import
+import threading
+
+
+class BlessSession(object):
+
+    def __init__(self, bless_config=None, config_filename=None, start_region=None, nocache=False,
+                 refresh_margin=0, max_workers=None):
+        """
+        Args:
+            bless_config (BlessConfig): Loaded BlessConfig, loaded from config_filename if None
+            config_filename (str): the config file, /etc/blessclient or ~/.aws/blessclient.cfg if None
+            start_region (str): the AWS region code to try first, the first region in REGION_ALIAS if None
+            nocache (bool): get a new cert on every call
+            refresh_margin (int): also renew certs that expire within this many seconds
+            max_workers (int): threads for the AWS and Lambda calls, shared by all calls
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        from . import client
+        from .bless_aws import BlessAWS
+        from .bless_config import BlessConfig
+
+        self.config_filename = config_filename or client.get_default_config_filename()
+        if bless_config is None:
+            bless_config = BlessConfig()
+            bless_config.load_config_file(self.config_filename)
+        self.bless_config = bless_config
+        self.start_region = start_region
+        self.nocache = nocache
+        self.refresh_margin = refresh_margin
+        self.aws = BlessAWS()
+        self.bless_cache = client.get_bless_cache(nocache, bless_config)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def ensure_cert(self, host, identity=None, username=None):
+        """ Make sure identity has a fresh cert for connecting to host, getting a new one if needed
+        Args:
+            host (str): the host being connected to
+            identity (str): the identity file, ~/.ssh/blessid if None
+            username (str): the bastion user, looked up from IAM if None
+        Returns (dict): the username the certificate is for ({} for hashicorp-vault)
+        Raises: LambdaInvocationException if no region could sign the key, Exception if the
+            AWS session isn't working. Not to be called from a running event loop, use
+            blessclient.aio there.
+        """
+        from . import aio
+        from .lambda_invocation_exception import LambdaInvocationException
+
+        with self.lock:
+            if self.closed:
+                raise ValueError('BlessSession is closed')
+        result = aio.run_until_complete(aio.get_cert(
+            self.start_region, host, self.bless_config, username, identity, self.aws, self.bless_cache,
+            self.nocache, self.refresh_margin, self.config_filename, self.executor))
+        if result is None:
+            raise LambdaInvocationException('Could not sign SSH public key for {}'.format(host))
+        return result
+
+    def close(self):
+        """ Write the cache and stop the threads """
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown()
+        self.bless_cache.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,60 @@
+# One cert request at a time
+from __future__ import absolute_import
+import contextlib
+import errno
+import hashlib
+import logging
+import os
+import time
+
+# Give up waiting after this many seconds, and get a cert anyway
+LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+
+
+def get_lock_file(lock_dir, key):
+    """ Returns (str): the lock file for key in lock_dir """
+    digest = hashlib.sha1(key.encode('UTF-8')).hexdigest()[:16]
+    return os.path.join(lock_dir, 'issue-{}.lock'.format(digest))
+
+
+@contextlib.contextmanager
+def lock(lock_dir, key, timeout=LOCK_TIMEOUT):
+    """ Hold the lock for key while the block runs
+    Args:
+        lock_dir (str): directory for the lock files
+        key (str): what is being locked
+        timeout (float): seconds to wait for another process to release the lock
+    Yields (bool): True if another process held the lock when we asked for it
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows), no coordination
+        yield False
+        return
+
+    if not os.path.exists(lock_dir):
+        os.makedirs(lock_dir)
+    fd = os.open(get_lock_file(lock_dir, key), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        waited = False
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+            if not waited:
+                logging.debug('Waiting for another blessclient to get a cert')
+                waited = True
+            if time.time() > deadline:
+                logging.info('Gave up waiting for another blessclient to get a cert')
+                break
+            time.sleep(POLL_INTERVAL)
+        yield waited
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
@@ -0,0 +1,41 @@
+# Run a few dependent tasks on a thread pool
+from __future__ import absolute_import
+from collections import OrderedDict
+
+
+class TaskGraph(object):
+
+    def __init__(self):
+        self.tasks = OrderedDict()
+
+    def add(self, name, func, deps=()):
+        """ Add a task
+        Args:
+            name (str): the task's name, its result is returned under this name
+            func (callable): called with the results of deps, in order
+            deps (list): names of the tasks func needs, which must have been added already
+        """
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError('Unknown dependency {} of task {}'.format(dep, name))
+        self.tasks[name] = (func, tuple(deps))
+
+    def run(self):
+        """ Run all tasks, each one once its dependencies are done
+        Returns (dict): the result of each task, by name
+        Raises: the exception of the first task (in the order they were added) that failed.
+            Tasks depending on a failed task fail with the same exception.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        futures = OrderedDict()
+        # One thread per task, so a task waiting for its dependencies never holds
+        # up a task it depends on
+        with ThreadPoolExecutor(max_workers=max(1, len(self.tasks))) as executor:
+            for name, (func, deps) in self.tasks.items():
+                futures[name] = executor.submit(_run_task, func, [futures[dep] for dep in deps])
+            return dict((name, future.result()) for name, future in futures.items())
+
+
+def _run_task(func, dep_futures):
+    return func(*[future.result() for future in dep_futures])
@@ -1,23 +1,78 @@
 from __future__ import absolute_import
-import contextlib
 import logging
 import string
+import threading
 import time
 import socket
-import requests
 from urllib.parse import urlparse
 
+from six.moves import queue
+
 VALID_IP_CHARACTERS = string.hexdigits + '.:'
 
 
+class Lookup(object):
+    """ An HTTP GET for _fetchConcurrent that another thread can cancel """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.connection = None
+
+    def get(self, scheme, host, port, path, headers, timeout):
+        """ Returns (tuple): the status and the body, or None if cancelled """
+        from six.moves import http_client
+
+        connection_class = http_client.HTTPSConnection if scheme == 'https' else http_client.HTTPConnection
+        connection = connection_class(host, port, timeout=timeout)
+        try:
+            connection.connect()
+            with self.lock:
+                if self.cancelled.is_set():
+                    return None
+                self.connection = connection
+            connection.request('GET', path or '/', headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read().decode('UTF-8', 'replace')
+        except (IOError, OSError, http_client.HTTPException):
+            if self.cancelled.is_set():
+                return None
+            raise
+        finally:
+            connection.close()
+
+    def cancel(self):
+        """ Stop the request: it returns None, at once if it is connected """
+        with self.lock:
+            self.cancelled.set()
+            connection = self.connection
+        if connection is not None and connection.sock is not None:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except (IOError, OSError):
+                pass
+
+
 class UserIP(object):
+    # How the ip_urls are queried: one after another, all at once taking the first
+    # answer, or all at once taking the answer most of them agree on
+    LOOKUP_SEQUENTIAL = 'sequential'
+    LOOKUP_FIRST = 'first'
+    LOOKUP_MAJORITY = 'majority'
+    TIMEOUT = 2
+    # Latency and consecutive failures of each url, to try the fastest ones first
+    STATS_KEY = 'ip_url_stats'
+    STATS_WEIGHT = 0.3
 
-    def __init__(self, bless_cache, maxcachetime, ip_urls, fixed_ip=False):
+    def __init__(self, bless_cache, maxcachetime, ip_urls, fixed_ip=False, lookup=LOOKUP_SEQUENTIAL,
+                 timeout=TIMEOUT):
         self.fresh = False
         self.currentIP = None
         self.cache = bless_cache
         self.maxcachetime = maxcachetime
         self.ip_urls = ip_urls
+        self.lookup = lookup
+        self.timeout = timeout
         if fixed_ip:
             self.currentIP = fixed_ip
             self.fresh = True
@@ -25,44 +80,143 @@ class UserIP(object):
     def getIP(self):
         if self.fresh and self.currentIP:
             return self.currentIP
-        lastip = self.cache.get('lastip')
-        lastiptime = self.cache.get('lastipchecktime')
-        if lastiptime and lastiptime + self.maxcachetime > time.time():
-            return lastip
+        # Entries from before lastip had a ttl don't have one, and are looked up again
+        if self.cache.ttl('lastip'):
+            return self.cache.get('lastip')
         self._refreshIP()
         return self.currentIP
 
     def _refreshIP(self):
         logging.debug("Getting current public IP")
 
-        ip = None
-        for url in self.ip_urls:
-            if ip:
-                break
-            else:
-                ip = self._fetchIP(url)
+        stats = dict(self.cache.get(self.STATS_KEY) or {})
+        urls = self._sortURLs(stats)
+        if self.lookup == self.LOOKUP_SEQUENTIAL or len(urls) < 2:
+            ip = self._fetchSequential(urls, stats)
+        else:
+            ip = self._fetchConcurrent(urls, stats, self.lookup == self.LOOKUP_MAJORITY)
+        self.cache.set(self.STATS_KEY, stats)
 
         if not ip:
+            self.cache.save()
             raise Exception('Could not refresh public IP')
 
         self.currentIP = ip
         self.fresh = True
-        self.cache.set('lastip', self.currentIP)
-        self.cache.set('lastipchecktime', time.time())
+        self.cache.set('lastip', self.currentIP, self.maxcachetime)
         self.cache.save()
 
-    def _fetchIP(self, url):
+    def _sortURLs(self, stats):
+        """ The ip_urls, the ones that answered fastest last time first. Failing urls go last,
+        and new urls before the ones we know about.
+        """
+        def key(url):
+            stat = stats.get(url, {})
+            return (stat.get('failures', 0), stat.get('latency', 0))
+        return sorted(self.ip_urls, key=key)
+
+    def _recordStat(self, stats, url, ip, elapsed):
+        stat = dict(stats.get(url, {}))
+        if ip is None:
+            stat['failures'] = stat.get('failures', 0) + 1
+        else:
+            stat['failures'] = 0
+            latency = elapsed * 1000
+            if 'latency' in stat:
+                latency = stat['latency'] * (1 - self.STATS_WEIGHT) + latency * self.STATS_WEIGHT
+            stat['latency'] = round(latency, 1)
+        stats[url] = stat
+
+    def _fetchSequential(self, urls, stats):
+        for url in urls:
+            start = time.time()
+            ip = self._fetchIP(url)
+            self._recordStat(stats, url, ip, time.time() - start)
+            if ip:
+                return ip
+        return None
+
+    def _fetchConcurrent(self, urls, stats, majority):
+        """ Query all urls at once. The lookups still running when an IP is accepted are
+        cancelled.
+        Args:
+            urls (list): the urls to query
+            stats (dict): url stats, updated with the urls that answered
+            majority (bool): wait for more than half of the urls to agree, instead of
+                taking the first answer
+        Returns (str): the IP, or None
+        """
+        results = queue.Queue()
+        lookups = [Lookup() for url in urls]
+        for url, lookup in zip(urls, lookups):
+            thread = threading.Thread(target=self._fetchInto, args=(results, url, lookup))
+            # A hung lookup must not keep blessclient from exiting
+            thread.daemon = True
+            thread.start()
+
+        ip = None
+        votes = {}
+        pending = set(urls)
+        # The timeout applies to connecting and reading separately
+        deadline = time.time() + self.timeout * 2
+        while pending and ip is None:
+            try:
+                url, fetched, elapsed = results.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                break
+            pending.discard(url)
+            self._recordStat(stats, url, fetched, elapsed)
+            if fetched:
+                votes[fetched] = votes.get(fetched, 0) + 1
+                if not majority or votes[fetched] * 2 > len(urls):
+                    ip = fetched
+
+        if ip is None and votes:
+            # Some urls didn't answer in time, settle for a majority of the answers
+            best = max(votes, key=votes.get)
+            if votes[best] * 2 > sum(votes.values()):
+                ip = best
+        if ip is None:
+            for url in pending:
+                self._recordStat(stats, url, None, None)
+        for lookup in lookups:
+            lookup.cancel()
+        return ip
+
+    def _fetchInto(self, results, url, lookup):
+        start = time.time()
+        ip = self._fetchIP(url, lookup)
+        results.put((url, ip, time.time() - start))
+
+    def _fetchIP(self, url, lookup=None):
+        """ Args:
+            lookup (Lookup): make the request with it, so it can be cancelled
+        Returns (str): the IP, or None
+        """
         try:
             # We do this to force IPv4 lookup as bless do not currently support IPv6
             parsed_uri = urlparse(url)
-            addrs = socket.gethostbyname(parsed_uri.netloc)
-            headers = { 'Host' : parsed_uri.netloc }
-            r = requests.get('{}://{}{}'.format(parsed_uri.scheme, addrs, parsed_uri.path), headers=headers)
-            if r.status_code == 200:
-                content = r.text.strip()
+            addrs = socket.gethostbyname(parsed_uri.hostname)
+            headers = {'Host': parsed_uri.netloc}
+            if lookup is not None:
+                response = lookup.get(
+                    parsed_uri.scheme, addrs, parsed_uri.port, parsed_uri.path, headers, self.timeout)
+                if response is None:
+                    return None
+                status_code, text = response
+            else:
+                import requests
+
+                if parsed_uri.port:
+                    addrs = '{}:{}'.format(addrs, parsed_uri.port)
+                r = requests.get(
+                    '{}://{}{}'.format(parsed_uri.scheme, addrs, parsed_uri.path), headers=headers,
+                    timeout=self.timeout)
+                status_code, text = r.status_code, r.text
+            content = text.strip()
+            if status_code == 200 and content:
                 for c in content:
                     if c not in VALID_IP_CHARACTERS:
-                        print(content)
                         raise ValueError("Public IP response included invalid character '{}'.".format(c))
                 logging.debug('Public IP is {}'.format(content))
                 return content
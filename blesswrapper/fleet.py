@@ -0,0 +1,179 @@
+# Run a command on many hosts
+from __future__ import absolute_import
+import glob
+import subprocess
+import sys
+import threading
+import time
+
+PARALLEL = 10
+OUTPUT_PREFIX = 'prefix'
+OUTPUT_COLLECT = 'collect'
+
+
+def add_arguments(parser):
+    """ Add the options for choosing the hosts and how many to run on at once to parser """
+    parser.add_argument(
+        '--hosts',
+        action='append',
+        default=[],
+        help='Run on these comma separated hosts, with one certificate. Can be repeated'
+    )
+    parser.add_argument(
+        '--hosts-file',
+        action='append',
+        default=[],
+        help='Run on the hosts in this file (or files matching this glob), one per line'
+    )
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=PARALLEL,
+        help='The number of hosts to run on at once. Default {}'.format(PARALLEL)
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=None,
+        help='Give up on a host after this many seconds'
+    )
+
+
+def read_hosts(hosts=(), host_files=()):
+    """ The hosts to run on
+    Args:
+        hosts (list): comma separated lists of hosts
+        host_files (list): files with a host per line, or globs of them. Blank lines and
+            lines starting with # are skipped.
+    Returns (list): the hosts, in order, without duplicates
+    """
+    found = []
+    for host_list in hosts:
+        found.extend(host_list.split(','))
+    for pattern in host_files:
+        filenames = sorted(glob.glob(pattern))
+        if not filenames:
+            raise IOError('No host file matches {}'.format(pattern))
+        for filename in filenames:
+            with open(filename) as f:
+                found.extend(line.split('#', 1)[0] for line in f)
+    result = []
+    for host in found:
+        host = host.strip()
+        if host and host not in result:
+            result.append(host)
+    return result
+
+
+def parse_host(host, port=None):
+    """ Split [user@]host[:port]
+    Args:
+        port: the port when host doesn't have one
+    Returns (tuple): the user (or None), the hostname and the port
+    """
+    user = None
+    if '@' in host:
+        user, host = host.split('@', 1)
+    if host.count(':') == 1:
+        host, port = host.split(':')
+    return user, host, port
+
+
+def run_command(host, argv, output=OUTPUT_PREFIX, timeout=None, stream=None, write_lock=None):
+    """ Run a command for host, with its stdin closed
+    Args:
+        host (str): the host, to put in front of the output
+        argv (list): the command
+        output (str): OUTPUT_PREFIX to write every line of output as it comes, with
+            the host in front, or OUTPUT_COLLECT to only keep it
+        timeout (float): kill the command after this many seconds
+        stream (file): where the output goes, sys.stdout if None
+        write_lock (threading.Lock): held while writing to stream
+    Returns (dict): the host, the command's returncode (None if it was killed), the seconds
+        it took, and its output when collected
+    """
+    stream = stream or sys.stdout
+    write_lock = write_lock or threading.Lock()
+    start = time.time()
+    process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+    lines = []
+    try:
+        for line in iter(process.stdout.readline, b''):
+            line = line.decode('UTF-8', 'replace')
+            if output == OUTPUT_COLLECT:
+                lines.append(line)
+            else:
+                with write_lock:
+                    stream.write('{}: {}'.format(host, line if line.endswith('\n') else line + '\n'))
+                    stream.flush()
+        returncode = process.wait()
+    finally:
+        process.stdout.close()
+        if timer is not None:
+            timer.cancel()
+    if returncode < 0:
+        returncode = None
+    return {
+        'host': host,
+        'returncode': returncode,
+        'elapsed': time.time() - start,
+        'output': ''.join(lines) if output == OUTPUT_COLLECT else None,
+    }
+
+
+def run_all(hosts, run_host, parallel=PARALLEL, stream=None):
+    """ Call run_host for every host, parallel of them at a time. Collected output is
+    written as each host finishes.
+    Args:
+        run_host (callable): called with a host and a lock for writing to stream, returns
+            the result of run_command()
+        stream (file): where collected output goes, sys.stdout if None
+    Returns (list): the results, in the order of hosts
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    stream = stream or sys.stdout
+    write_lock = threading.Lock()
+
+    def run(host):
+        result = run_host(host, write_lock)
+        if result.get('output') is not None:
+            with write_lock:
+                stream.write('=== {} ({}) ===\n{}'.format(host, describe(result), result['output']))
+                stream.flush()
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(hosts)))) as executor:
+        return list(executor.map(run, hosts))
+
+
+def describe(result):
+    """ Returns (str): how the command for a host ended """
+    if result['returncode'] is None:
+        description = 'timed out after {:.1f}s'.format(result['elapsed'])
+    else:
+        description = 'exit {} after {:.1f}s'.format(result['returncode'], result['elapsed'])
+    if result.get('attempts', 1) > 1:
+        description += ' ({} attempts)'.format(result['attempts'])
+    return description
+
+
+def write_summary(results, name, stream=None, every_host=False):
+    """ Write how many hosts succeeded, and how the failed ones (or every host) ended
+    Args:
+        name (str): the program, in front of the summary
+        stream (file): sys.stderr if None
+    Returns (bool): True if the command succeeded on every host
+    """
+    stream = stream or sys.stderr
+    failed = [result for result in results if result['returncode'] != 0]
+    stream.write('{}: {} hosts, {} succeeded, {} failed\n'.format(
+        name, len(results), len(results) - len(failed), len(failed)))
+    for result in results:
+        if every_host or result['returncode'] != 0:
+            stream.write('  {}: {}\n'.format(result['host'], describe(result)))
+    return not failed
@@ -0,0 +1,181 @@
+#!/usr/local/bin/python
+# bscp: copy files to or from many hosts
+
+import argparse
+import os
+import sys
+import time
+
+from blessclient.client import get_bless_cache, load_config
+from blessclient.bless_config import BlessConfig
+from blesswrapper import fleet
+from blesswrapper.sshclient import check_aws_session, get_certificate, warn_ssh_version
+
+RETRIES = 2
+RETRY_DELAY = 1
+
+
+def get_direction(paths):
+    """ Whether paths push files to the hosts or pull them from the hosts. Paths on the
+    hosts start with ':'.
+    Args:
+        paths (list): the sources, then the destination
+    Returns (str): 'push' or 'pull', or None if paths don't copy one way
+    """
+    sources, destination = paths[:-1], paths[-1]
+    if destination.startswith(':') and not any(source.startswith(':') for source in sources):
+        return 'push'
+    if not destination.startswith(':') and all(source.startswith(':') for source in sources):
+        return 'pull'
+    return None
+
+
+def get_scp_argv(scp_options, paths, username, hostname, port, local_dir=None):
+    """ The scp command for one host
+    Args:
+        scp_options (list): the scp options for every host
+        paths (list): the sources, then the destination, paths on the host start with ':'
+        username (str): the user to log in as, or None
+        local_dir (str): where to pull files to instead of the destination
+    Returns (list): the command
+    """
+    remote = '{}@{}'.format(username, hostname) if username is not None else hostname
+    argv = ['scp'] + scp_options + ['-P', str(port)]
+    for path in paths[:-1]:
+        argv.append(remote + path if path.startswith(':') else path)
+    destination = paths[-1]
+    if destination.startswith(':'):
+        argv.append(remote + destination)
+    else:
+        argv.append(local_dir or destination)
+    return argv
+
+
+def run_with_retries(run, retries, delay=RETRY_DELAY):
+    """ Call run until it succeeds, at most retries more times
+    Args:
+        run (callable): returns the result of fleet.run_command()
+    Returns (dict): the last result, with the number of attempts and the seconds all of them took
+    """
+    start = time.time()
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(delay)
+        result = run()
+        if result['returncode'] == 0:
+            break
+    result['attempts'] = attempt + 1
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Bless SCP: copy files to or from many hosts. Paths on the hosts start with ":", '
+                    'e.g. bscp --hosts a,b app.tar.gz :/tmp/')
+    parser.add_argument('paths', nargs='+', help='The files to copy, then where to copy them to')
+    parser.add_argument('--nocache', action='store_true')
+    parser.add_argument(
+        '--config',
+        default=None,
+        help='Config file for blessclient. Default to ~/.aws/blessclient.cfg'
+    )
+    parser.add_argument(
+        '--download_config',
+        action='store_true',
+        help='Download blessclient.cfg from S3 bucket. Will overwrite if file already exist'
+    )
+    parser.add_argument(
+        '-4',
+        action='store_true',
+        help='Forces scp to use IPv4 addresses only.'
+    )
+    parser.add_argument(
+        '-6',
+        action='store_true',
+        help='Forces scp to use IPv6 addresses only.'
+    )
+    parser.add_argument(
+        '-r',
+        action='store_true',
+        help='Recursively copy entire directories.'
+    )
+    parser.add_argument(
+        '-l',
+        default=None,
+        help='Specifies the user to log in as on the remote machines. Defaults to IAM user'
+    )
+    parser.add_argument(
+        '-p',
+        default=22,
+        help='Port to connect to on the remote hosts. Default 22'
+    )
+    parser.add_argument(
+        '-F',
+        default=None,
+        help='Specifies an alternative per-user configuration file for ssh.'
+    )
+    fleet.add_arguments(parser)
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=RETRIES,
+        help='Try a host that failed this many more times. Default {}'.format(RETRIES)
+    )
+    args = parser.parse_args()
+
+    direction = get_direction(args.paths) if len(args.paths) >= 2 else None
+    if direction is None:
+        parser.error('give the files to copy and where to copy them to, with the paths on the hosts starting with ":"')
+    if vars(args)['4'] and vars(args)['6']:
+        parser.error('-4 and -6 are mutually exclusive')
+
+    check_aws_session()
+
+    try:
+        hosts = fleet.read_hosts(args.hosts, args.hosts_file)
+    except IOError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    if not hosts:
+        sys.stderr.write('No hosts to copy to, use --hosts or --hosts-file\n')
+        sys.exit(1)
+
+    # Nobody can answer a password prompt
+    scp_options = ['-o', 'BatchMode=yes']
+    for option in ('4', '6', 'r'):
+        if vars(args)[option]:
+            scp_options.append('-' + option)
+    if args.F is not None:
+        scp_options += ['-F', args.F]
+
+    bless_config = BlessConfig()
+    if load_config(bless_config, args.config, args.download_config) is False:
+        sys.exit(1)
+
+    warn_ssh_version(get_bless_cache(args.nocache, bless_config))
+
+    blessclient_output = get_certificate(args, bless_config, [fleet.parse_host(host)[1] for host in hosts], args.l)
+    if blessclient_output is None:
+        sys.exit(1)
+
+    def copy_host(host, write_lock):
+        username, hostname, port = fleet.parse_host(host, args.p)
+        username = blessclient_output.get('username') or args.l or username
+        local_dir = None
+        if direction == 'pull' and len(hosts) > 1:
+            # Files from every host go in a directory named after the host
+            local_dir = os.path.join(args.paths[-1], hostname)
+            if not os.path.isdir(local_dir):
+                os.makedirs(local_dir)
+        argv = get_scp_argv(scp_options, args.paths, username, hostname, port, local_dir)
+        return run_with_retries(
+            lambda: fleet.run_command(host, argv, fleet.OUTPUT_PREFIX, args.timeout, write_lock=write_lock),
+            args.retries)
+
+    results = fleet.run_all(hosts, copy_host, args.parallel)
+    sys.exit(0 if fleet.write_summary(results, 'bscp', every_host=True) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,14 +6,110 @@ import os
 import sys
 import datetime
 import re
+import shutil
 
-from blessclient.client import bless, get_region_from_code, get_regions, load_config
+from blessclient.client import get_bless_cache, get_region_from_code, load_config, request_cert
 from blessclient.bless_config import BlessConfig
+from blesswrapper import fleet
+
+
+def get_ssh_version(bless_cache):
+    """ The OpenSSH version of the ssh on PATH. `ssh -V` is only run when the
+    ssh binary has changed since the version was cached.
+    Args:
+        bless_cache (BlessCache): the bless cache
+    Returns (str): version, e.g. 'OpenSSH_7.8p1', or None if ssh isn't OpenSSH
+    """
+    ssh_path = os.path.realpath(shutil.which('ssh'))
+    ssh_mtime = os.path.getmtime(ssh_path)
+    cached = bless_cache.get('ssh_version')
+    if cached and cached['path'] == ssh_path and cached['mtime'] == ssh_mtime:
+        return cached['version']
+
+    output = subprocess.check_output([ssh_path, '-V'], stderr=subprocess.STDOUT).decode('UTF-8')
+    ssh_version = re.search(r'OpenSSH_([^\s,]+)', output)
+    version = ssh_version.group(0) if ssh_version else None
+    bless_cache.set('ssh_version', {'path': ssh_path, 'mtime': ssh_mtime, 'version': version})
+    bless_cache.save()
+    return version
+
+
+def warn_ssh_version(bless_cache):
+    """ Warn about OpenSSH 7.8, which doesn't work with bless certificates """
+    try:
+        ssh_version = get_ssh_version(bless_cache)
+        if ssh_version and '7.8' in ssh_version:
+            sys.stderr.write("""@@@@@@@ WARNING @@@@@@@
+There is a bug in OpenSSH version 7.8 that makes signed ssh keys not work, and thus Bless does not work.
+From our knowledge, the bug only affects the ssh client.
+sshd version 7.7 or 7.9 should work with Bless.
+We detected that you are running {}
+""".format(ssh_version)+'\n'+'-'*64)
+    except Exception as e:
+        sys.stderr.write('Failed to get OpenSSH client version\n')
+
+
+def check_aws_session():
+    """ Exit if there's no AWS session, or it has expired """
+    if 'AWS_PROFILE' not in os.environ:
+        sys.stderr.write('AWS session not found. Try running get_session first?\n')
+        sys.exit(1)
+
+    if 'AWS_EXPIRATION_S' in os.environ:
+        expiration = datetime.datetime.fromtimestamp(int(os.environ['AWS_EXPIRATION_S']))
+        if expiration < datetime.datetime.now():
+            sys.stderr.write('AWS session expired. Try running get_session first?\n')
+            sys.exit(1)
+
+
+def get_certificate(args, bless_config, hostname, username):
+    """ Get a certificate for hostname (or a list of hosts), quietly
+    Returns (dict): output of request_cert(), or None if no certificate could be had
+    """
+    start_region = get_region_from_code(None, bless_config)
+    os.environ['BLESSQUIET'] = "1"
+    try:
+        return request_cert(start_region, args.nocache, False, hostname, bless_config, args.config, username)
+    except SystemExit:
+        return None
+
+
+def run_fleet(args, ssh_options, bless_config):
+    """ Run args.cmd on the hosts of --hosts and --hosts-file, with one certificate for all of them
+    Args:
+        ssh_options (list): the ssh options for every host
+    Returns (int): the exit status, 0 if the command succeeded on every host
+    """
+    try:
+        hosts = fleet.read_hosts(args.hosts, args.hosts_file)
+    except IOError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return 1
+    if not hosts:
+        sys.stderr.write('No hosts to run on\n')
+        return 1
+
+    blessclient_output = get_certificate(
+        args, bless_config, [fleet.parse_host(host)[1] for host in hosts], args.l)
+    if blessclient_output is None:
+        return 1
+
+    def run_host(host, write_lock):
+        username, hostname, port = fleet.parse_host(host, args.p)
+        username = blessclient_output.get('username') or args.l or username
+        # Nobody can answer a password prompt
+        argv = ['ssh', hostname] + ssh_options + ['-p', str(port), '-o', 'BatchMode=yes']
+        if username is not None:
+            argv += ['-l', username]
+        return fleet.run_command(host, argv + args.cmd, args.output, args.timeout, write_lock=write_lock)
+
+    results = fleet.run_all(hosts, run_host, args.parallel)
+    return 0 if fleet.write_summary(results, 'bssh') else 1
 
 
 def main():
     parser = argparse.ArgumentParser(description='Bless SSH')
-    parser.add_argument('host')
+    parser.add_argument('host', nargs='?', help='The host to connect to. Part of the command with --hosts')
     parser.add_argument('cmd', nargs='*')
     parser.add_argument('--nocache', action='store_true')
     parser.add_argument(
@@ -66,29 +162,23 @@ def main():
         default=None,
         help='Specifies an alternative per-user configuration file for ssh.'
     )
+    fleet.add_arguments(parser)
+    parser.add_argument(
+        '--output',
+        choices=[fleet.OUTPUT_PREFIX, fleet.OUTPUT_COLLECT],
+        default=fleet.OUTPUT_PREFIX,
+        help='With --hosts, print output as it comes with the host in front of every line, '
+             'or collected per host when it is done'
+    )
     args = parser.parse_args()
+    fleet_mode = bool(args.hosts or args.hosts_file)
+    if fleet_mode:
+        # There's no single host, the first positional argument is part of the command
+        args.cmd = ([args.host] if args.host is not None else []) + args.cmd
+    elif args.host is None:
+        parser.error('the following arguments are required: host')
 
-    if 'AWS_PROFILE' not in os.environ:
-        sys.stderr.write('AWS session not found. Try running get_session first?\n')
-        sys.exit(1)
-
-    if 'AWS_EXPIRATION_S' in os.environ:
-        expiration = datetime.datetime.fromtimestamp(int(os.environ['AWS_EXPIRATION_S']))
-        if expiration < datetime.datetime.now():
-            sys.stderr.write('AWS session expired. Try running get_session first?\n')
-            sys.exit(1)
-
-    try:
-        ssh_version = re.search('OpenSSH_([^\s]+)', subprocess.check_output(['ssh', '-V'], stderr=subprocess.STDOUT).decode('UTF-8'))
-        if '7.8' in ssh_version.group(0):
-            sys.stderr.write("""@@@@@@@ WARNING @@@@@@@
-There is a bug in OpenSSH version 7.8 that makes signed ssh keys not work, and thus Bless does not work.
-From our knowledge, the bug only affects the ssh client.
-sshd version 7.7 or 7.9 should work with Bless.
-We detected that you are running {}
-""".format(ssh_version.group(0))+'\n'+'-'*64)
-    except Exception as e:
-        sys.stderr.write('Failed to get OpenSSH client version\n')
+    check_aws_session()
 
     ssh_options = []
     if vars(args)['4']:
@@ -108,21 +198,17 @@ We detected that you are running {}
         ssh_options.append('-F')
         ssh_options.append(args.F)
 
-    hostname = None
-    username = None
-    port = args.p
+    bless_config = BlessConfig()
+
+    if load_config(bless_config, args.config, args.download_config) is False:
+        sys.exit(1)
+
+    warn_ssh_version(get_bless_cache(args.nocache, bless_config))
 
-    host = args.host.split('@')
-    if len(host) == 2:
-        hostname = host[1]
-        username = host[0]
-    else:
-        hostname = host[0]
+    if fleet_mode:
+        sys.exit(run_fleet(args, ssh_options, bless_config))
 
-    host = hostname.split(':')
-    if len(host) == 2:
-        hostname = host[0]
-        port = host[1]
+    username, hostname, port = fleet.parse_host(args.host, args.p)
 
     ssh_options.append('-p')
     ssh_options.append(str(port))
@@ -130,22 +216,8 @@ We detected that you are running {}
     if args.l is not None:
         username = args.l
 
-    blessclient_output = []
-    bless_config = BlessConfig()
-
-    if load_config(bless_config, args.config, args.download_config) is False:
-        sys.exit(1)
-
-    start_region = get_region_from_code(None, bless_config)
-    for region in get_regions(start_region, bless_config):
-        try:
-            os.environ['BLESSQUIET'] = "1"
-            blessclient_output = bless(region, args.nocache, False, hostname, bless_config, username)
-            break
-        except SystemExit:
-            pass
-
-    if blessclient_output == []:
+    blessclient_output = get_certificate(args, bless_config, hostname, username)
+    if blessclient_output is None:
         sys.exit(1)
 
     if 'username' in blessclient_output:
@@ -159,4 +231,7 @@ We detected that you are running {}
         for cmd in args.cmd:
             ssh_options.append(cmd)
 
-    subprocess.call(['ssh', hostname] + ssh_options)
+    # Replace this process with ssh, rather than keeping python around for the session
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvp('ssh', ['ssh', hostname] + ssh_options)
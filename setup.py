@@ -4,6 +4,11 @@ setup(
     name="blessclient",
     version="0.4.2",
     packages=find_packages(exclude=["test*"]),
+    python_requires=">=3.6",
+    # Trimmed botocore data, only present if built with `make botocore_data`
+    package_data={
+        "blessclient": ["botocore_data/*.json", "botocore_data/*/*/*.json"],
+    },
     install_requires=[
         'boto3>=1.4.0,<2.0.0',
         'psutil>=4.3',
@@ -22,7 +27,10 @@ setup(
     entry_points={
         "console_scripts": [
             "blessclient = blessclient.client:main",
-            "bssh = blesswrapper.sshclient:main"
+            "blessclient-fast = blessclient.fastpath:main",
+            "blessd = blessclient.blessd:main",
+            "bssh = blesswrapper.sshclient:main",
+            "bscp = blesswrapper.scpclient:main"
         ],
     },
 )
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Time creating the Lambda and STS clients with botocore's full data tree and
+# with the trimmed data from blessclient.aws_data. Each sample is a fresh
+# interpreter, since the data loader caches everything it has read.
+#
+#   python tests/benchmarks/botocore_data_bench.py [--runs 10]
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE = """
+import json
+import sys
+import time
+import boto3
+from blessclient import aws_data
+
+data_dir = sys.argv[1]
+if data_dir:
+    session = boto3.session.Session(botocore_session=aws_data.create_botocore_session(data_dir))
+else:
+    session = boto3.session.Session()
+times = {}
+for service in ('lambda', 'sts'):
+    start = time.time()
+    session.client(service, region_name='us-east-1', aws_access_key_id='AKID', aws_secret_access_key='SECRET')
+    times[service] = (time.time() - start) * 1000
+print(json.dumps(times))
+"""
+
+
+def sample(data_dir):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, '-c', SAMPLE, data_dir], env=env)
+    return json.loads(output.decode('UTF-8'))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark boto3 client creation with trimmed botocore data')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from blessclient import aws_data
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        aws_data.build_bundle(os.path.join(data_dir, 'data'))
+        results = {}
+        for name, path in (('botocore data', ''), ('trimmed data', os.path.join(data_dir, 'data'))):
+            samples = [sample(path) for _ in range(args.runs)]
+            results[name] = dict((service, median([s[service] for s in samples])) for service in ('lambda', 'sts'))
+    finally:
+        shutil.rmtree(data_dir)
+
+    # The first client created also loads endpoints.json, so the total is the fairer comparison
+    print('{:<16}{:>12}{:>12}{:>12}'.format('', 'lambda (ms)', 'sts (ms)', 'total (ms)'))
+    for name in ('botocore data', 'trimmed data'):
+        times = results[name]
+        print('{:<16}{:>12.1f}{:>12.1f}{:>12.1f}'.format(name, times['lambda'], times['sts'], times['lambda'] + times['sts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# Startup benchmarks for blessclient (blessclient.client:main) and bssh
+# (blesswrapper.sshclient:main), with regression budgets.
+#
+# Every sample runs the entry point in a fresh interpreter, with HOME pointing at
+# a scratch directory holding the config, bless cache, identity file and cert.
+# AWS is a local stub server (through AWS_ENDPOINT_URL), and ssh, ssh-add and aws
+# are stub scripts on PATH, so nothing leaves the machine. Scenarios:
+#
+#   fresh           cert is fresh, nothing is called
+#   expired         cert has expired, issue a new one through boto3 (STS, KMS, Lambda)
+#   expired-native  as expired, with aws_transport: native
+#   download        --download_config from S3, then a fresh cert
+#
+# For each entry point and scenario the median wall time and the total
+# `-X importtime` are divided by the same measurements of a reference run (a
+# fresh interpreter importing a few stdlib modules) taken between the samples,
+# so the results depend little on the machine or its load. These ratios are
+# compared with startup_baselines.json, and the run fails if either is over the
+# baseline by more than the budget.
+#
+#   python tests/benchmarks/startup_bench.py [--runs 10] [--update-baselines]
+from __future__ import print_function
+import argparse
+import base64
+import datetime
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baselines.json')
+
+ENTRY_POINTS = {
+    'blessclient': 'import sys; from blessclient.client import main; sys.argv[0] = "blessclient"; main()',
+    'bssh': 'import sys; from blesswrapper.sshclient import main; sys.argv[0] = "bssh"; main()',
+}
+# Started the same way as the entry points, to measure how fast this machine is
+REFERENCE = 'import argparse, configparser, json, logging, subprocess, threading'
+SCENARIOS = ('fresh', 'expired', 'expired-native', 'download')
+HOST = 'host.example.com'
+CERT = 'ssh-rsa-cert-v01@openssh.com AAAAbenchmark'
+PUBLIC_KEY = 'ssh-rsa AAAAbenchmark bench@example.com\n'
+BUCKET = 'bless-bench-bucket'
+
+CONFIG = """
+[MAIN]
+region_aliases: IAD
+kms_service_name: bless-production
+bastion_ips: 10.0.0.0/8
+remote_user: bench
+
+[CLIENT]
+domain_regex: (.*\\.example\\.com)$
+cache_dir: .bless/session
+cache_file: bless_cache.json
+mfa_cache_dir: .aws/session
+mfa_cache_file: token_cache.json
+ip_urls: http://127.0.0.1:1
+update_script: autoupdate.sh
+update_sshagent: false
+aws_transport: {aws_transport}
+
+[LAMBDA]
+user_role: use-bless
+account_id: 111111111111
+functionname: lyft_bless
+functionversion: PROD-1-2
+certlifetime: 1800
+ipcachelifetime: 120
+timeout_connect: 5
+timeout_read: 10
+
+[REGION_IAD]
+awsregion: us-east-1
+kmsauthkey: zxywvuts-0123-4567-8910-abcdefghijkl
+"""
+
+STUBS = {
+    'ssh': '#!/bin/sh\n[ "$1" = "-V" ] && echo "OpenSSH_9.6p1, OpenSSL 3.0.13" >&2\nexit 0\n',
+    'ssh-add': '#!/bin/sh\nexit 1\n',
+    'aws': '#!/bin/sh\necho {}\n'.format(BUCKET),
+}
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ASIABENCH</AccessKeyId>
+      <SecretAccessKey>BENCHSECRET</SecretAccessKey>
+      <SessionToken>BENCHTOKEN</SessionToken>
+      <Expiration>{}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROABENCH:mfaassume</AssumedRoleId>
+      <Arn>arn:aws:sts::111111111111:assumed-role/use-bless/mfaassume</Arn>
+    </AssumedRoleUser>
+  </AssumeRoleResult>
+  <ResponseMetadata><RequestId>bench</RequestId></ResponseMetadata>
+</AssumeRoleResponse>"""
+
+
+class StubAWSHandler(BaseHTTPRequestHandler):
+    """ Answers the STS, KMS, Lambda and S3 calls blessclient makes """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, content_type, extra_headers=None, send_body=True):
+        # Simulated round trip to AWS
+        time.sleep(self.server.latency / 1000.0)
+        body = body.encode('UTF-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-amzn-RequestId', 'bench')
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('UTF-8')
+        if self.path.startswith('/2015-03-31/functions/'):
+            self._reply(json.dumps({'certificate': CERT}), 'application/json')
+        elif self.headers.get('X-Amz-Target', '').startswith('TrentService.'):
+            self._reply(json.dumps({
+                'CiphertextBlob': base64.b64encode(b'benchmark kmsauth token').decode('US-ASCII'),
+                'KeyId': 'arn:aws:kms:us-east-1:111111111111:key/zxywvuts-0123-4567-8910-abcdefghijkl',
+            }), 'application/x-amz-json-1.1')
+        elif 'Action=AssumeRole' in body:
+            expiration = (datetime.datetime.utcnow() + datetime.timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            self._reply(ASSUME_ROLE_RESPONSE.format(expiration), 'text/xml')
+        else:
+            self.send_error(400)
+
+    def _s3_object(self, send_body):
+        if not self.path.split('?')[0].endswith('/blessclient/blessclient.cfg'):
+            self.send_error(404)
+            return
+        self._reply(self.server.config, 'binary/octet-stream', {
+            'ETag': '"bench"',
+            'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT',
+        }, send_body)
+
+    def do_HEAD(self):
+        self._s3_object(False)
+
+    def do_GET(self):
+        self._s3_object(True)
+
+
+class StubAWSServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    latency = 0
+
+
+def write_stub(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def make_home(path, scenario):
+    """ Create the scratch home directory for a scenario """
+    os.makedirs(os.path.join(path, '.aws'))
+    os.makedirs(os.path.join(path, '.ssh'))
+    os.makedirs(os.path.join(path, '.bless', 'session'))
+    os.makedirs(os.path.join(path, 'bin'))
+    config = CONFIG.format(aws_transport='native' if scenario == 'expired-native' else 'boto3')
+    with open(os.path.join(path, '.aws', 'blessclient.cfg'), 'w') as f:
+        f.write(config)
+    with open(os.path.join(path, '.aws', 'config'), 'w') as f:
+        f.write('[profile bench]\nregion = us-east-1\n')
+    with open(os.path.join(path, '.ssh', 'blessid'), 'w') as f:
+        f.write('not a real key\n')
+    with open(os.path.join(path, '.ssh', 'blessid.pub'), 'w') as f:
+        f.write(PUBLIC_KEY)
+    cert_file = os.path.join(path, '.ssh', 'blessid-cert.pub')
+    with open(cert_file, 'w') as f:
+        f.write(CERT)
+    if scenario.startswith('expired'):
+        expired = time.time() - 3600
+        os.utime(cert_file, (expired, expired))
+    with open(os.path.join(path, '.bless', 'session', 'bless_cache.json'), 'w') as f:
+        json.dump({
+            'username': 'bench',
+            'userarn': 'arn:aws:iam::111111111111:user/bench',
+            'last_updated': datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ'),
+            'lastip': '1.2.3.4',
+            '__expires__': {'lastip': time.time() + 120},
+            'certip': '1.2.3.4',
+            'bastion_ips': '1.2.3.4,10.0.0.0/8',
+        }, f)
+    for name, content in STUBS.items():
+        write_stub(os.path.join(path, 'bin', name), content)
+
+
+def get_env(home, endpoint):
+    env = dict(os.environ)
+    for var in list(env):
+        if var.startswith(('AWS_', 'BLESS')):
+            del env[var]
+    env.update({
+        'HOME': home,
+        'PATH': os.path.join(home, 'bin') + os.pathsep + env.get('PATH', ''),
+        'PYTHONPATH': ROOT,
+        'AWS_PROFILE': 'bench',
+        'AWS_ACCESS_KEY_ID': 'AKIABENCH',
+        'AWS_SECRET_ACCESS_KEY': 'BENCHSECRET',
+        'AWS_SESSION_TOKEN': 'BENCHTOKEN',
+        'AWS_EXPIRATION_S': str(int(time.time()) + 3600),
+        'AWS_ENDPOINT_URL': endpoint,
+        'BLESSFIXEDIP': '1.2.3.4',
+        'BLESSQUIET': '1',
+    })
+    return env
+
+
+def get_args(scenario):
+    if scenario == 'download':
+        return [HOST, '--download_config']
+    return [HOST]
+
+
+def run_sample(entry_point, scenario, endpoint, workdir, importtime=False):
+    """ Run the entry point once in a fresh home directory
+    Returns (float): wall time in ms, or the total import time in ms with importtime
+    """
+    home = tempfile.mkdtemp(dir=workdir)
+    shutil.rmtree(home)
+    make_home(home, scenario)
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', ENTRY_POINTS[entry_point]] + get_args(scenario)
+
+    start = time.time()
+    process = subprocess.Popen(
+        command, env=get_env(home, endpoint), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    elapsed = (time.time() - start) * 1000
+    if process.returncode != 0:
+        raise RuntimeError('{} {} exited with {}:\n{}'.format(
+            entry_point, scenario, process.returncode, stderr.decode('UTF-8', 'replace')))
+    if scenario.startswith('expired') and os.path.getmtime(os.path.join(home, '.ssh', 'blessid-cert.pub')) < start - 1:
+        raise RuntimeError('{} {} did not write a new cert'.format(entry_point, scenario))
+    shutil.rmtree(home)
+    if importtime:
+        return get_import_time(stderr.decode('UTF-8', 'replace'))
+    return elapsed
+
+
+def run_reference(importtime=False):
+    """ Run REFERENCE once
+    Returns (float): wall time in ms, or the total import time in ms with importtime
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', REFERENCE]
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    elapsed = (time.time() - start) * 1000
+    if importtime:
+        return get_import_time(stderr.decode('UTF-8', 'replace'))
+    return elapsed
+
+
+def get_import_time(stderr):
+    """ Total of the self times reported by -X importtime, in ms """
+    total = 0
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us = line[len('import time:'):].split('|')[0].strip()
+            if self_us.isdigit():
+                total += int(self_us)
+    return total / 1000.0
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def load_baselines():
+    try:
+        with open(BASELINES_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return {'budget': 0.25, 'results': {}}
+
+
+def check_budget(name, metric, measured, baselines):
+    """ Returns (str): a regression message, or None if measured is within budget
+    Args:
+        measured (float): the measurement divided by the reference's
+    """
+    baseline = baselines['results'].get(name, {}).get(metric)
+    if baseline is None:
+        return None
+    limit = baseline * (1 + baselines['budget'])
+    if measured > limit:
+        return '{} {}: {:.2f}x the reference is over the budget of {:.2f}x (baseline {:.2f}x)'.format(
+            name, metric, measured, limit, baseline)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark blessclient and bssh startup')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Scenario to run, default all')
+    parser.add_argument('--entry-point', action='append', choices=sorted(ENTRY_POINTS), help='Default all')
+    parser.add_argument('--update-baselines', action='store_true', help='Save the results as the new baselines')
+    parser.add_argument(
+        '--latency', type=int, default=0,
+        help='Delay every AWS stub response by this many ms. The results are not compared with the baselines')
+    args = parser.parse_args()
+    if args.latency and args.update_baselines:
+        parser.error('the baselines are measured without --latency')
+
+    baselines = load_baselines()
+    server = StubAWSServer(('127.0.0.1', 0), StubAWSHandler)
+    server.config = CONFIG.format(aws_transport='boto3')
+    server.latency = args.latency
+    threading.Thread(target=server.serve_forever).start()
+    endpoint = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    workdir = tempfile.mkdtemp()
+
+    results = {}
+    try:
+        run_reference()
+        for entry_point in args.entry_point or sorted(ENTRY_POINTS):
+            for scenario in args.scenario or SCENARIOS:
+                # One untimed run, so every sample sees warm OS caches and bytecode
+                run_sample(entry_point, scenario, endpoint, workdir)
+                result = {}
+                for metric, importtime in (('wall', False), ('import', True)):
+                    # A reference sample before every sample, so both see the same load
+                    samples, references = [], []
+                    for _ in range(args.runs):
+                        references.append(run_reference(importtime))
+                        samples.append(run_sample(entry_point, scenario, endpoint, workdir, importtime))
+                    result[metric + '_ms'] = round(median(samples), 1)
+                    result[metric] = round(median(samples) / median(references), 2)
+                results['{}/{}'.format(entry_point, scenario)] = result
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+
+    regressions = []
+    print('{:<30}{:>12}{:>12}{:>10}{:>10}{:>12}{:>12}'.format(
+        '', 'wall (ms)', 'import (ms)', 'wall', 'import', 'base wall', 'base import'))
+    for name, result in sorted(results.items()):
+        baseline = baselines['results'].get(name, {})
+        print('{:<30}{:>12.1f}{:>12.1f}{:>9.2f}x{:>9.2f}x{:>12}{:>12}'.format(
+            name, result['wall_ms'], result['import_ms'], result['wall'], result['import'],
+            '{:.2f}x'.format(baseline['wall']) if 'wall' in baseline else '-',
+            '{:.2f}x'.format(baseline['import']) if 'import' in baseline else '-'))
+        for metric in ('wall', 'import'):
+            regressions.append(check_budget(name, metric, result[metric], baselines))
+    regressions = [r for r in regressions if r and not args.latency]
+
+    if args.update_baselines:
+        baselines['results'].update(
+            (name, {'wall': result['wall'], 'import': result['import']}) for name, result in results.items())
+        with open(BASELINES_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved baselines to {}'.format(BASELINES_FILE))
+    elif regressions:
+        print('\n'.join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
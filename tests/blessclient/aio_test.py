@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+
+from blessclient import aio
+from blessclient.bless_cache import BlessCache
+from blessclient.lambda_invocation_exception import LambdaInvocationException
+
+
+@pytest.fixture
+def bless_config(mocker):
+    bc = mocker.MagicMock()
+    bc.get.return_value = {'ca_backend': 'bless'}
+    bc.get_lambda_config.return_value = {'certlifetime': 1800}
+    bc.get_client_config.return_value = {'use_env_creds': True}
+    return bc
+
+
+@pytest.fixture
+def aio_client(mocker):
+    """ aio.client, with the calls to AWS and the Lambda replaced """
+    client = mocker.patch.object(aio, 'client')
+    client.get_user_ip.return_value.getIP.return_value = '1.2.3.4'
+    client.get_username.return_value = 'user'
+    client.get_ip_list.return_value = (None, '1.2.3.4')
+    client.env_creds_task.side_effect = lambda func: func
+    client.get_kmsauth_token.return_value = 'token'
+    client.get_blessrole_credentials.return_value = {'AccessKeyId': 'AKIA'}
+    client.is_cert_expired.return_value = True
+    client.check_fresh_cert.return_value = False
+    client.get_regions.return_value = ['us-east-1', 'us-west-2']
+    client.is_region_error.side_effect = lambda e: isinstance(e, LambdaInvocationException)
+    return client
+
+
+def test_run_does_not_block():
+    barrier = threading.Barrier(2, timeout=5)
+
+    async def both():
+        # Deadlocks (and times out) unless both calls run at the same time
+        return await asyncio.gather(aio.run(barrier.wait), aio.run(barrier.wait))
+
+    assert sorted(aio.run_until_complete(both())) == [0, 1]
+
+
+def test_bless(aio_client, bless_config, tmpdir):
+    bless_cache = BlessCache(str(tmpdir), 'cache')
+    result = aio.run_until_complete(aio.bless(
+        'us-east-1', 'host.example.com', bless_config, identity_file='/tmp/blessid', aws=object(),
+        bless_cache=bless_cache))
+    assert result == {'username': 'user'}
+    args = aio_client.issue_cert_once.call_args[0]
+    assert args[3] == 'token'
+    assert args[5:11] == ('us-east-1', 'user', '/tmp/blessid', '1.2.3.4', None, '1.2.3.4')
+
+
+def test_bless_fresh(aio_client, bless_config, tmpdir):
+    aio_client.is_cert_expired.return_value = False
+    aio_client.get_cached_ip_list.return_value = '1.2.3.4'
+    aio_client.check_fresh_cert.return_value = True
+    result = aio.run_until_complete(aio.bless(
+        'us-east-1', 'host.example.com', bless_config, identity_file='/tmp/blessid', aws=object(),
+        bless_cache=BlessCache(str(tmpdir), 'cache')))
+    assert result == {'username': 'user'}
+    aio_client.get_kmsauth_token.assert_not_called()
+    aio_client.issue_cert_once.assert_not_called()
+
+
+def test_bless_no_session(aio_client, bless_config, tmpdir):
+    aio_client.get_kmsauth_token.return_value = None
+    with pytest.raises(Exception, match='AWS session not working'):
+        aio.run_until_complete(aio.bless(
+            'us-east-1', 'host.example.com', bless_config, identity_file='/tmp/blessid', aws=object(),
+            bless_cache=BlessCache(str(tmpdir), 'cache')))
+    aio_client.issue_cert_once.assert_not_called()
+
+
+def test_get_cert_failover(aio_client, bless_config, tmpdir):
+    aio_client.issue_cert_once.side_effect = [LambdaInvocationException('failed'), True]
+    result = aio.run_until_complete(aio.get_cert(
+        'us-east-1', 'host.example.com', bless_config, identity_file='/tmp/blessid', aws=object(),
+        bless_cache=BlessCache(str(tmpdir), 'cache')))
+    assert result == {'username': 'user'}
+    assert [c[0][5] for c in aio_client.issue_cert_once.call_args_list] == ['us-east-1', 'us-west-2']
+
+
+def test_get_cert_concurrent(aio_client, bless_config, tmpdir):
+    barrier = threading.Barrier(3, timeout=5)
+    aio_client.issue_cert_once.side_effect = lambda *args: barrier.wait()
+    bless_cache = BlessCache(str(tmpdir), 'cache')
+
+    async def many():
+        # Deadlocks (and times out) unless the three certs are requested at the same time
+        return await asyncio.gather(*[aio.get_cert(
+            'us-east-1', host, bless_config, identity_file='/tmp/{}'.format(host), aws=object(),
+            bless_cache=bless_cache) for host in ('a', 'b', 'c')])
+
+    assert aio.run_until_complete(many()) == [{'username': 'user'}] * 3
+
+
+def test_run_until_complete(mocker):
+    new_event_loop = mocker.spy(asyncio, 'new_event_loop')
+
+    async def answer():
+        return 42
+
+    assert aio.run_until_complete(answer()) == 42
+    assert new_event_loop.spy_return.is_closed()
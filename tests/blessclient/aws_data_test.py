@@ -0,0 +1,53 @@
+import json
+import os
+import boto3
+import botocore
+import pytest
+from blessclient import aws_data
+
+
+@pytest.fixture(scope='module')
+def bundle(tmpdir_factory):
+    dest = str(tmpdir_factory.mktemp('botocore_data').join('data'))
+    aws_data.build_bundle(dest)
+    return dest
+
+
+def test_build_bundle(bundle):
+    with open(os.path.join(bundle, aws_data.MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    assert manifest['botocore_version'] == botocore.__version__
+    assert sorted(d for d in os.listdir(bundle) if os.path.isdir(os.path.join(bundle, d))) == list(aws_data.SERVICES)
+    with open(os.path.join(bundle, 'endpoints.json')) as f:
+        endpoints = json.load(f)
+    for partition in endpoints['partitions']:
+        assert set(partition['services']) <= set(aws_data.SERVICES)
+
+
+def test_build_bundle_strips_documentation(bundle):
+    sts = os.path.join(bundle, 'sts')
+    with open(os.path.join(sts, os.listdir(sts)[0], 'service-2.json')) as f:
+        assert '"documentation":"' not in f.read()
+
+
+def test_is_bundle_usable(bundle, tmpdir, mocker):
+    assert aws_data.is_bundle_usable(bundle) is True
+    assert aws_data.is_bundle_usable(str(tmpdir)) is False
+    mocker.patch.object(botocore, '__version__', '0.0.1')
+    assert aws_data.is_bundle_usable(bundle) is False
+
+
+def test_create_botocore_session(bundle):
+    session = aws_data.create_botocore_session(bundle)
+    assert session.get_component('data_loader').search_paths == [bundle]
+    client = boto3.session.Session(botocore_session=session).client(
+        'lambda',
+        region_name='us-east-1',
+        aws_access_key_id='foo',
+        aws_secret_access_key='bar')
+    assert client.meta.endpoint_url == 'https://lambda.us-east-1.amazonaws.com'
+
+
+def test_create_botocore_session_unusable(tmpdir):
+    session = aws_data.create_botocore_session(str(tmpdir))
+    assert str(tmpdir) not in session.get_component('data_loader').search_paths
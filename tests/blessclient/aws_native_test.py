@@ -0,0 +1,126 @@
+import base64
+import datetime
+import json
+import pytest
+from blessclient import aws_native
+from blessclient.lambda_invocation_exception import LambdaInvocationException
+
+
+CREDS = {'AccessKeyId': 'AKID', 'SecretAccessKey': 'SECRET', 'SessionToken': 'TOKEN'}
+
+ASSUME_ROLE_RESPONSE = b'''<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ASIAROLE</AccessKeyId>
+      <SecretAccessKey>ROLESECRET</SecretAccessKey>
+      <SessionToken>ROLETOKEN</SessionToken>
+      <Expiration>2017-01-01T01:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleResult>
+</AssumeRoleResponse>'''
+
+STS_ERROR_RESPONSE = b'''<ErrorResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <Error><Type>Sender</Type><Code>AccessDenied</Code><Message>Not allowed</Message></Error>
+</ErrorResponse>'''
+
+
+@pytest.fixture
+def aws_env(monkeypatch, tmpdir):
+    for var in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE',
+                'AWS_DEFAULT_PROFILE', 'AWS_ENDPOINT_URL', 'AWS_ENDPOINT_URL_STS', 'AWS_ENDPOINT_URL_KMS',
+                'AWS_REGION', 'AWS_DEFAULT_REGION'):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv('AWS_CONFIG_FILE', str(tmpdir.join('config')))
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(tmpdir.join('credentials')))
+    return tmpdir
+
+
+def mock_response(mocker, status_code=200, content=b'', headers=None):
+    response = mocker.MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+def test_resolve_credentials(monkeypatch, aws_env):
+    assert aws_native.resolve_credentials(CREDS) is CREDS
+    assert aws_native.resolve_credentials() is None
+
+    aws_env.join('credentials').write('[default]\naws_access_key_id = FILEKEY\naws_secret_access_key = FILESECRET\n')
+    assert aws_native.resolve_credentials() == {
+        'AccessKeyId': 'FILEKEY', 'SecretAccessKey': 'FILESECRET', 'SessionToken': None}
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'ENVKEY')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'ENVSECRET')
+    assert aws_native.resolve_credentials()['AccessKeyId'] == 'ENVKEY'
+
+
+def test_resolve_credentials_needs_boto3(monkeypatch, aws_env):
+    monkeypatch.setenv('AWS_PROFILE', 'admin')
+    aws_env.join('credentials').write('[admin]\naws_access_key_id = FILEKEY\naws_secret_access_key = FILESECRET\n')
+    aws_env.join('config').write('[profile admin]\nrole_arn = arn:aws:iam::111111111111:role/admin\n')
+    assert aws_native.resolve_credentials() is None
+
+
+def test_get_sts_region(monkeypatch, aws_env):
+    assert aws_native.get_sts_region() == 'us-east-1'
+    monkeypatch.setenv('AWS_PROFILE', 'admin')
+    aws_env.join('config').write('[default]\nregion = eu-west-1\n[profile admin]\nregion = eu-north-1\n')
+    assert aws_native.get_sts_region() == 'eu-north-1'
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    assert aws_native.get_sts_region() == 'us-west-2'
+
+
+def test_assume_role(mocker, aws_env):
+    postmock = mocker.patch('requests.post')
+    postmock.return_value = mock_response(mocker, content=ASSUME_ROLE_RESPONSE)
+    role_creds = aws_native.assume_role(CREDS, 'arn:aws:iam::111111111111:role/use-bless', 'mfaassume', 3600)
+    assert role_creds == {
+        'AccessKeyId': 'ASIAROLE',
+        'SecretAccessKey': 'ROLESECRET',
+        'SessionToken': 'ROLETOKEN',
+        'Expiration': datetime.datetime(2017, 1, 1, 1, 0, 0, tzinfo=datetime.timezone.utc)
+    }
+    args, kwargs = postmock.call_args
+    assert args[0] == 'https://sts.us-east-1.amazonaws.com/'
+    assert b'Action=AssumeRole' in kwargs['data']
+    assert b'DurationSeconds=3600' in kwargs['data']
+    assert kwargs['headers']['X-Amz-Security-Token'] == 'TOKEN'
+
+
+def test_assume_role_error(mocker, aws_env):
+    mocker.patch('requests.post').return_value = mock_response(mocker, status_code=403, content=STS_ERROR_RESPONSE)
+    with pytest.raises(LambdaInvocationException) as e:
+        aws_native.assume_role(CREDS, 'arn:aws:iam::111111111111:role/use-bless', 'mfaassume', 3600)
+    assert str(e.value) == 'Error calling sts. 403 AccessDenied'
+
+
+def test_generate_kmsauth_token(mocker, aws_env):
+    postmock = mocker.patch('requests.post')
+    postmock.return_value = mock_response(mocker, content=b'{"CiphertextBlob": "Q0lQSEVSVEVYVA==", "KeyId": "k"}')
+    context = {'from': 'foouser', 'to': 'bless-production', 'user_type': 'user'}
+    token = aws_native.generate_kmsauth_token(CREDS, 'alias/authnz', context, 'us-west-2', 60)
+    assert token == 'Q0lQSEVSVEVYVA=='
+
+    args, kwargs = postmock.call_args
+    assert args[0] == 'https://kms.us-west-2.amazonaws.com/'
+    assert kwargs['headers']['X-Amz-Target'] == 'TrentService.Encrypt'
+    body = json.loads(kwargs['data'].decode('UTF-8'))
+    assert body['KeyId'] == 'alias/authnz'
+    assert body['EncryptionContext'] == context
+    payload = json.loads(base64.b64decode(body['Plaintext']).decode('UTF-8'))
+    not_before = datetime.datetime.strptime(payload['not_before'], aws_native.KMSAUTH_TIME_FORMAT)
+    not_after = datetime.datetime.strptime(payload['not_after'], aws_native.KMSAUTH_TIME_FORMAT)
+    assert not_after - not_before == datetime.timedelta(minutes=60)
+
+
+def test_generate_kmsauth_token_errors(mocker, aws_env):
+    with pytest.raises(LambdaInvocationException):
+        aws_native.generate_kmsauth_token(CREDS, 'alias/authnz', {'from': 'foouser', 'to': 'bless'}, 'us-west-2', 60)
+    mocker.patch('requests.post').return_value = mock_response(
+        mocker, status_code=400, content=b'{"__type": "AccessDeniedException", "message": "no"}')
+    with pytest.raises(LambdaInvocationException) as e:
+        aws_native.generate_kmsauth_token(
+            CREDS, 'alias/authnz', {'from': 'foouser', 'to': 'bless', 'user_type': 'user'}, 'us-west-2', 60)
+    assert str(e.value) == 'Error calling kms. 400 AccessDeniedException'
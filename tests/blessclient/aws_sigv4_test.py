@@ -0,0 +1,51 @@
+import datetime
+from blessclient import aws_sigv4
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+
+CREDS = {
+    'AccessKeyId': 'AKIDEXAMPLE',
+    'SecretAccessKey': 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+    'SessionToken': 'session-token'
+}
+
+
+def test_sign_request_matches_botocore():
+    url = 'https://lambda.us-east-1.amazonaws.com/2015-03-31/functions/lyft_bless/invocations?Qualifier=PROD-1-2'
+    body = b'{"foo": "bar"}'
+    request = AWSRequest(method='POST', url=url, data=body, headers={'X-Amz-Invocation-Type': 'RequestResponse'})
+    SigV4Auth(
+        Credentials(CREDS['AccessKeyId'], CREDS['SecretAccessKey'], CREDS['SessionToken']),
+        'lambda',
+        'us-east-1').add_auth(request)
+    now = datetime.datetime.strptime(request.headers['X-Amz-Date'], aws_sigv4.AMZ_DATE_FORMAT)
+
+    headers = aws_sigv4.sign_request(
+        'POST', url, 'us-east-1', 'lambda', CREDS,
+        headers={'X-Amz-Invocation-Type': 'RequestResponse'}, body=body, now=now)
+    assert headers['Authorization'] == request.headers['Authorization']
+    assert headers['X-Amz-Security-Token'] == 'session-token'
+
+
+def test_sign_request_no_session_token():
+    headers = aws_sigv4.sign_request(
+        'GET', 'https://sts.amazonaws.com/', 'us-east-1', 'sts',
+        {'AccessKeyId': 'AKID', 'SecretAccessKey': 'SECRET'},
+        now=datetime.datetime(2017, 1, 1))
+    assert 'X-Amz-Security-Token' not in headers
+    assert headers['X-Amz-Date'] == '20170101T000000Z'
+    assert headers['Authorization'].startswith(
+        'AWS4-HMAC-SHA256 Credential=AKID/20170101/us-east-1/sts/aws4_request, SignedHeaders=host;x-amz-date,')
+
+
+def test_get_endpoint(monkeypatch):
+    monkeypatch.delenv('AWS_ENDPOINT_URL', raising=False)
+    monkeypatch.delenv('AWS_ENDPOINT_URL_LAMBDA', raising=False)
+    assert aws_sigv4.get_endpoint('lambda', 'us-east-1') == 'https://lambda.us-east-1.amazonaws.com'
+    assert aws_sigv4.get_endpoint('lambda', 'cn-north-1') == 'https://lambda.cn-north-1.amazonaws.com.cn'
+    monkeypatch.setenv('AWS_ENDPOINT_URL', 'http://localhost:4566/')
+    assert aws_sigv4.get_endpoint('lambda', 'us-east-1') == 'http://localhost:4566'
+    monkeypatch.setenv('AWS_ENDPOINT_URL_LAMBDA', 'http://localhost:9001')
+    assert aws_sigv4.get_endpoint('lambda', 'us-east-1') == 'http://localhost:9001'
@@ -1,4 +1,9 @@
-from blessclient.bless_cache import BlessCache
+import json
+import time
+
+import pytest
+
+from blessclient.bless_cache import EXPIRES_KEY, BlessCache
 
 
 def test_get():
@@ -42,3 +47,132 @@ def test_load_cache(tmpdir):
     bc = BlessCache(str(tmpdir), 'readcache_corrupted', BlessCache.CACHEMODE_ENABLED)
     bar = bc.get('foo')
     assert bar == None
+
+
+@pytest.mark.parametrize('content', ['[]', 'null', '{"__expires__": []}'])
+def test_load_cache_not_an_object(tmpdir, content):
+    tmpdir.join('cache').write(content)
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    assert bc.get('foo') is None
+    bc.set('foo', 'bar')
+    bc.save()
+    assert json.loads(tmpdir.join('cache').read()) == {'foo': 'bar'}
+
+
+def test_save_merges(tmpdir):
+    first = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    second = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    first.set('foo', 'bar')
+    second.set('baz', 'qux')
+    first.save()
+    second.save()
+    assert json.loads(tmpdir.join('cache').read()) == {'foo': 'bar', 'baz': 'qux'}
+    assert second.get('foo') == 'bar'
+    assert second.dirty is False
+
+
+def test_save_atomic(tmpdir, mocker):
+    tmpdir.join('cache').write('{"foo": "bar"}')
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    bc.set('baz', object())
+    with pytest.raises(TypeError):
+        bc.save()
+    assert tmpdir.join('cache').read() == '{"foo": "bar"}'
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_coalesce(tmpdir, mocker):
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    save_cache = mocker.spy(bc, 'saveCache')
+    with bc.coalesce():
+        bc.set('foo', 'bar')
+        bc.save()
+        bc.set('baz', 'qux')
+        bc.save()
+        assert not tmpdir.join('cache').exists()
+    assert save_cache.call_count == 1
+    assert json.loads(tmpdir.join('cache').read()) == {'foo': 'bar', 'baz': 'qux'}
+
+
+def test_coalesce_flush(tmpdir):
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    with bc.coalesce():
+        bc.set('foo', 'bar')
+        bc.flush()
+        assert json.loads(tmpdir.join('cache').read()) == {'foo': 'bar'}
+
+
+def test_ttl():
+    bc = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bc.cache = {}
+    bc.set('foo', 'bar', 60)
+    bc.set('baz', 'qux', -1)
+    bc.set('keep', 'this')
+    assert bc.get('foo') == 'bar'
+    assert 59 < bc.ttl('foo') <= 60
+    assert bc.get('baz') is None
+    assert bc.ttl('baz') is None
+    assert bc.get('keep') == 'this'
+    assert bc.ttl('keep') is None
+    # Setting a key without a ttl keeps it until it is set again
+    bc.set('foo', 'bar')
+    assert bc.ttl('foo') is None
+
+
+def test_load_evicts_expired(tmpdir):
+    now = time.time()
+    tmpdir.join('cache').write(json.dumps({
+        'foo': 'bar', 'baz': 'qux', 'keep': 'this',
+        EXPIRES_KEY: {'foo': now + 60, 'baz': now - 1}}))
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    assert bc.get('foo') == 'bar'
+    assert bc.get('keep') == 'this'
+    assert bc.cache == {'foo': 'bar', 'keep': 'this'}
+    assert bc.expires == {'foo': now + 60}
+
+
+def test_load_bad_expiry(tmpdir):
+    tmpdir.join('cache').write(json.dumps({
+        'foo': 'bar', 'baz': 'qux', 'flag': 'x', 'keep': 'this',
+        EXPIRES_KEY: {'foo': None, 'baz': 'tomorrow', 'flag': True}}))
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    assert bc.get('foo') is None
+    assert bc.get('keep') == 'this'
+    assert bc.cache == {'keep': 'this'}
+    assert bc.expires == {}
+
+
+def test_save_compacts(tmpdir):
+    now = time.time()
+    tmpdir.join('cache').write(json.dumps({
+        'kmsauth-us-east-1': 'old', 'kmsauth-us-west-2': 'live',
+        EXPIRES_KEY: {'kmsauth-us-east-1': now - 1, 'kmsauth-us-west-2': now + 60}}))
+    first = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    second = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    first.set('foo', 'bar', 60)
+    first.set('gone', 'soon', 0)
+    second.set('kmsauth-us-west-2', 'new')
+    first.save()
+    second.save()
+    data = json.loads(tmpdir.join('cache').read())
+    assert data == {'foo': 'bar', 'kmsauth-us-west-2': 'new', EXPIRES_KEY: {'foo': data[EXPIRES_KEY]['foo']}}
+    assert second.ttl('foo') > 59
+
+
+def test_save_without_ttls(tmpdir):
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_ENABLED)
+    bc.set('foo', 'bar', 0)
+    bc.set('baz', 'qux')
+    bc.save()
+    assert json.loads(tmpdir.join('cache').read()) == {'baz': 'qux'}
+
+
+def test_save_recache_overwrites_set_keys(tmpdir):
+    tmpdir.join('cache').write('{"other": "entry", "foo": "old"}')
+    bc = BlessCache(str(tmpdir), 'cache', BlessCache.CACHEMODE_RECACHE)
+    assert bc.get('foo') is None
+    bc.set('foo', 'bar')
+    bc.save()
+    bc.set('baz', 'qux')
+    bc.save()
+    assert json.loads(tmpdir.join('cache').read()) == {'other': 'entry', 'foo': 'bar', 'baz': 'qux'}
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 
 from io import StringIO
 import pytest
+from blessclient import config_snapshot
 from blessclient.bless_config import BlessConfig
 
 
@@ -94,7 +95,11 @@ BASE_EXPECTED_CONF = {
         'user_session_length': 3600,
         'usebless_role_session_length': 3600, # comes from BlessConfig.DEFAULT_CONFIG
         'update_sshagent': False,
-        'use_env_creds': True # comes from BlessConfig.DEFAULT_CONFIG
+        'use_env_creds': True, # comes from BlessConfig.DEFAULT_CONFIG
+        'aws_transport': 'boto3', # comes from BlessConfig.DEFAULT_CONFIG
+        'ip_lookup': 'sequential', # comes from BlessConfig.DEFAULT_CONFIG
+        'ip_timeout': 2.0, # comes from BlessConfig.DEFAULT_CONFIG
+        'lambda_hedge_percentile': 0 # comes from BlessConfig.DEFAULT_CONFIG
     }
 }
 
@@ -181,3 +186,30 @@ def test_set_client_config(bless_config_test):
     client_config = bless_config_test.get_client_config()
     assert client_config['update_script'] == 'foo.sh'
     assert bless_config_test.set_client_config('DOESNOTEXIST', 9000) == False
+
+
+def test_load_config_file(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    config_snapshot._snapshots.clear()
+    tmpdir.join('blessclient.cfg').write(BLESS_CONFIG + TEST_CONFIG)
+    config = BlessConfig()
+    config.load_config_file(str(tmpdir.join('blessclient.cfg')))
+    assert tmpdir.join('.bless', 'config_snapshot.json').check()
+    assert config.get_aws_regions() == ('us-east-1', 'us-west-2')
+
+    config_snapshot._snapshots.clear()
+    snapshot_config = BlessConfig()
+    parse_config_file = snapshot_config.parse_config_file
+    monkeypatch.setattr(snapshot_config, 'parse_config_file', None)
+    snapshot_config.load_config_file(str(tmpdir.join('blessclient.cfg')))
+    assert snapshot_config.get_config() == parse_config_file(StringIO(BLESS_CONFIG + TEST_CONFIG))
+
+
+def test_get_regions_and_aliases(bless_config_test):
+    assert bless_config_test.get_aws_regions() == ('us-east-1', 'us-west-2')
+    assert bless_config_test.get_region_aliases() == ('IAD', 'SFO')
+
+
+def test_get_domain_regex(bless_config_test):
+    assert bless_config_test.get_domain_regex().match('host.example.com')
+    assert not bless_config_test.get_domain_regex().match('github.com')
@@ -0,0 +1,83 @@
+import pytest
+import requests
+from blessclient.bless_lambda_http import BlessLambdaHTTP
+from blessclient.lambda_invocation_exception import LambdaInvocationException
+
+
+TESTBLESSCONFIG = {
+    'userrole': 'rolebar',
+    'accountid': '111111111111',
+    'functionname': 'lyft_bless',
+    'functionversion': 'PROD-1-2',
+    'certlifetime': 1800,
+    'ipcachelifetime': 120,
+    'timeoutconfig': {'connect': 5, 'read': 10}
+}
+
+
+@pytest.fixture
+def lyftbless(monkeypatch):
+    monkeypatch.delenv('AWS_ENDPOINT_URL', raising=False)
+    monkeypatch.delenv('AWS_ENDPOINT_URL_LAMBDA', raising=False)
+    return BlessLambdaHTTP(
+        config=TESTBLESSCONFIG,
+        creds={
+            'AccessKeyId': 'AKID',
+            'SecretAccessKey': 'SECRET',
+            'SessionToken': 'TOKEN'},
+        kmsauth_token='my_kmsauth_token',
+        region='us-east-1'
+    )
+
+
+def mock_response(mocker, status_code=200, content=b'', headers=None):
+    response = mocker.MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+def test_getCert(mocker, lyftbless):
+    postmock = mocker.patch('requests.post')
+    postmock.return_value = mock_response(mocker, content=b'{"certificate": "The Cert"}')
+    returned = lyftbless.getCert({'foo': 'bar'})
+    assert returned == 'The Cert'
+    args, kwargs = postmock.call_args
+    assert args[0] == (
+        'https://lambda.us-east-1.amazonaws.com/2015-03-31/functions/lyft_bless/invocations?Qualifier=PROD-1-2')
+    assert b'"kmsauth_token": "my_kmsauth_token"' in kwargs['data']
+    assert kwargs['headers']['X-Amz-Security-Token'] == 'TOKEN'
+    assert kwargs['headers']['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=AKID/')
+    assert kwargs['timeout'] == (5, 10)
+
+
+@pytest.mark.parametrize('exception', [
+    requests.exceptions.ConnectTimeout,
+    requests.exceptions.ReadTimeout,
+    requests.exceptions.SSLError,
+    requests.exceptions.ConnectionError])
+def test_getCert_connection_errors(mocker, lyftbless, exception):
+    postmock = mocker.patch('requests.post')
+    postmock.side_effect = exception()
+    with pytest.raises(LambdaInvocationException):
+        lyftbless.getCert({'foo': 'bar'})
+    postmock.assert_called_once()
+
+
+def test_getCert_error_status(mocker, lyftbless):
+    mocker.patch('requests.post').return_value = mock_response(
+        mocker, status_code=403, headers={'x-amzn-ErrorType': 'InvalidSignatureException:http://internal'})
+    with pytest.raises(LambdaInvocationException) as e:
+        lyftbless.getCert({'foo': 'bar'})
+    assert str(e.value) == 'Error creating cert. 403 InvalidSignatureException'
+
+
+def test_getCert_bad_payload(mocker, lyftbless):
+    postmock = mocker.patch('requests.post')
+    postmock.return_value = mock_response(mocker, content=b'not json')
+    with pytest.raises(LambdaInvocationException):
+        lyftbless.getCert({'foo': 'bar'})
+    postmock.return_value = mock_response(mocker, content=b'{"errorMessage": "failed"}')
+    with pytest.raises(LambdaInvocationException):
+        lyftbless.getCert({'foo': 'bar'})
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import pytest
+from blessclient import blessd
+from blessclient.bless_cache import BlessCache
+
+
+@pytest.fixture
+def socket_path(tmpdir, mocker):
+    mocker.patch.dict(os.environ, {'BLESS_NODAEMON': ''})
+    return str(tmpdir.join('blessd.sock'))
+
+
+@pytest.fixture
+def running_daemon(socket_path):
+    thread = threading.Thread(target=blessd.serve, args=(socket_path, 0.5))
+    thread.start()
+    for _ in range(50):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    yield socket_path
+    thread.join()
+
+
+def test_request_no_daemon(socket_path, mocker):
+    assert blessd.request({'command': 'ping'}, socket_path) is None
+    open(socket_path, 'w').close()
+    assert blessd.request({'command': 'ping'}, socket_path) is None
+
+
+def test_request_nodaemon(running_daemon, mocker):
+    assert blessd.request({'command': 'ping'}, running_daemon) == {'result': 'pong', 'error': None}
+    os.environ['BLESS_NODAEMON'] = '1'
+    assert blessd.request({'command': 'ping'}, running_daemon) is None
+
+
+def test_request_cert(running_daemon, mocker):
+    mocker.patch.dict(os.environ, {'BLESSD_SOCKET': running_daemon, 'BLESSFIXEDIP': '1.2.3.4'})
+    environ = {}
+
+    def handle_cert(self, message):
+        with self.request_env(message['env']):
+            environ.update(os.environ)
+        return {'result': {'username': message['username']}, 'error': None}
+
+    mocker.patch.object(blessd.BlessDaemon, 'handle_cert', handle_cert)
+    os.environ['BLESSFIXEDIP'] = '5.6.7.8'
+    response = blessd.request_cert('us-east-1', False, False, 'host.example.com', '/tmp/blessclient.cfg', 'foo', '/tmp/id')
+    assert response == {'result': {'username': 'foo'}, 'error': None}
+    assert environ['BLESSFIXEDIP'] == '5.6.7.8'
+
+
+def test_serve_already_running(running_daemon):
+    with pytest.raises(RuntimeError):
+        blessd.serve(running_daemon)
+
+
+def test_handle_errors(mocker):
+    daemon = blessd.BlessDaemon()
+    assert daemon.handle({'command': 'foo'})['error'] == 'Unknown command foo'
+    mocker.patch.object(daemon, 'handle_cert').side_effect = SystemExit(1)
+    assert daemon.handle({'command': 'cert'}) == {'result': None, 'error': 'Could not sign SSH public key.'}
+    daemon.handle_cert.side_effect = ValueError('bad')
+    assert daemon.handle({'command': 'cert'}) == {'result': None, 'error': 'bad'}
+
+
+def test_request_env(mocker):
+    mocker.patch.dict(os.environ, {'AWS_PROFILE': 'daemon', 'BLESSQUIET': '1'})
+    daemon = blessd.BlessDaemon()
+    with daemon.request_env({'AWS_PROFILE': 'client'}):
+        assert os.environ['AWS_PROFILE'] == 'client'
+        assert 'BLESSQUIET' not in os.environ
+    assert os.environ['AWS_PROFILE'] == 'daemon'
+    assert os.environ['BLESSQUIET'] == '1'
+
+
+def test_request_env_ssh_agent(mocker):
+    mocker.patch.dict(os.environ, {'SSH_AUTH_SOCK': '/tmp/client-agent', 'SSH_CLIENT': 'x'})
+    env = blessd.get_request_env()
+    assert env['SSH_AUTH_SOCK'] == '/tmp/client-agent'
+    assert 'SSH_CLIENT' not in env
+
+    os.environ['SSH_AUTH_SOCK'] = '/tmp/daemon-agent'
+    daemon = blessd.BlessDaemon()
+    with daemon.request_env(env):
+        assert os.environ['SSH_AUTH_SOCK'] == '/tmp/client-agent'
+    with daemon.request_env({}):
+        # No agent to add the cert to, rather than blessd's
+        assert 'SSH_AUTH_SOCK' not in os.environ
+    assert os.environ['SSH_AUTH_SOCK'] == '/tmp/daemon-agent'
+
+
+def test_get_cache_reloads(mocker, tmpdir):
+    bless_cache = BlessCache(str(tmpdir), 'bless_cache.json', BlessCache.CACHEMODE_ENABLED)
+    bless_cache.set('username', 'foo')
+    bless_cache.save()
+    mocker.patch('blessclient.client.get_bless_cache').return_value = bless_cache
+    daemon = blessd.BlessDaemon()
+    assert daemon.get_cache('blessclient.cfg', None).get('username') == 'foo'
+    bless_cache.stat_key = blessd._stat_key(str(tmpdir.join('bless_cache.json')))
+
+    assert daemon.get_cache('blessclient.cfg', None).cache is not None
+    tmpdir.join('bless_cache.json').write('{"username": "bar"}')
+    assert daemon.get_cache('blessclient.cfg', None).get('username') == 'bar'
+
+
+def test_get_aws(mocker):
+    resetmock = mocker.patch('blessclient.aws_data.reset_default_session')
+    daemon = blessd.BlessDaemon()
+    aws = daemon.get_aws({'AWS_PROFILE': 'foo', 'BLESSQUIET': '1'})
+    assert daemon.get_aws({'AWS_PROFILE': 'foo'}) is aws
+    assert daemon.get_aws({'AWS_PROFILE': 'bar'}) is not aws
+    assert resetmock.call_count == 2
+
+
+def test_refresh(mocker):
+    daemon = blessd.BlessDaemon(refresh_margin=300)
+    bless_config = mocker.MagicMock()
+    bless_config.get_lambda_config.return_value = {'certlifetime': 400, 'ipcachelifetime': 120}
+    bless_config.get_client_config.return_value = {'ip_urls': []}
+    mocker.patch.object(daemon, 'get_config').return_value = bless_config
+    mocker.patch.object(daemon, 'get_cache')
+    mocker.patch.object(daemon, 'get_aws')
+    prewarmmock = mocker.patch('blessclient.client.prewarm')
+    freshmock = mocker.patch('blessclient.client.check_fresh_cert')
+    freshmock.return_value = True
+    getcertmock = mocker.patch.object(daemon, '_get_cert')
+    message = {'config': '/tmp/blessclient.cfg', 'identity_file': '/tmp/blessid', 'env': {}}
+
+    assert daemon.refresh(message, 300) is True
+    getcertmock.assert_not_called()
+    assert prewarmmock.call_args[0][3] == 200
+    assert freshmock.call_args[0][0] == '/tmp/blessid-cert.pub'
+    assert freshmock.call_args[1]['refresh_margin'] == 200
+
+    freshmock.return_value = False
+    getcertmock.return_value = {'username': 'foo'}
+    assert daemon.refresh(message, 300) is True
+    getcertmock.assert_called_once_with(message, 200)
+    getcertmock.side_effect = SystemExit(1)
+    assert daemon.refresh(message, 300) is False
+
+    # A failed prewarm doesn't stop the cert from being renewed
+    prewarmmock.side_effect = Exception('STS is down')
+    getcertmock.side_effect = None
+    assert daemon.refresh(message, 300) is True
+
+
+def test_handle_cert_tracks(mocker):
+    daemon = blessd.BlessDaemon(refresh_margin=300)
+    mocker.patch.object(daemon, '_get_cert').return_value = {'username': 'foo'}
+    trackmock = mocker.patch.object(daemon.scheduler, 'track')
+    message = {'command': 'cert', 'env': {}}
+    assert daemon.handle(message) == {'result': {'username': 'foo'}, 'error': None}
+    trackmock.assert_called_once_with(message)
@@ -3,9 +3,12 @@ import pytest
 from blessclient.bless_cache import BlessCache
 from blessclient.bless_config import BlessConfig
 import datetime
+import json
 import time
 import logging
 import os
+import subprocess
+import sys
 
 
 @pytest.fixture
@@ -78,6 +81,30 @@ def test_get_regions(bless_config):
     assert client.get_regions('FOOBAR', bless_config) == ['us-east-1', 'us-west-2']
 
 
+def test_get_bless_lambda(bless_config):
+    creds = {'AccessKeyId': 'AKID', 'SecretAccessKey': 'SECRET', 'SessionToken': 'TOKEN'}
+    assert type(client.get_bless_lambda(bless_config, creds, 'token', 'us-east-1')).__name__ == 'BlessLambda'
+    bless_config.get_client_config()['aws_transport'] = 'native'
+    assert type(client.get_bless_lambda(bless_config, creds, 'token', 'us-east-1')).__name__ == 'BlessLambdaHTTP'
+
+
+def test_request_cert_blessd(mocker, bless_config):
+    bless_config.get('BLESS_CONFIG')['ca_backend'] = 'bless'
+    mocker.patch.object(client, 'get_identity_file').return_value = '/tmp/blessid'
+    requestmock = mocker.patch('blessclient.blessd.request_cert')
+    requestmock.return_value = {'result': {'username': 'foo'}, 'error': None}
+    getcertmock = mocker.patch.object(client, 'get_cert')
+    assert client.request_cert('us-east-1', False, False, 'host', bless_config, '/tmp/blessclient.cfg') == {'username': 'foo'}
+    requestmock.assert_called_once_with(
+        'us-east-1', False, False, 'host', '/tmp/blessclient.cfg', None, '/tmp/blessid')
+    getcertmock.assert_not_called()
+
+    requestmock.return_value = None
+    getcertmock.return_value = {'username': 'bar'}
+    assert client.request_cert('us-east-1', False, False, 'host', bless_config, '/tmp/blessclient.cfg') == {'username': 'bar'}
+    getcertmock.assert_called_once_with('us-east-1', False, False, 'host', bless_config, None, config_filename='/tmp/blessclient.cfg')
+
+
 def test_get_kmsauth_config(bless_config):
     con = client.get_kmsauth_config('us-west-2', bless_config)
     assert con['awsregion'] == 'us-west-2'
@@ -86,8 +113,7 @@ def test_get_kmsauth_config(bless_config):
 def test_clear_kmsauth_token_cache(null_bless_cache):
     kmsconfig = {'awsregion': 'us-east-1'}
     client.clear_kmsauth_token_cache(kmsconfig, null_bless_cache)
-    assert null_bless_cache.cache[
-        'kmsauth-us-east-1']['Expiration'] == '20160101T000000Z'
+    assert null_bless_cache.expired('kmsauth-us-east-1')
 
 
 def test_get_kmsauth_token(mocker, null_bless_cache):
@@ -101,20 +127,50 @@ def test_get_kmsauth_token(mocker, null_bless_cache):
     assert token == 'KMSTOKEN'
 
 
+def test_get_kmsauth_token_native(mocker, null_bless_cache):
+    genermock = mocker.patch('blessclient.aws_native.generate_kmsauth_token')
+    genermock.return_value = 'KMSTOKEN'
+    creds = {'AccessKeyId': 'AKID', 'SecretAccessKey': 'SECRET', 'SessionToken': None}
+    kmsconfig = {'awsregion': 'us-east-1', 'context': {}, 'kmskey': 'kmskey'}
+    token = client.get_kmsauth_token(
+        None, kmsconfig, 'foouser', null_bless_cache, native_creds=creds)
+    assert token == 'KMSTOKEN'
+    genermock.assert_called_once_with(creds, 'kmskey', {'from': 'foouser'}, 'us-east-1', 60)
+
+
 def test_get_kmsauth_token_cached():
     kmsconfig = {'awsregion': 'us-east-1', 'context': {}, 'kmskey': None}
-    expiration = datetime.datetime.utcnow() + datetime.timedelta(minutes=60)
-    kmsauth_cache = {
-        'token': 'KMSTOKEN',
-        'Expiration': expiration.strftime('%Y%m%dT%H%M%SZ')
-    }
     bless_cache = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
     bless_cache.cache = {}
-    bless_cache.set('kmsauth-us-east-1', kmsauth_cache)
+    bless_cache.set('kmsauth-us-east-1', 'KMSTOKEN', 3600)
     token = client.get_kmsauth_token(None, kmsconfig, 'foouser', bless_cache)
     assert token == 'KMSTOKEN'
 
 
+def test_get_kmsauth_token_min_lifetime(mocker):
+    genermock = mocker.patch('blessclient.aws_native.generate_kmsauth_token')
+    genermock.return_value = 'NEWTOKEN'
+    kmsconfig = {'awsregion': 'us-east-1', 'context': {}, 'kmskey': None}
+    bless_cache = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bless_cache.cache = {}
+    bless_cache.set('kmsauth-us-east-1', 'KMSTOKEN', 120)
+    mocker.patch.object(bless_cache, 'save')
+    assert client.get_kmsauth_token(None, kmsconfig, 'foouser', bless_cache, {}) == 'KMSTOKEN'
+    assert client.get_kmsauth_token(None, kmsconfig, 'foouser', bless_cache, {}, min_lifetime=300) == 'NEWTOKEN'
+
+
+def test_prewarm(mocker, bless_config, null_bless_cache):
+    mocker.patch('blessclient.client.get_username').return_value = 'foouser'
+    rolemock = mocker.patch('blessclient.client.get_blessrole_credentials')
+    tokenmock = mocker.patch('blessclient.client.get_kmsauth_token')
+    tokenmock.side_effect = [Exception('KMS is down'), 'KMSTOKEN']
+    aws = mocker.MagicMock()
+    assert client.prewarm(bless_config, aws, null_bless_cache, 300) == ['us-west-2']
+    rolemock.assert_called_once_with(aws, None, bless_config, null_bless_cache, 300)
+    assert [c[0][1]['awsregion'] for c in tokenmock.call_args_list] == ['us-east-1', 'us-west-2']
+    assert tokenmock.call_args[0][5] == 300
+
+
 def test_setup_logging(mocker):
     logmock = mocker.patch('logging.basicConfig')
     os.environ['BLESSDEBUG'] = '1'
@@ -138,6 +194,27 @@ def test_make_cachable_creds():
     assert returned['Expiration'] == '20170101T000000Z'
 
 
+def test_get_blessrole_credentials_cached(mocker):
+    expiration = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+    assume_role = mocker.patch.object(client, 'assume_role', return_value={
+        'AccessKeyId': 'AKIA', 'SecretAccessKey': 'SECRET', 'SessionToken': 'TOKEN', 'Expiration': expiration})
+    mocker.patch.object(client.awsmfautils, 'get_role_arn')
+    bless_cache = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bless_cache.cache = {}
+    mocker.patch.object(bless_cache, 'save')
+    aws = mocker.MagicMock()
+    blessconfig = mocker.MagicMock()
+
+    fresh = client.get_blessrole_credentials(aws, None, blessconfig, bless_cache)
+    cached = client.get_blessrole_credentials(aws, None, blessconfig, bless_cache)
+    assert assume_role.call_count == 1
+    # The same credentials, whether they came from STS or the cache
+    assert cached == fresh
+
+    client.get_blessrole_credentials(aws, None, blessconfig, bless_cache, min_lifetime=10 ** 10)
+    assert assume_role.call_count == 2
+
+
 def test_uncache_creds():
     creds = {
         'Expiration': '19790101T000000Z',
@@ -211,6 +288,90 @@ def test_check_fresh_cert(mocker, null_bless_cache):
     assert returned == True
 
 
+def test_check_fresh_cert_refresh_margin(mocker, null_bless_cache):
+    blessconfig = {
+        'certlifetime': 1800,
+        'ipcachelifetime': 300
+    }
+    mocker.patch('os.path.isfile').return_value = True
+    mocker.patch('os.path.getmtime').return_value = time.time() - 200
+    userIP = mocker.MagicMock()
+    assert client.check_fresh_cert('/Users/foo/.ssh/blessid-cert.pub', blessconfig, null_bless_cache, userIP) is True
+    assert client.check_fresh_cert(
+        '/Users/foo/.ssh/blessid-cert.pub', blessconfig, null_bless_cache, userIP, refresh_margin=1650) is False
+
+
+FRESH_CERT_CONFIG = """
+[MAIN]
+region_aliases: IAD
+kms_service_name: bless-production
+bastion_ips: 10.0.0.0/8
+remote_user: foo
+
+[CLIENT]
+domain_regex: (.*\\.example\\.com)$
+cache_dir: .bless/session
+cache_file: bless_cache.json
+mfa_cache_dir: .aws/session
+mfa_cache_file: token_cache.json
+ip_urls: http://api.ipify.org
+update_script: autoupdate.sh
+
+[LAMBDA]
+user_role: use-bless
+account_id: 111111111111
+functionname: lyft_bless
+functionversion: PROD-1-2
+certlifetime: 1800
+ipcachelifetime: 120
+timeout_connect: 5
+timeout_read: 10
+
+[REGION_IAD]
+awsregion: us-east-1
+kmsauthkey: zxywvuts-0123-4567-8910-abcdefghijkl
+"""
+
+FRESH_CERT_SCRIPT = """
+import json
+import sys
+from blessclient import client
+sys.argv = ['blessclient', 'host.example.com']
+try:
+    client.main()
+except SystemExit as e:
+    code = e.code
+heavy = ['boto3', 'botocore', 'kmsauth', 'hvac', 'psutil', 'Cryptodome', 'requests', 'tkinter']
+print(json.dumps({'code': code, 'loaded': [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def test_fresh_cert_skips_heavy_imports(tmpdir):
+    home = tmpdir.mkdir('home')
+    home.mkdir('.aws').join('blessclient.cfg').write(FRESH_CERT_CONFIG)
+    home.mkdir('.ssh').join('blessid-cert.pub').write('ssh-rsa-cert-v01@openssh.com AAAA')
+    home.mkdir('.bless').mkdir('session').join('bless_cache.json').write(json.dumps({
+        'username': 'foo',
+        'last_updated': datetime.datetime.utcnow().strftime(client.DATETIME_STRING_FORMAT),
+        'lastip': '1.2.3.4',
+        '__expires__': {'lastip': time.time() + 120},
+        'certip': '1.2.3.4',
+        'bastion_ips': '1.2.3.4,10.0.0.0/8',
+    }))
+    env = dict(os.environ)
+    env.update({
+        'HOME': str(home),
+        'AWS_PROFILE': 'test',
+        'BLESS_IDENTITYFILE': str(home.join('.ssh', 'blessid')),
+        'BLESSDEBUG': '',
+        'PYTHONPATH': os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    })
+    output = subprocess.check_output([sys.executable, '-c', FRESH_CERT_SCRIPT], env=env)
+    result = json.loads(output.decode('UTF-8').splitlines()[-1])
+    assert result['code'] == 0
+    assert result['loaded'] == []
+
+
 def test_get_default_config_filename():
     default_filename = client.get_default_config_filename()
     assert default_filename[-15:] == 'blessclient.cfg'
@@ -284,34 +445,24 @@ def test_get_cached_auth_token_isEmpty(null_bless_cache):
     assert returned == None
 
 
-def test_get_cached_auth_token_isValid(mocker):
-    cachemock = mocker.MagicMock()
-    cachemock.get.return_value = {
-        "token": "test-token",
-        "expiration": (
-            datetime.datetime.utcnow() +
-            datetime.timedelta(hours=1)
-        ).strftime('%Y%m%dT%H%M%SZ'),
-        "username": "john.doe"
-    }
-    returned = client.get_cached_auth_token(cachemock)
+def test_get_cached_auth_token_isValid(vault_cache):
+    vault_cache.set('vault_creds', vault_creds(3600), 3600)
+    returned = client.get_cached_auth_token(vault_cache)
     assert returned == "test-token"
 
 
-def test_get_cached_auth_token_isExpired(mocker):
-    cachemock = mocker.MagicMock()
-    cachemock.get.return_value = {
-        "token": "test-token",
-        "expiration": (
-            datetime.datetime.utcnow() -
-            datetime.timedelta(hours=1)
-        ).strftime('%Y%m%dT%H%M%SZ'),
-        "username": "john.doe"
-    }
-    returned = client.get_cached_auth_token(cachemock)
+def test_get_cached_auth_token_isExpired(vault_cache):
+    vault_cache.set('vault_creds', vault_creds(-3600), -3600)
+    returned = client.get_cached_auth_token(vault_cache)
     assert returned == None
 
 
+def test_get_cached_auth_token_without_ttl(vault_cache):
+    # Cached before vault_creds had a ttl
+    vault_cache.set('vault_creds', vault_creds(3600))
+    assert client.get_cached_auth_token(vault_cache) is None
+
+
 @pytest.fixture(scope='module')
 def mock_get_credentials():
     username = "john.doe"
@@ -357,3 +508,292 @@ def test_auth_okta_Cache(mocker):
     }
     new_client, new_username = client.auth_okta(MockClient(), "test", cachemock)
     assert new_username == "john.doe"
+
+
+@pytest.fixture
+def vault_cache(mocker):
+    bless_cache = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bless_cache.cache = {}
+    mocker.patch.object(bless_cache, 'save')
+    return bless_cache
+
+
+def vault_creds(remaining, lease_duration=3600, **kwargs):
+    expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=remaining)
+    creds = {
+        "token": "test-token",
+        "expiration": expiration.strftime('%Y%m%dT%H%M%SZ'),
+        "username": "john.doe",
+        "renewable": True,
+        "lease_duration": lease_duration,
+        "max_expiration": None
+    }
+    creds.update(kwargs)
+    return creds
+
+
+def test_make_vault_creds():
+    now = datetime.datetime(2017, 1, 1)
+    auth = {"client_token": "test-token", "lease_duration": 3600, "renewable": True}
+    creds = client.make_vault_creds(auth, "john.doe", now)
+    assert creds == {
+        "token": "test-token",
+        "expiration": "20170101T010000Z",
+        "username": "john.doe",
+        "renewable": True,
+        "lease_duration": 3600,
+        "max_expiration": None
+    }
+    # A shorter lease on renewal means the token hit its max TTL
+    auth['lease_duration'] = 600
+    renewed = client.make_vault_creds(auth, "john.doe", now + datetime.timedelta(hours=1), creds)
+    assert renewed['expiration'] == "20170101T011000Z"
+    assert renewed['max_expiration'] == "20170101T011000Z"
+    assert renewed['lease_duration'] == 3600
+
+
+def test_vault_token_renewal_due(vault_cache):
+    assert client.vault_token_renewal_due(vault_cache) is False
+    vault_cache.set('vault_creds', vault_creds(3000), 3000)
+    assert client.vault_token_renewal_due(vault_cache) is False
+    vault_cache.set('vault_creds', vault_creds(1000), 1000)
+    assert client.vault_token_renewal_due(vault_cache) is True
+    assert client.vault_token_renewal_due(vault_cache, min_lifetime=600) is False
+    vault_cache.set('vault_creds', vault_creds(1000, renewable=False), 1000)
+    assert client.vault_token_renewal_due(vault_cache) is False
+    creds = vault_creds(1000)
+    creds['max_expiration'] = creds['expiration']
+    vault_cache.set('vault_creds', creds, 1000)
+    assert client.vault_token_renewal_due(vault_cache) is False
+    vault_cache.set('vault_creds', vault_creds(-10), -10)
+    assert client.vault_token_renewal_due(vault_cache) is False
+
+
+def test_renew_auth_token(mocker, vault_cache):
+    clientmock = mocker.MagicMock()
+    clientmock.auth.token.renew_self.return_value = {
+        "auth": {"client_token": "test-token", "lease_duration": 3600, "renewable": True}
+    }
+    vault_cache.set('vault_creds', vault_creds(3000), 3000)
+    assert client.renew_auth_token(clientmock, vault_cache) is False
+    clientmock.auth.token.renew_self.assert_not_called()
+
+    vault_cache.set('vault_creds', vault_creds(1000), 1000)
+    assert client.renew_auth_token(clientmock, vault_cache) is True
+    assert client.vault_token_renewal_due(vault_cache) is False
+
+    vault_cache.set('vault_creds', vault_creds(1000), 1000)
+    clientmock.auth.token.renew_self.side_effect = Exception('permission denied')
+    assert client.renew_auth_token(clientmock, vault_cache) is False
+
+
+def test_auth_okta_renews_cached_token(mocker, vault_cache):
+    clientmock = mocker.MagicMock()
+    clientmock.auth.token.renew_self.return_value = {
+        "auth": {"client_token": "renewed-token", "lease_duration": 3600, "renewable": True}
+    }
+    credsmock = mocker.patch.object(client, 'get_credentials')
+    vault_cache.set('vault_creds', vault_creds(1000), 1000)
+    new_client, new_username = client.auth_okta(clientmock, "test", vault_cache)
+    credsmock.assert_not_called()
+    assert new_client.token == "renewed-token"
+    assert new_username == "john.doe"
+
+
+def test_start_vault_token_renewal(mocker):
+    popenmock = mocker.patch('subprocess.Popen')
+    client.start_vault_token_renewal('/tmp/blessclient.cfg')
+    command = popenmock.call_args[0][0]
+    assert command[1:] == ['-m', 'blessclient.client', '--renew_vault_token', '--config', '/tmp/blessclient.cfg']
+
+
+def test_is_cert_expired(tmpdir):
+    cert_file = str(tmpdir.join('blessid-cert.pub'))
+    blessconfig = {'certlifetime': 1800}
+    assert client.is_cert_expired(cert_file, blessconfig) is True
+    tmpdir.join('blessid-cert.pub').write('cert')
+    assert client.is_cert_expired(cert_file, blessconfig) is False
+    assert client.is_cert_expired(cert_file, blessconfig, refresh_margin=1800) is True
+    old = time.time() - 1800
+    os.utime(cert_file, (old, old))
+    assert client.is_cert_expired(cert_file, blessconfig) is True
+
+
+def test_get_env_creds(monkeypatch):
+    expiration = int(time.time()) + 3600
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKID')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'SECRET')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'TOKEN')
+    monkeypatch.setenv('AWS_EXPIRATION_S', str(expiration))
+    creds = client.get_env_creds({'use_env_creds': True})
+    assert creds['AccessKeyId'] == 'AKID'
+    assert creds['Expiration'] == datetime.datetime.fromtimestamp(expiration).strftime('%Y%m%dT%H%M%SZ')
+    assert client.get_env_creds({'use_env_creds': False}) is None
+    monkeypatch.setenv('AWS_EXPIRATION_S', str(expiration - 7200))
+    assert client.get_env_creds({'use_env_creds': True}) is None
+    monkeypatch.delenv('AWS_SESSION_TOKEN')
+    assert client.get_env_creds({'use_env_creds': True}) is None
+
+
+def test_env_creds_task():
+    def fail(username):
+        raise Exception('no session')
+
+    assert client.env_creds_task(lambda username: username)('foo') == 'foo'
+    assert client.env_creds_task(fail)('foo') is None
+
+
+def test_get_ip_list_default(bless_config):
+    bless_config.get_aws_config = lambda: {'bastion_ips': '10.0.0.0/8'}
+    assert client.get_ip_list('us-east-1', 'host', '1.2.3.4', None, None, bless_config, None) == (
+        None, '1.2.3.4,10.0.0.0/8')
+
+
+def test_get_ip_list_fleet(mocker, bless_config, null_bless_cache):
+    mocker.patch.object(client, 'get_housekeeper_config').return_value = {'userrole': 'housekeeper'}
+    role_creds = mocker.patch.object(client, 'get_housekeeperrole_credentials')
+    housekeeper = mocker.patch.object(client, 'HousekeeperLambda').return_value
+    private_ips = {'a.example.com': ['10.0.0.1'], 'b.example.com': ['10.0.0.2', '10.0.0.1']}
+    housekeeper.getPrivateIpFromPublicName.side_effect = lambda hostname: private_ips[hostname]
+    ip, ip_list = client.get_ip_list(
+        'us-east-1', ['a.example.com', 'b.example.com'], '1.2.3.4', None, None, bless_config, null_bless_cache)
+    assert ip is None
+    assert ip_list == '1.2.3.4,10.0.0.1,10.0.0.2'
+    assert role_creds.call_count == 3
+
+
+def test_invoke_bless_lambda(mocker, bless_config, null_bless_cache):
+    cert = 'ssh-rsa-cert-v01@openssh.com AAAA'
+    lambdamock = mocker.patch.object(client, 'get_bless_lambda')
+    lambdamock.return_value.getCert.return_value = cert
+    payload = {'bastion_user': 'foo'}
+    assert client.invoke_bless_lambda(
+        bless_config, null_bless_cache, {}, 'TOKEN', 'us-east-1', 'foo', payload) == cert
+    lambdamock.assert_called_once_with(bless_config, {}, 'TOKEN', 'us-east-1')
+    assert payload == {'bastion_user': 'foo'}
+
+
+def test_invoke_bless_lambda_hedged(mocker, bless_config, null_bless_cache):
+    cert = 'ssh-rsa-cert-v01@openssh.com AAAA'
+    bless_config.get_client_config()['lambda_hedge_percentile'] = 95
+    mocker.patch.object(client.hedge, 'DEFAULT_DELAY', 0.05)
+    mocker.patch.object(client, 'get_kmsauth_token').return_value = 'TOKEN2'
+
+    def get_bless_lambda(bless_config, role_creds, kmsauth_token, region):
+        bless_lambda = mocker.MagicMock()
+        if region == 'us-east-1':
+            bless_lambda.getCert.side_effect = lambda payload: time.sleep(1) or cert
+        else:
+            bless_lambda.getCert.return_value = cert + ' hedged'
+        return bless_lambda
+
+    mocker.patch.object(client, 'get_bless_lambda', side_effect=get_bless_lambda)
+    start = time.time()
+    assert client.invoke_bless_lambda(
+        bless_config, null_bless_cache, {}, 'TOKEN', 'us-east-1', 'foo', {}) == cert + ' hedged'
+    assert time.time() - start < 0.5
+    assert client.get_kmsauth_token.call_args[0][1]['awsregion'] == 'us-west-2'
+
+
+def test_cached_creds(bless_config, tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    client.save_cached_creds({'AccessKeyId': 'AKIA', 'Expiration': expiration}, bless_config)
+    cache_dir = tmpdir.join('.aws-mfa', 'session')
+    assert cache_dir.listdir() == [cache_dir.join('token_cache.json')]
+    assert client.load_cached_creds(bless_config)['AccessKeyId'] == 'AKIA'
+
+
+def test_load_cached_creds_corrupted(bless_config, tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    tmpdir.join('.aws-mfa', 'session', 'token_cache.json').write('{"AccessKeyId": "AK', ensure=True)
+    assert client.load_cached_creds(bless_config) == {}
+
+
+def test_write_cert(mocker, tmpdir):
+    mocker.patch.object(client, 'ssh_agent_remove_bless')
+    ssh_agent_add = mocker.patch.object(client, 'ssh_agent_add_bless')
+    identity_file = str(tmpdir.join('blessid'))
+    tmpdir.join('blessid-cert.pub').write('old')
+    client.write_cert(identity_file, 'ssh-rsa-cert-v01@openssh.com AAAA', update_sshagent=False)
+    assert tmpdir.join('blessid-cert.pub').read() == 'ssh-rsa-cert-v01@openssh.com AAAA'
+    assert tmpdir.listdir() == [tmpdir.join('blessid-cert.pub')]
+    ssh_agent_add.assert_not_called()
+
+
+def test_bless_batch(mocker, bless_config, null_bless_cache):
+    mocker.patch.object(client, 'get_user_ip')
+    mocker.patch.object(client, 'get_env_creds')
+    bless_config.get_client_config()['use_env_creds'] = True
+    get_cert_inputs = mocker.patch.object(client, 'get_cert_inputs', return_value={
+        'my_ip': '1.2.3.4', 'username': 'user', 'kmsauth_token': 'TOKEN', 'role_creds': {'AccessKeyId': 'AKIA'},
+        'ip_list': (None, '1.2.3.4')})
+    mocker.patch.object(client, 'check_fresh_cert', side_effect=lambda cert_file, *args: cert_file == 'fresh-cert.pub')
+
+    def issue_cert_once(*args):
+        if args[7] == 'broken':
+            raise client.LambdaInvocationException('failed')
+        return True
+
+    issue = mocker.patch.object(client, 'issue_cert_once', side_effect=issue_cert_once)
+    result = client.bless_batch('us-east-1', False, None, bless_config, ['a.pub', 'fresh', 'b', 'broken'],
+                                aws=object(), bless_cache=null_bless_cache)
+    assert result['username'] == 'user'
+    assert list(result['errors']) == ['broken']
+    get_cert_inputs.assert_called_once()
+    assert sorted(c[0][7] for c in issue.call_args_list) == ['a', 'b', 'broken']
+    assert all(c[0][3] == 'TOKEN' for c in issue.call_args_list)
+
+
+def test_get_cert_batch_failover(mocker, bless_config):
+    bless_config.get('BLESS_CONFIG')['ca_backend'] = 'bless'
+    mocker.patch.object(client, 'BlessAWS')
+    bad_input = Exception('bad input')
+
+    def bless_batch(region, nocache, hostname, bless_config, identity_files, *args, **kwargs):
+        if region == 'us-east-1':
+            return {'username': 'user', 'errors': {'b': client.LambdaInvocationException('failed'), 'c': bad_input}}
+        return {'username': 'user', 'errors': {}}
+
+    batch = mocker.patch.object(client, 'bless_batch', side_effect=bless_batch)
+    result = client.get_cert_batch('us-east-1', False, None, bless_config, ['a', 'b', 'c'])
+    assert result['errors'] == {'c': bad_input}
+    assert [c[0][4] for c in batch.call_args_list] == [['a', 'b', 'c'], ['b']]
+
+
+@pytest.mark.parametrize('argv', [
+    ['--proxy', 'host.example.com:22', '--prewarm'],
+    ['--proxy', 'host.example.com:22', '--batch', '/tmp/blessid', 'host.example.com'],
+])
+def test_main_proxy_invalid(mocker, argv):
+    mocker.patch('sys.argv', ['blessclient'] + argv)
+    connection = mocker.patch.object(client.proxy, 'Connection')
+    take_stdio = mocker.patch.object(client.proxy, 'take_stdio')
+    with pytest.raises(SystemExit) as excinfo:
+        client.main()
+    assert excinfo.value.code == 2
+    connection.assert_not_called()
+    take_stdio.assert_not_called()
+
+
+def test_main_proxy(mocker, bless_config):
+    bless_config.get('BLESS_CONFIG')['ca_backend'] = 'bless'
+    mocker.patch.dict(os.environ, {'AWS_PROFILE': 'default'})
+    request_cert = mocker.patch.object(client, 'request_cert', return_value={'username': 'user'})
+    relay = mocker.patch.object(client.proxy, 'relay')
+    connection = mocker.MagicMock()
+    args = mocker.MagicMock(host=['host.example.com'], proxy='host.example.com:22', region=None, nocache=False)
+
+    assert client.main_proxy(args, bless_config, connection, (3, 4)) == 0
+    # The cert is fetched with the gui, since stdin is ssh's connection
+    assert request_cert.call_args[0][2:4] == (True, 'host.example.com')
+    relay.assert_called_once_with(connection.wait.return_value, 3, 4)
+
+    # ssh is still connected without a cert
+    request_cert.side_effect = SystemExit(1)
+    assert client.main_proxy(args, bless_config, connection, (3, 4)) == 0
+    assert relay.call_count == 2
+
+    connection.wait.side_effect = OSError('Connection refused')
+    assert client.main_proxy(args, bless_config, connection, (3, 4)) == 1
+    assert relay.call_count == 2
@@ -0,0 +1,57 @@
+import os
+import pytest
+from blessclient import config_snapshot
+
+
+CONFIG = {
+    'REGION_ALIAS': {'SFO': 'us-west-2', 'IAD': 'us-east-1'},
+    'CLIENT_CONFIG': {'domain_regex': '(.*\\.example\\.com)$'},
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    config_snapshot._snapshots.clear()
+
+
+@pytest.fixture
+def config_file(tmpdir):
+    cfg = tmpdir.join('blessclient.cfg')
+    cfg.write('[MAIN]\n')
+    return str(cfg)
+
+
+def test_save_and_load_snapshot(tmpdir, config_file):
+    snapshot_path = str(tmpdir.join('snapshots', 'config_snapshot.json'))
+    saved = config_snapshot.save_snapshot(config_file, CONFIG, snapshot_path)
+    assert saved['aws_regions'] == ['us-east-1', 'us-west-2']
+    assert saved['region_aliases'] == ['IAD', 'SFO']
+    assert os.path.isfile(snapshot_path)
+
+    config_snapshot._snapshots.clear()
+    loaded = config_snapshot.load_snapshot(config_file, snapshot_path)
+    assert loaded['config'] == CONFIG
+
+
+def test_load_snapshot_missing(tmpdir, config_file):
+    assert config_snapshot.load_snapshot(config_file, str(tmpdir.join('nosnapshot.json'))) is None
+
+
+def test_load_snapshot_missing_config_file(tmpdir):
+    with pytest.raises(OSError):
+        config_snapshot.load_snapshot(str(tmpdir.join('missing.cfg')), str(tmpdir.join('nosnapshot.json')))
+
+
+def test_load_snapshot_invalidated_by_change(tmpdir, config_file):
+    snapshot_path = str(tmpdir.join('config_snapshot.json'))
+    config_snapshot.save_snapshot(config_file, CONFIG, snapshot_path)
+    tmpdir.join('blessclient.cfg').write('[MAIN]\nregion_aliases: IAD\n')
+    assert config_snapshot.load_snapshot(config_file, snapshot_path) is None
+
+
+def test_load_snapshot_is_a_copy(tmpdir, config_file):
+    snapshot_path = str(tmpdir.join('config_snapshot.json'))
+    config_snapshot.save_snapshot(config_file, CONFIG, snapshot_path)
+    loaded = config_snapshot.load_snapshot(config_file, snapshot_path)
+    loaded['config']['REGION_ALIAS']['FOO'] = 'foo-1'
+    assert 'FOO' not in config_snapshot.load_snapshot(config_file, snapshot_path)['config']['REGION_ALIAS']
@@ -0,0 +1,206 @@
+import datetime
+import os
+import time
+import pytest
+from blessclient import config_snapshot, fastpath
+
+
+TEST_CONFIG = """
+[MAIN]
+region_aliases: IAD
+bastion_ips: 10.0.0.0/8
+
+[CLIENT]
+domain_regex: (.*\\.example\\.com)$
+cache_dir: .bless/session
+cache_file: bless_cache.json
+
+[LAMBDA]
+certlifetime: 1800
+ipcachelifetime: 120
+"""
+
+
+@pytest.fixture
+def config():
+    return {
+        'domain_regex': '(.*\\.example\\.com)$',
+        'cache_dir': '.bless/session',
+        'cache_file': 'bless_cache.json',
+        'certlifetime': 1800,
+        'ipcachelifetime': 120,
+        'bastion_ips': '10.0.0.0/8',
+        'ca_backend': 'bless',
+        'housekeeper': False,
+    }
+
+
+@pytest.fixture
+def cert_file(tmpdir):
+    cert = tmpdir.join('blessid-cert.pub')
+    cert.write('ssh-rsa-cert-v01@openssh.com AAAA')
+    return str(cert)
+
+
+def fresh_cache():
+    return {
+        'lastip': '1.2.3.4',
+        '__expires__': {'lastip': time.time() + 120},
+        'certip': '1.2.3.4',
+        'bastion_ips': '1.2.3.4,10.0.0.0/8',
+    }
+
+
+def test_load_fastpath_config(tmpdir, config):
+    tmpdir.join('blessclient.cfg').write(TEST_CONFIG)
+    assert fastpath.load_fastpath_config(str(tmpdir.join('blessclient.cfg'))) == config
+
+
+def test_load_fastpath_config_from_snapshot(tmpdir, monkeypatch, config):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    tmpdir.join('blessclient.cfg').write(TEST_CONFIG)
+    config_snapshot.save_snapshot(str(tmpdir.join('blessclient.cfg')), {
+        'REGION_ALIAS': {'IAD': 'us-east-1'},
+        'CLIENT_CONFIG': {'domain_regex': '(.*\\.example\\.com)$', 'cache_dir': '.bless/session',
+                          'cache_file': 'bless_cache.json'},
+        'BLESS_CONFIG': {'certlifetime': 1800, 'ipcachelifetime': 120, 'ca_backend': 'bless'},
+        'AWS_CONFIG': {'bastion_ips': '10.0.0.0/8'},
+        'KMSAUTH_CONFIG_IAD': {},
+    })
+    assert fastpath.load_fastpath_config(str(tmpdir.join('blessclient.cfg'))) == config
+
+
+def test_load_fastpath_config_missing(tmpdir):
+    assert fastpath.load_fastpath_config(str(tmpdir.join('missing.cfg'))) is None
+
+
+def test_get_identity_file(mocker):
+    mocker.patch.dict(os.environ, {'BLESS_IDENTITYFILE': ''})
+    mocker.patch.object(fastpath, 'get_parent_cmdline').return_value = ['ssh', '-i', '/tmp/foo.pub', 'host']
+    assert fastpath.get_identity_file('/tmp/blessid') == '/tmp/foo'
+    fastpath.get_parent_cmdline.return_value = None
+    assert fastpath.get_identity_file('/tmp/blessid') is None
+    os.environ['BLESS_IDENTITYFILE'] = '/tmp/bar'
+    assert fastpath.get_identity_file('/tmp/blessid') == '/tmp/bar'
+
+
+def test_is_cert_fresh(config, cert_file):
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, fresh_cache()) is True
+
+
+def test_is_cert_fresh_missing_cert(tmpdir, config):
+    assert fastpath.is_cert_fresh('host.example.com', str(tmpdir.join('nocert')), config, fresh_cache()) is False
+
+
+def test_is_cert_fresh_expired(config, cert_file):
+    old = time.time() - 1800
+    os.utime(cert_file, (old, old))
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, fresh_cache()) is False
+
+
+def test_is_cert_fresh_ip_changed(config, cert_file):
+    cache = fresh_cache()
+    cache['bastion_ips'] = '5.6.7.8,10.0.0.0/8'
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, cache) is False
+
+
+def test_is_cert_fresh_ip_expired(config, cert_file):
+    old = time.time() - 600
+    os.utime(cert_file, (old, old))
+    cache = fresh_cache()
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, cache) is True
+    cache['__expires__']['lastip'] = time.time() - 1
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, cache) is False
+
+
+def test_is_cert_fresh_housekeeper(config, cert_file):
+    config['housekeeper'] = True
+    cache = fresh_cache()
+    cache['bastion_ips'] = '1.2.3.4,10.1.1.1'
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, cache) is False
+    cache['remote_host'] = 'host.example.com'
+    assert fastpath.is_cert_fresh('host.example.com', cert_file, config, cache) is True
+
+
+def vault_cache(remaining, **kwargs):
+    vault_creds = {'token': 'test-token', 'expiration': '20300101T000000Z', 'renewable': True,
+                   'lease_duration': 3600, 'max_expiration': None}
+    vault_creds.update(kwargs)
+    return {'vault_creds': vault_creds, '__expires__': {'vault_creds': time.time() + remaining}}
+
+
+def test_vault_token_renewal_due():
+    assert fastpath.vault_token_renewal_due({}) is False
+    assert fastpath.vault_token_renewal_due(vault_cache(3000)) is False
+    assert fastpath.vault_token_renewal_due(vault_cache(1000)) is True
+    assert fastpath.vault_token_renewal_due(vault_cache(1000, renewable=False)) is False
+    assert fastpath.vault_token_renewal_due(vault_cache(1000, max_expiration='20300101T000000Z')) is False
+    assert fastpath.vault_token_renewal_due(vault_cache(-10)) is False
+
+
+def test_update_due():
+    assert fastpath.update_due({}) is False
+    assert fastpath.update_due({'last_updated': datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}) is False
+    assert fastpath.update_due({'last_updated': '20160101T000000Z'}) is True
+
+
+@pytest.fixture
+def fresh_check(mocker, config):
+    """ fastpath.check finds a fresh cert, with the cache it returns """
+    mocker.patch.dict(os.environ, {'AWS_PROFILE': 'default'})
+    mocker.patch.object(fastpath, 'load_fastpath_config', return_value=config)
+    mocker.patch.object(fastpath, 'get_identity_file', return_value='/tmp/blessid')
+    mocker.patch.object(fastpath, 'is_cert_fresh', return_value=True)
+    cache = {}
+    mocker.patch.object(fastpath, 'load_cache', return_value=cache)
+    return cache
+
+
+def check_args(mocker):
+    return mocker.MagicMock(host=['host.example.com'], config='/tmp/blessclient.cfg',
+                            download_config=False, nocache=False)
+
+
+def test_check_vault_renews_token(mocker, config, fresh_check):
+    config['ca_backend'] = 'hashicorp-vault'
+    renewal = mocker.patch.object(fastpath, 'start_vault_token_renewal')
+    assert fastpath.check(check_args(mocker)) == 0
+    renewal.assert_not_called()
+    fresh_check.update(vault_cache(1000))
+    assert fastpath.check(check_args(mocker)) == 0
+    renewal.assert_called_once_with('/tmp/blessclient.cfg')
+
+
+def test_check_update_due(mocker, fresh_check):
+    assert fastpath.check(check_args(mocker)) == 0
+    # The full client runs the autoupdate
+    fresh_check['last_updated'] = '20160101T000000Z'
+    assert fastpath.check(check_args(mocker)) is None
+
+
+def test_main_fresh(mocker):
+    mocker.patch('sys.argv', ['blessclient-fast', 'host.example.com'])
+    mocker.patch.object(fastpath, 'check').return_value = 0
+    client_main = mocker.patch('blessclient.client.main')
+    with pytest.raises(SystemExit) as excinfo:
+        fastpath.main()
+    assert excinfo.value.code == 0
+    client_main.assert_not_called()
+
+
+def test_main_miss_hands_off(mocker):
+    mocker.patch('sys.argv', ['blessclient-fast', 'host.example.com'])
+    mocker.patch.object(fastpath, 'check').return_value = None
+    client_main = mocker.patch('blessclient.client.main')
+    fastpath.main()
+    client_main.assert_called_once()
+
+
+def test_main_miss_check_only(mocker):
+    mocker.patch('sys.argv', ['blessclient-fast', '--check-only', 'host.example.com'])
+    mocker.patch.object(fastpath, 'check').return_value = None
+    client_main = mocker.patch('blessclient.client.main')
+    with pytest.raises(SystemExit) as excinfo:
+        fastpath.main()
+    assert excinfo.value.code == 1
+    client_main.assert_not_called()
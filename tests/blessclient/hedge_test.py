@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from blessclient import hedge
+from blessclient.bless_cache import BlessCache
+
+
+@pytest.fixture
+def bless_cache():
+    bc = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bc.cache = {}
+    return bc
+
+
+def slow(result, delay):
+    def call():
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return call
+
+
+def test_get_hedge_delay(bless_cache):
+    assert hedge.get_hedge_delay(bless_cache, 'us-east-1', 95) == hedge.DEFAULT_DELAY
+    for latency in range(10, 110, 10):
+        hedge.record_latency(bless_cache, 'us-east-1', latency / 1000.0)
+    assert hedge.get_hedge_delay(bless_cache, 'us-east-1', 95) == 0.1
+    assert hedge.get_hedge_delay(bless_cache, 'us-east-1', 50) == 0.05
+    assert hedge.get_hedge_delay(bless_cache, 'us-west-2', 50) == hedge.DEFAULT_DELAY
+
+
+def test_record_latency(bless_cache):
+    for _ in range(hedge.LATENCY_SAMPLES + 5):
+        hedge.record_latency(bless_cache, 'us-east-1', 0.5)
+    assert bless_cache.get(hedge.LATENCY_KEY)['us-east-1'] == [500.0] * hedge.LATENCY_SAMPLES
+
+
+def test_first_valid_no_hedge():
+    hedged = []
+    calls = [slow('cert', 0), lambda: hedged.append(True)]
+    assert hedge.first_valid(calls, 1, lambda r: r == 'cert') == (0, 'cert')
+    assert hedged == []
+
+
+def test_first_valid_hedged():
+    calls = [slow('late', 1), slow('cert', 0)]
+    start = time.time()
+    assert hedge.first_valid(calls, 0.05, lambda r: r in ('cert', 'late')) == (1, 'cert')
+    assert time.time() - start < 0.5
+
+
+def test_first_valid_failed():
+    # A failed request starts the next one without waiting for the delay
+    calls = [slow(Exception('timeout'), 0), slow('cert', 0)]
+    start = time.time()
+    assert hedge.first_valid(calls, 5, lambda r: r == 'cert') == (1, 'cert')
+    assert time.time() - start < 1
+
+
+def test_first_valid_none_valid():
+    calls = [slow('{"errorType": "ClientError"}', 0), slow(Exception('timeout'), 0)]
+    assert hedge.first_valid(calls, 0, lambda r: r == 'cert') == (0, '{"errorType": "ClientError"}')
+    calls = [slow(ValueError('timeout'), 0), slow('error', 0)]
+    with pytest.raises(ValueError):
+        hedge.first_valid(calls, 0, lambda r: r == 'cert')
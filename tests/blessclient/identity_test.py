@@ -0,0 +1,53 @@
+import os
+import pytest
+from blessclient import identity
+
+
+@pytest.fixture(autouse=True)
+def clear_cmdlines(mocker):
+    mocker.patch.dict(identity._cmdlines, clear=True)
+    mocker.patch.dict(os.environ, {'BLESS_IDENTITYFILE': ''})
+
+
+def test_read_proc_cmdline(tmpdir):
+    if not os.path.isdir('/proc/self'):
+        pytest.skip('no /proc')
+    cmdline = identity.read_proc_cmdline(os.getpid())
+    assert 'pytest' in ' '.join(cmdline)
+    assert identity.read_proc_cmdline(-1) is None
+
+
+def test_get_parent_cmdline_cached(mocker):
+    procmock = mocker.patch.object(identity, 'read_proc_cmdline')
+    procmock.return_value = ['ssh', '-i', '/tmp/foo', 'host']
+    psutilmock = mocker.patch.object(identity, 'read_psutil_cmdline')
+    assert identity.get_parent_cmdline() == ['ssh', '-i', '/tmp/foo', 'host']
+    assert identity.get_parent_cmdline() == ['ssh', '-i', '/tmp/foo', 'host']
+    procmock.assert_called_once_with(os.getppid())
+    psutilmock.assert_not_called()
+
+
+def test_get_parent_cmdline_psutil_fallback(mocker):
+    mocker.patch.object(identity, 'read_proc_cmdline').return_value = None
+    psutilmock = mocker.patch.object(identity, 'read_psutil_cmdline')
+    psutilmock.return_value = ['ssh', 'host']
+    assert identity.get_parent_cmdline(use_psutil=False) is None
+    psutilmock.assert_not_called()
+    assert identity.get_parent_cmdline() == ['ssh', 'host']
+    psutilmock.assert_called_once_with(os.getppid())
+
+
+def test_get_idfile_from_cmdline():
+    assert identity.get_idfile_from_cmdline(['ssh', 'host'], '/tmp/blessid') == '/tmp/blessid'
+    assert identity.get_idfile_from_cmdline(['ssh', '-i', '/tmp/foo', 'host'], '/tmp/blessid') == '/tmp/foo'
+    assert identity.get_idfile_from_cmdline(['ssh', '-i', '/tmp/foo.pub', 'host'], '/tmp/blessid') == '/tmp/foo'
+    assert identity.get_idfile_from_cmdline(['ssh', '-i'], '/tmp/blessid') == '/tmp/blessid'
+    os.environ['BLESS_IDENTITYFILE'] = '/tmp/bar'
+    assert identity.get_idfile_from_cmdline(['ssh', '-i', '/tmp/foo', 'host'], '/tmp/blessid') == '/tmp/bar'
+
+
+def test_get_identity_file(mocker):
+    mocker.patch.object(identity, 'get_parent_cmdline').return_value = None
+    assert identity.get_identity_file('/tmp/blessid') == '/tmp/blessid'
+    identity.get_parent_cmdline.return_value = ['ssh', '-i', '/tmp/foo', 'host']
+    assert identity.get_identity_file('/tmp/blessid') == '/tmp/foo'
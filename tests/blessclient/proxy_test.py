@@ -0,0 +1,59 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from blessclient import proxy
+
+
+def test_parse_address():
+    assert proxy.parse_address('host') == ('host', 22)
+    assert proxy.parse_address('host:2222') == ('host', 2222)
+    assert proxy.parse_address('[::1]:2222') == ('::1', 2222)
+    assert proxy.parse_address('[::1]') == ('::1', 22)
+
+
+def test_connection():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    try:
+        connection = proxy.Connection('127.0.0.1:{}'.format(server.getsockname()[1]))
+        sock = connection.wait()
+        assert sock.getpeername() == server.getsockname()
+        sock.close()
+    finally:
+        server.close()
+
+
+def test_connection_failed():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+    with pytest.raises(OSError):
+        proxy.Connection('127.0.0.1:{}'.format(port)).wait()
+
+
+def test_relay():
+    sock, server = socket.socketpair()
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    # The server's banner arrives before the relay starts
+    server.sendall(b'SSH-2.0-OpenSSH_9.6\r\n')
+
+    def serve():
+        assert server.recv(100) == b'SSH-2.0-OpenSSH_9.6\r\n'
+        server.sendall(b'reply')
+        server.close()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    os.write(stdin_write, b'SSH-2.0-OpenSSH_9.6\r\n')
+    proxy.relay(sock, stdin_read, stdout_write)
+    thread.join()
+    os.close(stdout_write)
+    assert os.read(stdout_read, 100) == b'SSH-2.0-OpenSSH_9.6\r\nreply'
+    for fd in (stdin_read, stdin_write, stdout_read):
+        os.close(fd)
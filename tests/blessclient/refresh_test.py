@@ -0,0 +1,74 @@
+import pytest
+from blessclient.refresh import RefreshScheduler
+
+
+MESSAGE = {
+    'command': 'cert',
+    'config': '/tmp/blessclient.cfg',
+    'identity_file': '/tmp/blessid',
+    'nocache': True,
+    'env': {'AWS_PROFILE': 'default', 'SSH_AUTH_SOCK': '/tmp/agent.sock'},
+}
+
+
+@pytest.fixture
+def daemon(mocker):
+    return mocker.MagicMock()
+
+
+def test_track(daemon):
+    scheduler = RefreshScheduler(daemon, 300, interval=30)
+    scheduler.track(MESSAGE)
+    target = scheduler.targets[('/tmp/blessclient.cfg', '/tmp/blessid')]
+    assert target['message']['nocache'] is False
+    # Renewed certs go to the same agent
+    assert target['message']['env']['SSH_AUTH_SOCK'] == '/tmp/agent.sock'
+    assert target['attempt'] == 0
+
+
+def test_run_due(daemon):
+    daemon.refresh.return_value = True
+    scheduler = RefreshScheduler(daemon, 300, interval=30)
+    scheduler.track(MESSAGE)
+    target = scheduler.targets[('/tmp/blessclient.cfg', '/tmp/blessid')]
+
+    now = target['next_check']
+    scheduler.run_due(now=now - 1)
+    daemon.refresh.assert_not_called()
+    scheduler.run_due(now=now)
+    daemon.refresh.assert_called_once_with(target['message'], 300)
+    assert target['next_check'] == now + 30
+
+
+def test_run_due_backoff(daemon, mocker):
+    daemon.refresh.side_effect = Exception('Lambda failed in all regions')
+    scheduler = RefreshScheduler(daemon, 300, interval=30)
+    scheduler.retry_policy = mocker.MagicMock(side_effect=[15, 30, None])
+    scheduler.track(MESSAGE)
+    key = ('/tmp/blessclient.cfg', '/tmp/blessid')
+    target = scheduler.targets[key]
+
+    now = target['next_check']
+    scheduler.run_due(now=now)
+    assert target['attempt'] == 1
+    assert target['next_check'] == now + 15
+    scheduler.run_due(now=now + 15)
+    assert target['attempt'] == 2
+    assert target['next_check'] == now + 45
+    daemon.refresh.side_effect = None
+    daemon.refresh.return_value = False
+    scheduler.run_due(now=now + 45)
+    assert key not in scheduler.targets
+
+
+def test_run_due_retracked(daemon):
+    scheduler = RefreshScheduler(daemon, 300, interval=30)
+    scheduler.track(MESSAGE)
+
+    def refresh(message, refresh_margin):
+        scheduler.track(MESSAGE)
+        return False
+
+    daemon.refresh.side_effect = refresh
+    scheduler.run_due(now=scheduler.targets[('/tmp/blessclient.cfg', '/tmp/blessid')]['next_check'])
+    assert scheduler.targets[('/tmp/blessclient.cfg', '/tmp/blessid')]['attempt'] == 0
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from blessclient import aio
+from blessclient.bless_config import BlessConfig
+from blessclient.lambda_invocation_exception import LambdaInvocationException
+from blessclient.session import BlessSession
+
+
+@pytest.fixture
+def bless_config(tmpdir):
+    bc = BlessConfig()
+    bc.set_config({
+        'BLESS_CONFIG': {'ca_backend': 'bless'},
+        'CLIENT_CONFIG': {'cache_dir': str(tmpdir), 'cache_file': 'bless_cache.json'},
+    })
+    return bc
+
+
+def test_ensure_cert(mocker, bless_config):
+    get_cert = mocker.patch.object(aio, 'get_cert', return_value={'username': 'user'})
+    session = BlessSession(bless_config, '/tmp/blessclient.cfg', 'us-east-1')
+    assert session.ensure_cert('host.example.com', '/tmp/blessid') == {'username': 'user'}
+    assert session.ensure_cert('other.example.com', '/tmp/blessid') == {'username': 'user'}
+    first, second = get_cert.call_args_list
+    assert first[0][:2] == ('us-east-1', 'host.example.com')
+    assert first[0][4] == '/tmp/blessid'
+    # The AWS clients, cache and threads are shared by the calls
+    assert first[0][5:7] == second[0][5:7] == (session.aws, session.bless_cache)
+    assert first[0][-1] is session.executor
+    session.close()
+
+
+def test_ensure_cert_failed(mocker, bless_config):
+    mocker.patch.object(aio, 'get_cert', return_value=None)
+    with BlessSession(bless_config) as session:
+        with pytest.raises(LambdaInvocationException):
+            session.ensure_cert('host.example.com')
+
+
+def test_ensure_cert_threads(mocker, bless_config):
+    barrier = threading.Barrier(3, timeout=5)
+
+    async def get_cert(*args):
+        barrier.wait()
+        return {'username': 'user'}
+
+    mocker.patch.object(aio, 'get_cert', get_cert)
+    results = []
+    with BlessSession(bless_config) as session:
+        # Deadlocks (and times out) unless the three threads get their certs at the same time
+        threads = [threading.Thread(target=lambda: results.append(session.ensure_cert('host')))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert results == [{'username': 'user'}] * 3
+
+
+def test_closed(mocker, bless_config):
+    session = BlessSession(bless_config)
+    session.close()
+    with pytest.raises(ValueError):
+        session.ensure_cert('host.example.com')
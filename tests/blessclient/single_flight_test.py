@@ -0,0 +1,44 @@
+import threading
+import time
+
+from blessclient import single_flight
+
+
+def test_lock(tmpdir):
+    lock_dir = str(tmpdir.join('locks'))
+    with single_flight.lock(lock_dir, 'blessid1.2.3.4') as waited:
+        assert waited is False
+    assert tmpdir.join('locks').listdir()[0].basename.startswith('issue-')
+
+
+def test_lock_waits(tmpdir):
+    lock_dir = str(tmpdir)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with single_flight.lock(lock_dir, 'blessid1.2.3.4'):
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+    # A different key isn't held up
+    with single_flight.lock(lock_dir, 'blessid5.6.7.8') as waited:
+        assert waited is False
+    threading.Timer(0.1, release.set).start()
+    start = time.time()
+    with single_flight.lock(lock_dir, 'blessid1.2.3.4') as waited:
+        assert waited is True
+        assert time.time() - start >= 0.05
+    thread.join()
+
+
+def test_lock_timeout(tmpdir):
+    lock_dir = str(tmpdir)
+    with single_flight.lock(lock_dir, 'blessid'):
+        start = time.time()
+        with single_flight.lock(lock_dir, 'blessid', timeout=0.1) as waited:
+            assert waited is True
+        assert time.time() - start < 1
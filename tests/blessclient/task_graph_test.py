@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from blessclient.task_graph import TaskGraph
+
+
+def test_run():
+    graph = TaskGraph()
+    graph.add('a', lambda: 1)
+    graph.add('b', lambda: 2)
+    graph.add('sum', lambda a, b: a + b, ['a', 'b'])
+    graph.add('double', lambda total: total * 2, ['sum'])
+    assert graph.run() == {'a': 1, 'b': 2, 'sum': 3, 'double': 6}
+
+
+def test_run_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    graph = TaskGraph()
+    # Deadlocks (and times out) unless both tasks run at the same time
+    graph.add('a', lambda: barrier.wait() is not None)
+    graph.add('b', lambda: barrier.wait() is not None)
+    graph.add('c', lambda a, b: a and b, ['a', 'b'])
+    assert graph.run()['c'] is True
+
+
+def test_run_waits_for_deps():
+    done = []
+
+    def slow():
+        time.sleep(0.05)
+        done.append('slow')
+        return 'slow'
+
+    graph = TaskGraph()
+    graph.add('slow', slow)
+    graph.add('after', lambda slow: list(done), ['slow'])
+    assert graph.run()['after'] == ['slow']
+
+
+def test_run_failure():
+    ran = []
+
+    def fail():
+        raise ValueError('failed')
+
+    graph = TaskGraph()
+    graph.add('ok', lambda: ran.append('ok'))
+    graph.add('fail', fail)
+    graph.add('dependent', lambda fail: ran.append('dependent'), ['fail'])
+    with pytest.raises(ValueError):
+        graph.run()
+    assert ran == ['ok']
+
+
+def test_add_unknown_dep():
+    graph = TaskGraph()
+    with pytest.raises(ValueError):
+        graph.add('a', lambda b: b, ['b'])
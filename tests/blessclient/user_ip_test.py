@@ -1,10 +1,13 @@
+import socket
+import threading
 import time
 import pytest
-from blessclient.user_ip import UserIP
+from blessclient.user_ip import Lookup, UserIP
 from blessclient.bless_cache import BlessCache
 
 IP_URLS = ['http://checkip.amazonaws.com', 'http://api.ipify.org']
 
+
 def test_getIP_fresh():
     user_ip = UserIP(None, 10, IP_URLS)
     user_ip.fresh = True
@@ -20,8 +23,7 @@ def test_fixed_ip():
 def test_getIP_cached():
     bc = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
     bc.cache = {}
-    bc.set('lastip', '1.1.1.1')
-    bc.set('lastipchecktime', time.time())
+    bc.set('lastip', '1.1.1.1', 10)
     user_ip = UserIP(bc, 10, IP_URLS)
     assert user_ip.getIP() == '1.1.1.1'
 
@@ -48,3 +50,166 @@ def test_getIP_fetched_fail(mocker):
     with pytest.raises(Exception):
         user_ip.getIP()
     user_ip._fetchIP.assert_called()
+
+
+@pytest.fixture
+def ip_cache(mocker):
+    bc = BlessCache(None, None, BlessCache.CACHEMODE_ENABLED)
+    bc.cache = {}
+    mocker.patch.object(bc, 'save')
+    return bc
+
+
+def fake_fetch(answers):
+    """ A _fetchIP that answers with answers[url] = (ip, delay) """
+    def fetch(url, lookup=None):
+        ip, delay = answers[url]
+        if lookup is not None and lookup.cancelled.wait(delay):
+            return None
+        return ip
+    return fetch
+
+
+def test_getIP_first(mocker, ip_cache):
+    urls = ['http://slow', 'http://fast', 'http://broken']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_FIRST, timeout=0.5)
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://slow': ('2.2.2.2', 0.3),
+        'http://fast': ('1.1.1.1', 0),
+        'http://broken': (None, 0),
+    }))
+    start = time.time()
+    assert user_ip.getIP() == '1.1.1.1'
+    assert time.time() - start < 0.3
+    assert user_ip._fetchIP.call_count == 3
+    stats = ip_cache.get(UserIP.STATS_KEY)
+    assert stats['http://fast']['failures'] == 0
+    assert 'http://slow' not in stats
+
+
+def test_getIP_first_hung(mocker, ip_cache):
+    urls = ['http://hung', 'http://broken']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_FIRST, timeout=0.1)
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://hung': ('2.2.2.2', 5),
+        'http://broken': (None, 0),
+    }))
+    start = time.time()
+    with pytest.raises(Exception):
+        user_ip.getIP()
+    assert time.time() - start < 1
+    stats = ip_cache.get(UserIP.STATS_KEY)
+    assert stats['http://hung']['failures'] == 1
+    assert stats['http://broken']['failures'] == 1
+
+
+def test_getIP_first_empty_answer(mocker, ip_cache):
+    urls = ['http://empty', 'http://slow']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_FIRST, timeout=0.5)
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://empty': ('', 0),
+        'http://slow': ('1.1.1.1', 0.1),
+    }))
+    assert user_ip.getIP() == '1.1.1.1'
+
+
+def test_getIP_first_cancels_the_rest(mocker, ip_cache):
+    urls = ['http://fast', 'http://slow']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_FIRST, timeout=5)
+    lookups = []
+
+    def fetch(url, lookup):
+        lookups.append(lookup)
+        if url == 'http://fast':
+            return '1.1.1.1'
+        return None if lookup.cancelled.wait(5) else '2.2.2.2'
+
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fetch)
+    assert user_ip.getIP() == '1.1.1.1'
+    assert all(lookup.cancelled.is_set() for lookup in lookups)
+
+
+def test_lookup_get():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def answer():
+        connection, _ = server.accept()
+        request = connection.recv(4096)
+        connection.sendall(b'HTTP/1.0 200 OK\r\nContent-Length: 8\r\n\r\n1.2.3.4\n')
+        connection.close()
+        requests.append(request)
+
+    requests = []
+    thread = threading.Thread(target=answer)
+    thread.start()
+    assert Lookup().get('http', '127.0.0.1', server.getsockname()[1], '', {'Host': 'ip.example.com'}, 5) == \
+        (200, '1.2.3.4\n')
+    thread.join(5)
+    assert b'Host: ip.example.com' in requests[0]
+    server.close()
+
+
+def test_lookup_cancel():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    lookup = Lookup()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(lookup.get(
+        'http', '127.0.0.1', server.getsockname()[1], '/', {'Host': 'example.com'}, 10)))
+    thread.start()
+    # The server never answers
+    connection, _ = server.accept()
+    while lookup.connection is None:
+        time.sleep(0.01)
+    start = time.time()
+    lookup.cancel()
+    thread.join(5)
+    assert time.time() - start < 1
+    assert results == [None]
+    connection.close()
+    server.close()
+
+
+def test_getIP_majority(mocker, ip_cache):
+    urls = ['http://a', 'http://b', 'http://c']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_MAJORITY, timeout=0.5)
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://a': ('6.6.6.6', 0),
+        'http://b': ('1.1.1.1', 0.05),
+        'http://c': ('1.1.1.1', 0.1),
+    }))
+    assert user_ip.getIP() == '1.1.1.1'
+
+
+def test_getIP_majority_disagree(mocker, ip_cache):
+    urls = ['http://a', 'http://b']
+    user_ip = UserIP(ip_cache, 10, urls, lookup=UserIP.LOOKUP_MAJORITY, timeout=0.5)
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://a': ('6.6.6.6', 0),
+        'http://b': ('1.1.1.1', 0),
+    }))
+    with pytest.raises(Exception):
+        user_ip.getIP()
+
+
+def test_getIP_sequential_fastest_first(mocker, ip_cache):
+    urls = ['http://failing', 'http://slow', 'http://fast', 'http://new']
+    ip_cache.set(UserIP.STATS_KEY, {
+        'http://failing': {'failures': 2},
+        'http://slow': {'failures': 0, 'latency': 500},
+        'http://fast': {'failures': 0, 'latency': 50},
+    })
+    user_ip = UserIP(ip_cache, 10, urls)
+    assert user_ip._sortURLs(ip_cache.get(UserIP.STATS_KEY)) == [
+        'http://new', 'http://fast', 'http://slow', 'http://failing']
+    mocker.patch.object(user_ip, '_fetchIP', side_effect=fake_fetch({
+        'http://new': (None, 0),
+        'http://fast': ('1.1.1.1', 0),
+    }))
+    assert user_ip.getIP() == '1.1.1.1'
+    stats = ip_cache.get(UserIP.STATS_KEY)
+    assert stats['http://new'] == {'failures': 1}
+    assert stats['http://fast']['latency'] < 50
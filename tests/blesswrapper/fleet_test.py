@@ -0,0 +1,56 @@
+import io
+import threading
+
+from blesswrapper import fleet
+
+
+def test_read_hosts(tmpdir):
+    tmpdir.join('web.hosts').write('web1\n# the db\ndb1  # primary\n\nweb2\n')
+    tmpdir.join('other.hosts').write('web1\nother1\n')
+    hosts = fleet.read_hosts(['a,b', 'web1'], [str(tmpdir.join('*.hosts'))])
+    assert hosts == ['a', 'b', 'web1', 'other1', 'db1', 'web2']
+
+
+def test_parse_host():
+    assert fleet.parse_host('host', 22) == (None, 'host', 22)
+    assert fleet.parse_host('user@host:2222', 22) == ('user', 'host', '2222')
+
+
+def test_run_command_prefix():
+    stream = io.StringIO()
+    result = fleet.run_command('host', ['sh', '-c', 'echo one; echo two >&2; exit 3'], stream=stream)
+    assert stream.getvalue() == 'host: one\nhost: two\n'
+    assert result['returncode'] == 3
+    assert result['output'] is None
+
+
+def test_run_command_collect():
+    stream = io.StringIO()
+    result = fleet.run_command('host', ['sh', '-c', 'echo one'], fleet.OUTPUT_COLLECT, stream=stream)
+    assert stream.getvalue() == ''
+    assert result['output'] == 'one\n'
+    assert result['returncode'] == 0
+
+
+def test_run_command_timeout():
+    result = fleet.run_command('host', ['sleep', '5'], timeout=0.1, stream=io.StringIO())
+    assert result['returncode'] is None
+    assert result['elapsed'] < 5
+
+
+def test_run_all():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run_host(host, write_lock):
+        # Deadlocks (and times out) unless two hosts run at the same time
+        barrier.wait()
+        return {'host': host, 'returncode': 0 if host != 'b' else 1, 'elapsed': 0.5, 'output': host + '\n'}
+
+    stream = io.StringIO()
+    results = fleet.run_all(['a', 'b', 'c', 'd'], run_host, parallel=2, stream=stream)
+    assert [result['host'] for result in results] == ['a', 'b', 'c', 'd']
+    assert '=== b (exit 1 after 0.5s) ===\nb\n' in stream.getvalue()
+
+    summary = io.StringIO()
+    assert fleet.write_summary(results, 'bssh', summary) is False
+    assert summary.getvalue() == 'bssh: 4 hosts, 3 succeeded, 1 failed\n  b: exit 1 after 0.5s\n'
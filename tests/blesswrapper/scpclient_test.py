@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from blesswrapper import scpclient
+
+
+def test_get_direction():
+    assert scpclient.get_direction(['a.tar.gz', 'b.tar.gz', ':/tmp/']) == 'push'
+    assert scpclient.get_direction([':/var/log/app.log', 'logs']) == 'pull'
+    assert scpclient.get_direction([':/a', 'b', 'c']) is None
+    assert scpclient.get_direction(['a', 'b']) is None
+
+
+def test_get_scp_argv():
+    assert scpclient.get_scp_argv(['-r'], ['a.tar.gz', ':/tmp/'], 'user', 'host', 2222) == [
+        'scp', '-r', '-P', '2222', 'a.tar.gz', 'user@host:/tmp/']
+    assert scpclient.get_scp_argv([], [':/var/log/app.log', 'logs'], None, 'host', 22, 'logs/host') == [
+        'scp', '-P', '22', 'host:/var/log/app.log', 'logs/host']
+
+
+def test_run_with_retries():
+    results = iter([1, 255, 0, 0])
+    result = scpclient.run_with_retries(lambda: {'returncode': next(results)}, 2, delay=0)
+    assert result['returncode'] == 0
+    assert result['attempts'] == 3
+
+    result = scpclient.run_with_retries(lambda: {'returncode': 1}, 1, delay=0)
+    assert result['returncode'] == 1
+    assert result['attempts'] == 2
+
+
+def test_main_pull(mocker, tmpdir):
+    mocker.patch.dict(os.environ, {'AWS_PROFILE': 'default'})
+    mocker.patch.object(scpclient, 'load_config', return_value=True)
+    mocker.patch.object(scpclient, 'get_bless_cache')
+    mocker.patch.object(scpclient, 'warn_ssh_version')
+    get_certificate = mocker.patch.object(scpclient, 'get_certificate', return_value={'username': 'iamuser'})
+    run_command = mocker.patch.object(scpclient.fleet, 'run_command', side_effect=lambda host, argv, *args, **kwargs: {
+        'host': host, 'returncode': 0, 'elapsed': 0.1, 'output': None})
+    mocker.patch.object(scpclient.sys, 'argv', [
+        'bscp', '--hosts', 'a,b:2222', '--parallel', '1', ':/var/log/app.log', str(tmpdir)])
+
+    with pytest.raises(SystemExit) as e:
+        scpclient.main()
+    assert e.value.code == 0
+    get_certificate.assert_called_once()
+    assert get_certificate.call_args[0][2] == ['a', 'b']
+    assert [c[0][1] for c in run_command.call_args_list] == [
+        ['scp', '-o', 'BatchMode=yes', '-P', '22', 'iamuser@a:/var/log/app.log', str(tmpdir.join('a'))],
+        ['scp', '-o', 'BatchMode=yes', '-P', '2222', 'iamuser@b:/var/log/app.log', str(tmpdir.join('b'))],
+    ]
+    assert tmpdir.join('a').isdir()
@@ -0,0 +1,55 @@
+import os
+import stat
+
+import pytest
+
+from blessclient.bless_cache import BlessCache
+from blesswrapper import sshclient
+
+
+def write_ssh(bindir, version, mtime):
+    ssh = bindir.join('ssh')
+    ssh.write('#!/bin/sh\necho "{}, OpenSSL 3.0.13" >&2\n'.format(version))
+    ssh.chmod(stat.S_IRWXU)
+    os.utime(str(ssh), (mtime, mtime))
+    return ssh
+
+
+def test_get_ssh_version(mocker, tmpdir):
+    bindir = tmpdir.mkdir('bin')
+    ssh = write_ssh(bindir, 'OpenSSH_7.8p1', 1500000000)
+    mocker.patch.dict(os.environ, {'PATH': str(bindir)})
+    bless_cache = BlessCache(str(tmpdir), 'bless_cache.json', BlessCache.CACHEMODE_ENABLED)
+    check_output = mocker.spy(sshclient.subprocess, 'check_output')
+
+    assert sshclient.get_ssh_version(bless_cache) == 'OpenSSH_7.8p1'
+    assert bless_cache.get('ssh_version') == {'path': str(ssh), 'mtime': 1500000000, 'version': 'OpenSSH_7.8p1'}
+    assert sshclient.get_ssh_version(bless_cache) == 'OpenSSH_7.8p1'
+    assert check_output.call_count == 1
+
+    write_ssh(bindir, 'OpenSSH_9.6p1', 1600000000)
+    assert sshclient.get_ssh_version(bless_cache) == 'OpenSSH_9.6p1'
+    assert check_output.call_count == 2
+
+
+def test_main_fleet(mocker):
+    mocker.patch.dict(os.environ, {'AWS_PROFILE': 'default'})
+    mocker.patch.object(sshclient, 'load_config', return_value=True)
+    mocker.patch.object(sshclient, 'warn_ssh_version')
+    mocker.patch.object(sshclient, 'get_bless_cache')
+    mocker.patch.object(sshclient, 'get_region_from_code', return_value='us-east-1')
+    request_cert = mocker.patch.object(sshclient, 'request_cert', return_value={'username': 'iamuser'})
+    run_command = mocker.patch.object(sshclient.fleet, 'run_command', side_effect=lambda host, argv, *args, **kwargs: {
+        'host': host, 'returncode': 0, 'elapsed': 0.1, 'output': None})
+    mocker.patch.object(sshclient.sys, 'argv', ['bssh', '--hosts', 'a,root@b:2222', '--parallel', '1', 'uptime'])
+
+    with pytest.raises(SystemExit) as e:
+        sshclient.main()
+    assert e.value.code == 0
+    request_cert.assert_called_once()
+    assert request_cert.call_args[0][3] == ['a', 'b']
+    argvs = [c[0][1] for c in run_command.call_args_list]
+    assert argvs == [
+        ['ssh', 'a', '-A', '-p', '22', '-o', 'BatchMode=yes', '-l', 'iamuser', 'uptime'],
+        ['ssh', 'b', '-A', '-p', '2222', '-o', 'BatchMode=yes', '-l', 'iamuser', 'uptime'],
+    ]